@@ -0,0 +1,413 @@
+"""Performance benchmarks run against the local fake Spotify API.
+
+Usage: python benchmarks.py [benchmark ...]
+
+With no arguments every benchmark runs. Nothing here talks to the real
+Spotify API.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from textual.app import App
+from textual.widgets import DataTable
+
+from fake_spotify_api import Fake_Spotify_API
+from library_store import Library_Store
+from spotify_client import Spotify_Client
+from spotify_main_class import Spotify_Playback_Data, PLAYLIST_PAGE_LIMIT
+from track_table import Track_Table, Column
+from track_file import Mapped_Track_List, read_track_list
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MiB (Linux)."""
+    with open("/proc/self/statm") as statm:
+        pages = int(statm.read().split()[1])
+    return pages * 4096 / 2**20
+
+
+def synthetic_tracks(count: int) -> list[dict]:
+    """Tracks with field lengths typical of the Web API (ids are 22 characters)."""
+    return [
+        {
+            "name": f"Track Title {i} (Remastered {1960 + i % 60})",
+            "artists": [f"Artist Name {i % 500}", f"Featured Artist {i % 37}"],
+            "album": f"Album Title {i % 2000} (Deluxe Edition)",
+            "duration_ms": 180000 + (i % 120) * 1000,
+            "is_liked": i % 3 == 0,
+            "id": f"4uLU6hMCjMI75M1A{i:06d}",
+        }
+        for i in range(count)
+    ]
+
+
+def ms_to_time(ms: int) -> str:
+    seconds, ms = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{minutes}:{seconds:02d}"
+
+
+def bench_columns() -> list[Column]:
+    """The same columns main.track_columns() builds (main can't be imported here)."""
+    return [
+        Column("#", lambda i, track: str(i + 1), numbered=True),
+        Column("Title", lambda i, track: track["name"], flexible=True),
+        Column("Artist", lambda i, track: ", ".join(track["artists"]), flexible=True),
+        Column("Album", lambda i, track: track["album"], flexible=True),
+        Column("Duration", lambda i, track: ms_to_time(track["duration_ms"]), auto_width=True),
+        Column("Liked", lambda i, track: "♥" if track["is_liked"] else "", auto_width=True),
+    ]
+
+
+def bench_pagination(playlist_size=10000, latency=0.05, levels=(1, 2, 4, 8, 16)):
+    """Wall-clock time to page through a large playlist at each concurrency level."""
+    print(f"Pagination: {playlist_size} tracks, {latency * 1000:.0f}ms per request")
+    print(f"{'concurrency':>12} {'seconds':>9} {'tracks/s':>10}")
+    with Fake_Spotify_API(latency=latency, playlist_size=playlist_size) as api, \
+            tempfile.TemporaryDirectory() as directory:
+        # A store of its own, so the user's library is neither read nor migrated.
+        store = Library_Store(os.path.join(directory, "library.sqlite3"))
+        for concurrency in levels:
+            playback = Spotify_Playback_Data(
+                sp=api.client(), page_concurrency=concurrency, store=store
+            )
+            start = time.perf_counter()
+            items = asyncio.run(
+                playback._fetch_all_pages(
+                    "playlist_tracks", "fakeplaylist01", limit=PLAYLIST_PAGE_LIMIT
+                )
+            )
+            elapsed = time.perf_counter() - start
+            playback.close()
+            assert len(items) == playlist_size
+            print(f"{concurrency:>12} {elapsed:>9.2f} {playlist_size / elapsed:>10.0f}")
+
+
+def percentile(timings, fraction: float) -> float:
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+def bench_io(playlist_size=20000, latency=0.02, levels=(1, 4, 8, 16), poll_interval=0.05):
+    """Request rate and tail latency while paginating, and a poll's latency meanwhile."""
+    offsets = range(0, playlist_size, PLAYLIST_PAGE_LIMIT)
+    # High enough that only the executors limit the request rate.
+    unlimited = {"rate": 100000, "burst": 100000}
+    print(f"I/O: {len(offsets)} pages, {latency * 1000:.0f}ms per request, polling every {poll_interval * 1000:.0f}ms")
+    print(
+        f"{'concurrency':>12} {'req/s':>7} {'page p50':>9} {'page p99':>9} "
+        f"{'poll p50':>9} {'poll p99':>9} {'connections':>12}"
+    )
+    with Fake_Spotify_API(latency=latency, playlist_size=playlist_size) as api:
+        for concurrency in levels:
+            client = Spotify_Client(
+                api.client(), page_concurrency=concurrency, rate_limit_settings=unlimited
+            )
+            connections_before = len(api.connections)
+
+            async def run():
+                window = asyncio.Semaphore(concurrency)
+                page_timings, poll_timings = [], []
+
+                async def page(offset):
+                    async with window:
+                        start = time.perf_counter()
+                        await client.call_paged(
+                            "playlist_items", "fakeplaylist01",
+                            limit=PLAYLIST_PAGE_LIMIT, offset=offset,
+                        )
+                        page_timings.append(time.perf_counter() - start)
+
+                async def poll(pages):
+                    while not pages.done():
+                        start = time.perf_counter()
+                        await client.call("current_playback")
+                        poll_timings.append(time.perf_counter() - start)
+                        await asyncio.sleep(poll_interval)
+
+                start = time.perf_counter()
+                pages = asyncio.gather(*(page(offset) for offset in offsets))
+                await asyncio.gather(pages, poll(pages))
+                return time.perf_counter() - start, page_timings, poll_timings
+
+            elapsed, page_timings, poll_timings = asyncio.run(run())
+            client.close()
+            requests_sent = len(page_timings) + len(poll_timings)
+            print(
+                f"{concurrency:>12} {requests_sent / elapsed:>7.0f} "
+                f"{percentile(page_timings, 0.5) * 1000:>7.1f}ms {percentile(page_timings, 0.99) * 1000:>7.1f}ms "
+                f"{percentile(poll_timings, 0.5) * 1000:>7.1f}ms {percentile(poll_timings, 0.99) * 1000:>7.1f}ms "
+                f"{len(api.connections) - connections_before:>12}"
+            )
+
+
+class Table_App(App):
+    def __init__(self, table_type):
+        super().__init__()
+        self.table_type = table_type
+
+    def compose(self):
+        yield self.table_type()
+
+
+async def measure_table(table_type, tracks, scroll_steps=200):
+    app = Table_App(table_type)
+    async with app.run_test(size=(120, 40)) as pilot:
+        table = app.query_one(table_type)
+        table.focus()
+        await pilot.pause()
+        rss_before = rss_mb()
+
+        start = time.perf_counter()
+        if table_type is Track_Table:
+            table.set_columns(bench_columns())
+            table.set_rows(tracks)
+        else:
+            table.cursor_type = "row"
+            table.add_columns("#", "Title", "Artist", "Album", "Duration", "Liked")
+            for i, track in enumerate(tracks):
+                table.add_row(
+                    str(i + 1), track["name"], ", ".join(track["artists"]),
+                    track["album"], ms_to_time(track["duration_ms"]),
+                    "♥" if track["is_liked"] else "",
+                )
+        await pilot.pause()
+        first_paint = time.perf_counter() - start
+        rss_after = rss_mb()
+
+        frames = []
+        for _ in range(scroll_steps):
+            start = time.perf_counter()
+            await pilot.press("pagedown")
+            frames.append(time.perf_counter() - start)
+        frames.sort()
+        return first_paint, frames[len(frames) // 2], frames[int(len(frames) * 0.95)], rss_after - rss_before
+
+
+def bench_track_table(track_count=100000):
+    """Time to first paint, scroll frame time and memory for a huge playlist."""
+    tracks = synthetic_tracks(track_count)
+    print(f"Track table: {track_count} synthetic tracks")
+    print(f"{'widget':>12} {'first paint':>12} {'scroll p50':>11} {'scroll p95':>11} {'RSS delta':>10}")
+    for table_type in (Track_Table, DataTable):
+        first_paint, p50, p95, rss = asyncio.run(measure_table(table_type, tracks))
+        print(
+            f"{table_type.__name__:>12} {first_paint * 1000:>10.0f}ms "
+            f"{p50 * 1000:>9.1f}ms {p95 * 1000:>9.1f}ms {rss:>8.1f}MB"
+        )
+
+
+class Eager_Track_Table(Track_Table):
+    """Lays the columns out on every resize with no cache, as the table used to."""
+
+    def on_resize(self, event) -> None:
+        event.prevent_default()
+        self.layout_stats["resizes"] += 1
+        self.layout_columns()
+
+    def column_widths(self, width: int) -> tuple[int, ...]:
+        return self.compute_column_widths(width)
+
+
+async def measure_resize_storm(table_type, tracks, storms, widths):
+    app = Table_App(table_type)
+    async with app.run_test(size=(widths[0], 40)) as pilot:
+        table = app.query_one(table_type)
+        table.set_columns(bench_columns())
+        table.set_rows(tracks)
+        await pilot.pause()
+        table.layout_stats.update(resizes=0, layouts=0, computed=0, applied=0)
+        start = time.perf_counter()
+        for _ in range(storms):
+            for width in widths:
+                await pilot.resize_terminal(width, 40)
+        # Let the last debounced layout run.
+        await pilot.pause(table.layout_debounce * 2)
+        return time.perf_counter() - start, dict(table.layout_stats)
+
+
+def bench_resize(track_count=100000, storms=5, widths=tuple(range(80, 161, 4))):
+    """Layout passes and repaints while a huge table is dragged through a range of widths."""
+    tracks = synthetic_tracks(track_count)
+    print(f"Resize storm: {track_count} tracks, {storms} sweeps of {len(widths)} widths")
+    print(f"{'widget':>17} {'seconds':>8} {'resizes':>8} {'layouts':>8} {'computed':>9} {'repaints':>9}")
+    for table_type in (Eager_Track_Table, Track_Table):
+        elapsed, stats = asyncio.run(measure_resize_storm(table_type, tracks, storms, widths))
+        print(
+            f"{table_type.__name__:>17} {elapsed:>8.2f} {stats['resizes']:>8} "
+            f"{stats['layouts']:>8} {stats['computed']:>9} {stats['applied']:>9}"
+        )
+
+
+def best_of(function, repeat=5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def sqlite_size(path) -> int:
+    """Bytes on disk for a SQLite database and its WAL."""
+    return sum(
+        os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p)
+    )
+
+
+def bench_cache(track_count=10000, playlist_count=10, batch_size=500):
+    """Load time and disk size of the JSON cache files vs the SQLite library store."""
+    tracks = synthetic_tracks(track_count)
+    # A library of playlists that share tracks, as real libraries do.
+    library = {
+        f"playlist{n}": tracks[n * 500:n * 500 + track_count // 2]
+        for n in range(playlist_count)
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, "big.cache")
+        with open(json_path, "w") as f:
+            json.dump(tracks, f)
+        for playlist_id, playlist in library.items():
+            with open(os.path.join(directory, f"{playlist_id}.cache"), "w") as f:
+                json.dump(playlist, f)
+
+        liked = [{"id": track["id"], "added_at": ""} for track in tracks if track["is_liked"]]
+        single_path = os.path.join(directory, "single.sqlite3")
+        store = Library_Store(single_path)
+        store.add_liked_tracks(liked)
+        store.save_playlist("big", tracks)
+        store.connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        assert store.load_playlist("big") == tracks
+
+        library_path = os.path.join(directory, "library.sqlite3")
+        library_store = Library_Store(library_path)
+        library_store.add_liked_tracks(liked)
+        for playlist_id, playlist in {"big": tracks, **library}.items():
+            library_store.save_playlist(playlist_id, playlist)
+        library_store.connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        def load_json():
+            with open(json_path) as f:
+                return json.load(f)
+
+        json_full = best_of(load_json)
+        # What the app read a .cache file as: Track records, like the store returns.
+        json_tracks = best_of(lambda: read_track_list(json_path))
+        sqlite_full = best_of(lambda: store.load_playlist("big"))
+        sqlite_first = best_of(lambda: store.load_playlist_rows("big", 0, batch_size))
+        json_library = sum(
+            os.path.getsize(os.path.join(directory, f"{playlist_id}.cache"))
+            for playlist_id in ["big", *library]
+        )
+        json_playlist = os.path.getsize(json_path)
+        sqlite_playlist = sqlite_size(single_path)
+        sqlite_library = sqlite_size(library_path)
+
+    print(f"Cache: {track_count}-track playlist, plus {playlist_count} overlapping playlists")
+    print(f"{'':>8} {'first rows':>11} {'full load':>10} {'playlist':>9} {'library':>9}")
+    print(
+        f"{'JSON':>8} {json_full * 1000:>9.1f}ms {json_full * 1000:>8.1f}ms "
+        f"{json_playlist / 2**20:>7.2f}MB {json_library / 2**20:>7.2f}MB"
+    )
+    print(f"{'(Tracks)':>8} {json_tracks * 1000:>9.1f}ms {json_tracks * 1000:>8.1f}ms")
+    print(
+        f"{'SQLite':>8} {sqlite_first * 1000:>9.1f}ms {sqlite_full * 1000:>8.1f}ms "
+        f"{sqlite_playlist / 2**20:>7.2f}MB {sqlite_library / 2**20:>7.2f}MB"
+    )
+
+
+def measure_cold_load(setup, first_rows, full_load):
+    """Time `first_rows(setup())`, its RSS growth, and `full_load(setup())` in a fresh forked process."""
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+
+    def child():
+        state = setup()
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        rows = first_rows(state)
+        first = time.perf_counter() - start
+        rss = rss_mb() - rss_before
+        start = time.perf_counter()
+        rows = full_load(state)
+        sender.send((first, rss, time.perf_counter() - start, len(rows)))
+
+    process = context.Process(target=child)
+    process.start()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def bench_track_file(sizes=(1000, 10000, 100000), visible_rows=40, batch_size=500):
+    """Cold-open time and memory of a cached playlist: JSON cache, SQLite store, mapped track file."""
+    print("Track file: time to the first screen of rows, its RSS growth, and a full load")
+    print(
+        f"{'tracks':>7} {'format':>7} {'first rows':>11} {'RSS':>8} {'full load':>10} {'on disk':>8}"
+    )
+    for size in sizes:
+        tracks = synthetic_tracks(size)
+        with tempfile.TemporaryDirectory() as directory:
+            json_path = os.path.join(directory, "playlist.cache")
+            with open(json_path, "w") as f:
+                json.dump(tracks, f)
+            sqlite_path = os.path.join(directory, "library.sqlite3")
+            store = Library_Store(sqlite_path)
+            # Also writes the track file.
+            store.save_playlist("playlist", tracks)
+            store.connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            track_file_path = store.track_file_path("playlist")
+
+            def load_json(path):
+                with open(path) as f:
+                    return json.load(f)
+
+            formats = [
+                # The old cache has to be parsed in full before any row can be shown.
+                ("JSON", lambda: json_path, load_json, load_json, os.path.getsize(json_path)),
+                (
+                    "SQLite",
+                    lambda: Library_Store(sqlite_path),
+                    lambda store: store.load_playlist_rows("playlist", 0, batch_size),
+                    lambda store: store.load_playlist("playlist"),
+                    sqlite_size(sqlite_path),
+                ),
+                (
+                    "mapped",
+                    lambda: track_file_path,
+                    lambda path: Mapped_Track_List(path)[:visible_rows],
+                    lambda path: list(Mapped_Track_List(path)),
+                    os.path.getsize(track_file_path),
+                ),
+            ]
+            for name, setup, first_rows, full_load, disk_size in formats:
+                first, rss, full, count = measure_cold_load(setup, first_rows, full_load)
+                assert count == size
+                print(
+                    f"{size:>7} {name:>7} {first * 1000:>9.1f}ms {rss:>6.1f}MB "
+                    f"{full * 1000:>8.1f}ms {disk_size / 2**20:>6.2f}MB"
+                )
+
+
+BENCHMARKS = {
+    "pagination": bench_pagination,
+    "io": bench_io,
+    "cache": bench_cache,
+    "track_table": bench_track_table,
+    "resize": bench_resize,
+    "track_file": bench_track_file,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+        print()
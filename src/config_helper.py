@@ -62,6 +62,83 @@ def get_default_keybindings():
         "previous_track": "p",
         "volume_up": "+",
         "volume_down": "-",
+        "toggle_metrics": "f12",
+        "dump_metrics": "f11",
+        "show_details": "i",
+    }
+
+
+def get_default_poll_settings():
+    """Return the default playback polling configuration (seconds)."""
+    return {
+        "policy": "adaptive",
+        "interval": 2,
+        "min_interval": 1,
+        "max_interval": 30,
+        "paused_interval": 15,
+        "idle_interval": 60,
+        "track_end_margin": 0.5,
+    }
+
+
+def get_default_prefetch_settings():
+    """Return the default playlist prefetch configuration.
+
+    `delay` is how long (seconds) a sidebar item must stay highlighted before
+    it is prefetched, `concurrency` the most playlists (and requests)
+    prefetched at once, and `recent_playlists` how many recently opened
+    playlists are warmed at idle after startup (0 turns that off).
+    """
+    return {
+        "enabled": True,
+        "delay": 0.3,
+        "concurrency": 1,
+        "recent_playlists": 3,
+    }
+
+
+def get_default_rate_limit_settings():
+    """Return the default client-side Web API rate limit.
+
+    Requests are spaced to `rate` a second, with bursts of up to `burst`;
+    a request answered with 429 is tried up to `max_attempts` times.
+    """
+    return {
+        "rate": 10,
+        "burst": 20,
+        "max_attempts": 5,
+    }
+
+
+def get_default_control_settings():
+    """Return the default playback control configuration.
+
+    Repeated presses of a control such as volume or skip are sent as one
+    request once none has come for `debounce` seconds.
+    """
+    return {
+        "debounce": 0.25,
+    }
+
+
+def get_default_metrics_settings():
+    """Return the default runtime metrics configuration.
+
+    Metrics are written to `dump_path` (relative to the config directory;
+    a .prom or .txt name gives Prometheus text, anything else JSON) when
+    asked for with the dump key, and also on exit if `dump_at_exit` is set.
+    """
+    return {
+        "dump_at_exit": False,
+        "dump_path": "metrics.json",
+    }
+
+
+def get_default_playlist_cache_settings():
+    """Return the default in-memory playlist cache configuration."""
+    return {
+        "budget_mb": 64,
+        "ttl": 3600,
     }
 
 
@@ -69,6 +146,15 @@ def get_default_settings():
     """Return the default settings configuration."""
     return {
         "volume_step": 5,
+        "page_concurrency": 4,
+        "io_concurrency": 4,
+        "startup_snapshot": True,
+        "polling": get_default_poll_settings(),
+        "playlist_cache": get_default_playlist_cache_settings(),
+        "prefetch": get_default_prefetch_settings(),
+        "rate_limit": get_default_rate_limit_settings(),
+        "controls": get_default_control_settings(),
+        "metrics": get_default_metrics_settings(),
         "keybindings": get_default_keybindings(),
     }
 
@@ -114,6 +200,9 @@ def setup_keybindings():
             "previous_track": "p",
             "volume_up": "+",
             "volume_down": "-",
+            "toggle_metrics": "f12",
+            "dump_metrics": "f11",
+            "show_details": "i",
         }
         save_config("binds.yaml", default_binds)
 
@@ -0,0 +1,58 @@
+import asyncio
+
+
+class Control_Debouncer:
+    """Coalesces a burst of presses of one repeatable control into a single request.
+
+    Each press moves the pending `target` (the caller works out the new one,
+    from the pending target if there is one) and restarts a quiet period of
+    `delay` seconds; when it passes, `send(target, predictions)` is called
+    once for the last target, with the predictions made along the way so a
+    failed request can roll them all back. `send` hands the request off
+    (e.g. to a queue of controls) rather than making it, and `flush()`
+    hands it off early for a control that must reach the server after it.
+
+    `stats` counts `presses` and the `requests` they were coalesced into.
+    """
+
+    def __init__(self, send, delay: float):
+        self.send = send
+        self.delay = delay
+        self.target = None
+        self.predictions = []
+        self.stats = {"presses": 0, "requests": 0}
+        self._waiting = None
+
+    @property
+    def pending(self) -> bool:
+        return self._waiting is not None
+
+    def press(self, target, prediction=None):
+        """Make `target` the value to send, once presses have stopped for `delay`."""
+        self.stats["presses"] += 1
+        self.target = target
+        if prediction is not None:
+            self.predictions.append(prediction)
+        if self._waiting is not None:
+            self._waiting.cancel()
+        self._waiting = asyncio.ensure_future(self._send_later())
+
+    def flush(self):
+        """Send the pending target now, if there is one."""
+        if self._waiting is not None:
+            self._waiting.cancel()
+            self._waiting = None
+        self._send()
+
+    async def _send_later(self):
+        await asyncio.sleep(self.delay)
+        # From here the request goes ahead; later presses start a new one.
+        self._waiting = None
+        self._send()
+
+    def _send(self):
+        target, predictions = self.target, self.predictions
+        self.target, self.predictions = None, []
+        if target is not None:
+            self.stats["requests"] += 1
+            self.send(target, predictions)
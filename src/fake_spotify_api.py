@@ -0,0 +1,316 @@
+"""Local stand-in for the Spotify Web API, used by tests and benchmarks.
+
+Serves a small synthetic library over HTTP on 127.0.0.1 with a configurable
+per-request latency, so spotipy clients can be pointed at it instead of the
+real API.
+"""
+
+import collections
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import spotipy
+
+from spotify_client import spotipy_client
+
+
+def make_track(index: int, prefix: str = "track") -> dict:
+    """Build a synthetic track object shaped like the Web API's."""
+    return {
+        "id": f"{prefix}{index:06d}",
+        "uri": f"spotify:track:{prefix}{index:06d}",
+        "name": f"Track {index}",
+        "artists": [{"id": f"artist{index % 50}", "name": f"Artist {index % 50}"}],
+        "album": {
+            "id": f"album{index % 200}",
+            "name": f"Album {index % 200}",
+            "release_date": "2020-01-01",
+            "total_tracks": 12,
+        },
+        "duration_ms": 180000 + (index % 120) * 1000,
+        "explicit": False,
+        "popularity": 50,
+        "preview_url": None,
+        "track_number": index % 12 + 1,
+        "available_markets": ["NZ"],
+    }
+
+
+def make_episode(index: int) -> dict:
+    """Build a synthetic podcast episode object."""
+    return {
+        "id": f"episode{index:06d}",
+        "name": f"Episode {index}",
+        "duration_ms": 1800000,
+        "description": f"Episode {index} description. " * 20,
+        "show": {"id": f"show{index % 5}", "name": f"Show {index % 5}"},
+    }
+
+
+class Fake_Spotify_API:
+    """A threaded HTTP server answering the endpoints the app uses."""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        playlist_size: int = 250,
+        liked_count: int = 100,
+        episode_count: int = 30,
+        extra_playlist_count: int = 0,
+        album_count: int = 0,
+        rate_limit: int = None,
+    ):
+        self.latency = latency
+        # At most `rate_limit` requests are answered per rolling second; the
+        # rest get a 429 whose Retry-After says when the next one will be.
+        self.rate_limit = rate_limit
+        self.answered_at = collections.deque()
+        self.throttled = 0
+        self.lock = threading.Lock()
+        self.requests = []
+        # Client addresses seen, one per TCP connection.
+        self.connections = set()
+        self.playlists = {
+            "fakeplaylist01": [make_track(i) for i in range(playlist_size)],
+            "fakeplaylist02": [make_track(i, "other") for i in range(20)],
+        }
+        # Empty playlists and saved albums, for listing a large library.
+        for i in range(extra_playlist_count):
+            self.playlists[f"extraplaylist{i:04d}"] = []
+        self.albums = [
+            {"album": {"id": f"fakealbum{i:04d}", "name": f"Album {i}"}}
+            for i in range(album_count)
+        ]
+        self.snapshot_ids = {playlist_id: "snap-1" for playlist_id in self.playlists}
+        self.liked = [make_track(i) for i in range(liked_count)]
+        self.episodes = [make_episode(i) for i in range(episode_count)]
+        self.track_index = 0
+        self.is_playing = True
+        self.volume = 50
+        self.progress_ms = 0
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, as the real API does.
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                api._handle(self, "GET")
+
+            def do_PUT(self):
+                api._handle(self, "PUT")
+
+            def do_POST(self):
+                api._handle(self, "POST")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/v1/"
+
+    def client(self, **kwargs) -> spotipy.Spotify:
+        """Return a spotipy client that talks to this server."""
+        kwargs.setdefault("retries", 0)
+        kwargs.setdefault("status_retries", 0)
+        sp = spotipy_client(auth="fake-token", **kwargs)
+        sp.prefix = self.url
+        return sp
+
+    def request_count(self, path_pattern: str = "") -> int:
+        """Number of requests received whose path matches `path_pattern`."""
+        with self.lock:
+            return sum(1 for _, path in self.requests if re.search(path_pattern, path))
+
+    def _handle(self, handler, method):
+        url = urlparse(handler.path)
+        path = url.path.removeprefix("/v1/").rstrip("/")
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(handler.headers.get("Content-Length") or 0)
+        request_body = json.loads(handler.rfile.read(length)) if length else None
+        with self.lock:
+            self.requests.append((method, path))
+            self.connections.add(handler.client_address)
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        retry_after = self.throttle()
+        if retry_after is not None:
+            status, body = 429, {"error": {"status": 429, "message": "API rate limit exceeded"}}
+        else:
+            status, body = self.route(method, path, query, request_body)
+        payload = b"" if body is None else json.dumps(body).encode()
+        handler.send_response(status)
+        if retry_after is not None:
+            handler.send_header("Retry-After", f"{retry_after:.2f}")
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def throttle(self):
+        """Seconds the client must wait if this request is over the rate limit, else None."""
+        if self.rate_limit is None:
+            return None
+        now = time.monotonic()
+        with self.lock:
+            while self.answered_at and now - self.answered_at[0] >= 1:
+                self.answered_at.popleft()
+            if len(self.answered_at) >= self.rate_limit:
+                self.throttled += 1
+                return 1 - (now - self.answered_at[0])
+            self.answered_at.append(now)
+            return None
+
+    def route(self, method, path, query, body=None):
+        """Return `(status, body)` for a request."""
+        limit = int(query.get("limit", 20))
+        offset = int(query.get("offset", 0))
+
+        if method == "GET":
+            if path == "me":
+                return 200, {"id": "fake_user", "display_name": "Fake User"}
+            if path == "me/player":
+                return 200, self.playback_state()
+            if path == "me/tracks":
+                return 200, self.page(
+                    self.liked, limit, offset,
+                    lambda track: {"added_at": "2024-01-01T00:00:00Z", "track": track},
+                )
+            if path == "me/playlists":
+                items = [
+                    {
+                        "id": playlist_id,
+                        "name": playlist_id,
+                        "snapshot_id": self.snapshot_ids[playlist_id],
+                    }
+                    for playlist_id in self.playlists
+                ]
+                return 200, self.page(items, limit, offset)
+            if path == "me/albums":
+                return 200, self.page(self.albums, limit, offset)
+            if path == "me/episodes":
+                return 200, self.page(
+                    self.episodes, limit, offset, lambda episode: {"episode": episode}
+                )
+            match = re.fullmatch(r"episodes/(\w+)", path)
+            if match:
+                for episode in self.episodes:
+                    if episode["id"] == match.group(1):
+                        return 200, episode
+            if path == "browse/featured-playlists":
+                return 200, {"playlists": self.page([], limit, offset)}
+            match = re.fullmatch(r"playlists/(\w+)", path)
+            if match and match.group(1) in self.playlists:
+                playlist_id = match.group(1)
+                return 200, {
+                    "id": playlist_id,
+                    "name": playlist_id,
+                    "snapshot_id": self.snapshot_ids[playlist_id],
+                }
+            match = re.fullmatch(r"playlists/(\w+)/(?:tracks|items)", path)
+            if match and match.group(1) in self.playlists:
+                return 200, self.page(
+                    self.playlists[match.group(1)], limit, offset,
+                    lambda track: {"track": track},
+                )
+
+        if method == "PUT":
+            if path == "me/player/play":
+                uri = ((body or {}).get("offset") or {}).get("uri")
+                uris = [track["uri"] for track in self.playlists["fakeplaylist01"]]
+                if uri in uris:
+                    self.track_index = uris.index(uri)
+                    self.progress_ms = 0
+                self.is_playing = True
+                return 204, None
+            if path == "me/player/pause":
+                self.is_playing = False
+                return 204, None
+            if path == "me/player/volume":
+                self.volume = int(query["volume_percent"])
+                return 204, None
+            if path == "me/player/seek":
+                self.progress_ms = int(query["position_ms"])
+                return 204, None
+
+        if method == "POST":
+            if path == "me/player/next":
+                self.track_index += 1
+                self.progress_ms = 0
+                return 204, None
+            if path == "me/player/previous":
+                self.track_index = max(0, self.track_index - 1)
+                self.progress_ms = 0
+                return 204, None
+
+        return 404, {"error": {"status": 404, "message": f"No route for {path}"}}
+
+    def page(self, items, limit, offset, wrap=None):
+        page_items = items[offset:offset + limit]
+        if wrap is not None:
+            page_items = [wrap(item) for item in page_items]
+        return {
+            "items": page_items,
+            "limit": limit,
+            "offset": offset,
+            "total": len(items),
+        }
+
+    def playback_state(self):
+        track = self.playlists["fakeplaylist01"][self.track_index]
+        return {
+            "device": {
+                "id": "fakedevice",
+                "name": "Fake Device",
+                "is_active": True,
+                "is_private_session": False,
+                "is_restricted": False,
+                "type": "Computer",
+                "supports_volume": True,
+                "volume_percent": self.volume,
+            },
+            "shuffle_state": False,
+            "smart_shuffle": False,
+            "repeat_state": "off",
+            "timestamp": int(time.time() * 1000),
+            "progress_ms": self.progress_ms,
+            "currently_playing_type": "track",
+            "is_playing": self.is_playing,
+            "context": {
+                "external_urls": {"spotify": "https://open.spotify.com/playlist/fakeplaylist01"},
+                "href": "https://api.spotify.com/v1/playlists/fakeplaylist01",
+                "type": "playlist",
+                "uri": "spotify:playlist:fakeplaylist01",
+            },
+            "item": track,
+        }
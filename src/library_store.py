@@ -0,0 +1,549 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from config_helper import get_cache_directory, get_config_directory
+from metrics import metrics
+from track import Episode, Track, intern_artists
+from track_file import Mapped_Track_List, read_track_list, write_track_file
+
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS artists (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS albums (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    spotify_id TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    album_id INTEGER REFERENCES albums(id),
+    duration_ms INTEGER NOT NULL,
+    -- Comma-separated artists(id), in credit order.
+    artist_ids TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS tracks_name ON tracks(name);
+CREATE TABLE IF NOT EXISTS playlists (
+    id INTEGER PRIMARY KEY,
+    spotify_id TEXT NOT NULL UNIQUE,
+    snapshot_id TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS playlist_tracks (
+    playlist_id INTEGER NOT NULL REFERENCES playlists(id),
+    position INTEGER NOT NULL,
+    track_id INTEGER NOT NULL REFERENCES tracks(id),
+    PRIMARY KEY (playlist_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS playlist_tracks_track ON playlist_tracks(track_id);
+CREATE TABLE IF NOT EXISTS liked_tracks (
+    spotify_id TEXT PRIMARY KEY,
+    added_at TEXT NOT NULL,
+    -- Higher for later likes: descending, the order the API lists them in.
+    sequence INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS library_items (
+    position INTEGER PRIMARY KEY,
+    spotify_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    snapshot_id TEXT
+);
+CREATE TABLE IF NOT EXISTS saved_episodes (
+    position INTEGER PRIMARY KEY,
+    spotify_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    show TEXT NOT NULL,
+    duration_ms INTEGER NOT NULL,
+    description TEXT NOT NULL
+);
+"""
+
+# One row per track, read without a subquery per row: a track's artist
+# ids are kept on the track itself.
+PLAYLIST_ROWS_QUERY = """
+SELECT t.spotify_id, t.name, t.album_id, t.duration_ms,
+       l.spotify_id IS NOT NULL, t.artist_ids
+FROM playlist_tracks pt
+JOIN tracks t ON t.id = pt.track_id
+LEFT JOIN liked_tracks l ON l.spotify_id = t.spotify_id
+WHERE pt.playlist_id = (SELECT id FROM playlists WHERE spotify_id = ?)
+  AND pt.position >= ? AND pt.position < ?
+ORDER BY pt.position
+"""
+
+# Local files in playlists have no Spotify id; they are stored under a
+# synthetic key and handed back with `"id": None`.
+LOCAL_TRACK_PREFIX = "local:"
+
+
+def _spotify_key(track: dict) -> str:
+    if track["id"] is not None:
+        return track["id"]
+    return f"{LOCAL_TRACK_PREFIX}{track['name']}\x1f{track['album']}"
+
+
+class Library_Store:
+    """Normalized SQLite cache of playlists, tracks, artists, albums and likes.
+
+    Tracks are stored once however many playlists contain them, and are
+    referenced by integer keys. Each thread gets its own connection and the
+    database runs in WAL mode, so executor threads saving freshly downloaded
+    playlists never block readers serving cached ones.
+
+    Each saved playlist is also written as a track file (see track_file)
+    beside the database, which opens a cached playlist without reading it:
+    rows are decoded from the mapped file as they are drawn.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_cache_directory(), "library.sqlite3")
+        self.track_file_directory = os.path.join(os.path.dirname(self.path), "tracks")
+        self._local = threading.local()
+        # Artist and album names never change once stored, so they are read
+        # once and shared by every track loaded.
+        self._name_cache = {"artists": {}, "albums": {}}
+        self._lineups = {}
+        db = self.connection()
+        with db:
+            db.executescript(SCHEMA)
+            db.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)",
+                (SCHEMA_VERSION,),
+            )
+            version = db.execute(
+                "SELECT value FROM meta WHERE key = 'schema_version'"
+            ).fetchone()[0]
+            if version < SCHEMA_VERSION:
+                self._upgrade_schema(db, version)
+
+    def _upgrade_schema(self, db, version: int) -> None:
+        if version < 2:
+            # Version 1 kept artist credits in a track_artists table, which
+            # cost a subquery per row to read back.
+            columns = {row[1] for row in db.execute("PRAGMA table_info(tracks)")}
+            if "artist_ids" not in columns:
+                db.execute("ALTER TABLE tracks ADD COLUMN artist_ids TEXT NOT NULL DEFAULT ''")
+            db.execute(
+                """
+                UPDATE tracks SET artist_ids = coalesce(
+                    (SELECT group_concat(artist_id) FROM track_artists WHERE track_id = tracks.id),
+                    ''
+                )
+                """
+            )
+            db.execute("DROP TABLE track_artists")
+        if version < 3:
+            # Tracks liked in the same second were listed in no known order;
+            # added_at is the best guess there is for them.
+            columns = {row[1] for row in db.execute("PRAGMA table_info(liked_tracks)")}
+            if "sequence" not in columns:
+                db.execute("ALTER TABLE liked_tracks ADD COLUMN sequence INTEGER NOT NULL DEFAULT 0")
+            oldest_first = db.execute(
+                "SELECT spotify_id FROM liked_tracks ORDER BY added_at"
+            ).fetchall()
+            db.executemany(
+                "UPDATE liked_tracks SET sequence = ? WHERE spotify_id = ?",
+                [(sequence, row[0]) for sequence, row in enumerate(oldest_first, 1)],
+            )
+        db.execute(
+            "UPDATE meta SET value = ? WHERE key = 'schema_version'", (SCHEMA_VERSION,)
+        )
+
+    def connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def playlist_fetched_at(self, playlist_id: str):
+        row = self.connection().execute(
+            "SELECT fetched_at FROM playlists WHERE spotify_id = ?", (playlist_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def playlist_snapshot_id(self, playlist_id: str):
+        """The snapshot_id the cached copy was downloaded at, or None if not cached."""
+        row = self.connection().execute(
+            "SELECT snapshot_id FROM playlists WHERE spotify_id = ?", (playlist_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    @metrics.timed("library_store_seconds", operation="load_playlist_rows")
+    def load_playlist_rows(self, playlist_id: str, start: int, count: int) -> list[Track]:
+        """Return the cached tracks at positions [start, start + count) of a playlist."""
+        rows = self.connection().execute(
+            PLAYLIST_ROWS_QUERY, (playlist_id, start, start + count)
+        ).fetchall()
+        album_names = self._names("albums", {row[2] for row in rows})
+        # Line-ups and album names come out shared already, so each row is
+        # built without looking them up again: this runs once per row of
+        # every playlist read from the store.
+        lineups = self._lineups
+        artist_lineup = self._artist_lineup
+        album_name = album_names.get
+        track = Track.from_shared
+        return [
+            track(
+                name,
+                lineups.get(artist_ids) or artist_lineup(artist_ids),
+                album_name(album_id, ""),
+                duration_ms,
+                bool(is_liked),
+                None if spotify_id.startswith(LOCAL_TRACK_PREFIX) else spotify_id,
+            )
+            for spotify_id, name, album_id, duration_ms, is_liked, artist_ids in rows
+        ]
+
+    def _names(self, table, ids) -> dict:
+        """Map of id to interned name for `table`, read from the database only for new ids."""
+        names = self._name_cache[table]
+        if not ids <= names.keys():
+            for name_id, name in self.connection().execute(
+                f"SELECT id, name FROM {table} WHERE id > ?", (max(names, default=0),)
+            ):
+                names[name_id] = sys.intern(name)
+        return names
+
+    def _artist_lineup(self, artist_ids) -> tuple:
+        """The shared artist tuple for a comma-separated list of artist ids."""
+        lineup = self._lineups.get(artist_ids)
+        if lineup is None:
+            ids = [int(artist_id) for artist_id in artist_ids.split(",")] if artist_ids else []
+            artist_names = self._names("artists", set(ids))
+            lineup = intern_artists(artist_names[artist_id] for artist_id in ids)
+            self._lineups[artist_ids] = lineup
+        return lineup
+
+    @metrics.timed("library_store_seconds", operation="load_playlist")
+    def load_playlist(self, playlist_id: str):
+        """Return a whole cached playlist, or None if it isn't cached."""
+        if self.playlist_fetched_at(playlist_id) is None:
+            return None
+        return self.load_playlist_rows(playlist_id, 0, 2**62)
+
+    @metrics.timed("library_store_seconds", operation="save_playlist")
+    def save_playlist(self, playlist_id: str, tracks, snapshot_id=None, fetched_at=None):
+        """Replace a playlist's cached contents with `tracks`."""
+        db = self.connection()
+        with db:
+            artist_ids = self._name_ids(
+                db, "artists", {a for track in tracks for a in track["artists"]}
+            )
+            album_ids = self._name_ids(db, "albums", {track["album"] for track in tracks})
+
+            track_ids = []
+            for track in tracks:
+                spotify_key = _spotify_key(track)
+                db.execute(
+                    """
+                    INSERT INTO tracks (spotify_id, name, album_id, duration_ms, artist_ids)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(spotify_id) DO UPDATE SET
+                        name = excluded.name,
+                        album_id = excluded.album_id,
+                        duration_ms = excluded.duration_ms,
+                        artist_ids = excluded.artist_ids
+                    """,
+                    (
+                        spotify_key,
+                        track["name"],
+                        album_ids[track["album"]],
+                        track["duration_ms"],
+                        ",".join(str(artist_ids[artist]) for artist in track["artists"]),
+                    ),
+                )
+                track_id = db.execute(
+                    "SELECT id FROM tracks WHERE spotify_id = ?", (spotify_key,)
+                ).fetchone()[0]
+                track_ids.append(track_id)
+
+            db.execute(
+                """
+                INSERT INTO playlists (spotify_id, snapshot_id, fetched_at) VALUES (?, ?, ?)
+                ON CONFLICT(spotify_id) DO UPDATE SET
+                    snapshot_id = excluded.snapshot_id,
+                    fetched_at = excluded.fetched_at
+                """,
+                (playlist_id, snapshot_id, time.time() if fetched_at is None else fetched_at),
+            )
+            playlist_key = db.execute(
+                "SELECT id FROM playlists WHERE spotify_id = ?", (playlist_id,)
+            ).fetchone()[0]
+            db.execute("DELETE FROM playlist_tracks WHERE playlist_id = ?", (playlist_key,))
+            db.executemany(
+                "INSERT INTO playlist_tracks (playlist_id, position, track_id) VALUES (?, ?, ?)",
+                [(playlist_key, position, track_id) for position, track_id in enumerate(track_ids)],
+            )
+        self.write_track_file(playlist_id, tracks, snapshot_id)
+
+    def track_file_path(self, playlist_id: str) -> str:
+        return os.path.join(self.track_file_directory, f"{playlist_id}.tracks")
+
+    @metrics.timed("library_store_seconds", operation="write_track_file")
+    def write_track_file(self, playlist_id: str, tracks, snapshot_id=None) -> None:
+        """Write a playlist's track file, tagged with its snapshot_id and the liked set's version."""
+        try:
+            os.makedirs(self.track_file_directory, exist_ok=True)
+            write_track_file(
+                self.track_file_path(playlist_id), tracks, (snapshot_id, self.liked_snapshot_id())
+            )
+        except Exception as e:
+            print(f"Error writing track file for {playlist_id}: {e}")
+
+    @metrics.timed("library_store_seconds", operation="open_track_file")
+    def open_track_file(self, playlist_id: str, snapshot_id=None):
+        """A playlist's rows, mapped from its track file, or None if it has none that is current.
+
+        The file must be at `snapshot_id` (any, if None) and, since it
+        records which tracks were liked, at the liked set's current version.
+        """
+        path = self.track_file_path(playlist_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            tracks = Mapped_Track_List(path)
+        except (OSError, ValueError) as e:
+            print(f"Error opening track file for {playlist_id}: {e}")
+            return None
+        file_snapshot_id, liked_version = tracks.version
+        if (
+            snapshot_id is not None and file_snapshot_id != snapshot_id
+        ) or liked_version != self.liked_snapshot_id():
+            tracks.close()
+            return None
+        return tracks
+
+    def _name_ids(self, db, table, names) -> dict:
+        db.executemany(
+            f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", [(name,) for name in names]
+        )
+        return {
+            name: db.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()[0]
+            for name in names
+        }
+
+    def load_liked_track_ids(self) -> set:
+        return {
+            row[0] for row in self.connection().execute("SELECT spotify_id FROM liked_tracks")
+        }
+
+    def load_liked_track_order(self) -> list:
+        """The liked track ids in the order the API lists them: most recently liked first."""
+        return [
+            row[0]
+            for row in self.connection().execute(
+                "SELECT spotify_id FROM liked_tracks ORDER BY sequence DESC"
+            )
+        ]
+
+    def liked_reconciled_at(self) -> float:
+        row = self.connection().execute(
+            "SELECT value FROM meta WHERE key = 'liked_reconciled_at'"
+        ).fetchone()
+        return row[0] if row else 0
+
+    def liked_snapshot_id(self) -> str:
+        """A version string for the liked set, which has no snapshot_id of its own."""
+        count, newest = self.connection().execute(
+            "SELECT COUNT(*), MAX(added_at) FROM liked_tracks"
+        ).fetchone()
+        return f"liked:{count}:{newest}"
+
+    @metrics.timed("library_store_seconds", operation="add_liked_tracks")
+    def add_liked_tracks(self, tracks) -> None:
+        """Record newly liked tracks (dicts with `id` and `added_at`), most recent first."""
+        db = self.connection()
+        with db:
+            newest = db.execute("SELECT MAX(sequence) FROM liked_tracks").fetchone()[0] or 0
+            db.executemany(
+                "INSERT OR REPLACE INTO liked_tracks (spotify_id, added_at, sequence) VALUES (?, ?, ?)",
+                [
+                    (track["id"], track["added_at"], newest + len(tracks) - position)
+                    for position, track in enumerate(tracks)
+                ],
+            )
+
+    @metrics.timed("library_store_seconds", operation="remove_liked_tracks")
+    def remove_liked_tracks(self, track_ids) -> None:
+        """Forget tracks that have been unliked."""
+        db = self.connection()
+        with db:
+            db.executemany(
+                "DELETE FROM liked_tracks WHERE spotify_id = ?",
+                [(track_id,) for track_id in track_ids],
+            )
+
+    @metrics.timed("library_store_seconds", operation="replace_liked_tracks")
+    def replace_liked_tracks(self, tracks, reconciled_at: float) -> None:
+        """Replace the whole liked set after a full reconciliation, given most recent first."""
+        db = self.connection()
+        with db:
+            db.execute("DELETE FROM liked_tracks")
+            db.executemany(
+                "INSERT OR REPLACE INTO liked_tracks (spotify_id, added_at, sequence) VALUES (?, ?, ?)",
+                [
+                    (track["id"], track["added_at"], len(tracks) - position)
+                    for position, track in enumerate(tracks)
+                ],
+            )
+            db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('liked_reconciled_at', ?)",
+                (reconciled_at,),
+            )
+
+    @metrics.timed("library_store_seconds", operation="load_library")
+    def load_library(self):
+        """The cached sidebar library as `(items, snapshot_ids, fingerprint, fetched_at)`.
+
+        `items` are `{"name", "id", "type"}` dicts in sidebar order and
+        `snapshot_ids` maps each playlist to the snapshot_id it was listed
+        with. Returns None if no library has been saved.
+        """
+        db = self.connection()
+        meta = dict(
+            db.execute(
+                "SELECT key, value FROM meta "
+                "WHERE key IN ('library_fingerprint', 'library_fetched_at')"
+            )
+        )
+        if "library_fingerprint" not in meta:
+            return None
+        items = []
+        snapshot_ids = {}
+        for spotify_id, name, item_type, snapshot_id in db.execute(
+            "SELECT spotify_id, name, type, snapshot_id FROM library_items ORDER BY position"
+        ):
+            items.append({"name": name, "id": spotify_id, "type": item_type})
+            if snapshot_id is not None:
+                snapshot_ids[spotify_id] = snapshot_id
+        return items, snapshot_ids, meta["library_fingerprint"], meta["library_fetched_at"]
+
+    @metrics.timed("library_store_seconds", operation="save_library")
+    def save_library(self, items, snapshot_ids: dict, fingerprint: str, fetched_at: float) -> None:
+        """Replace the cached sidebar library with a complete listing."""
+        db = self.connection()
+        with db:
+            db.execute("DELETE FROM library_items")
+            db.executemany(
+                "INSERT INTO library_items (position, spotify_id, name, type, snapshot_id) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (position, item["id"], item["name"], item["type"], snapshot_ids.get(item["id"]))
+                    for position, item in enumerate(items)
+                ],
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [("library_fingerprint", fingerprint), ("library_fetched_at", fetched_at)],
+            )
+
+    @metrics.timed("library_store_seconds", operation="load_saved_episodes")
+    def load_saved_episodes(self):
+        """The cached saved episodes as `(episodes, fingerprint, fetched_at)`, or None."""
+        db = self.connection()
+        meta = dict(
+            db.execute(
+                "SELECT key, value FROM meta "
+                "WHERE key IN ('episodes_fingerprint', 'episodes_fetched_at')"
+            )
+        )
+        if "episodes_fingerprint" not in meta:
+            return None
+        episodes = [
+            Episode(
+                name=name, show=show, duration_ms=duration_ms, description=description, id=spotify_id
+            )
+            for spotify_id, name, show, duration_ms, description in db.execute(
+                "SELECT spotify_id, name, show, duration_ms, description "
+                "FROM saved_episodes ORDER BY position"
+            )
+        ]
+        return episodes, meta["episodes_fingerprint"], meta["episodes_fetched_at"]
+
+    @metrics.timed("library_store_seconds", operation="save_saved_episodes")
+    def save_saved_episodes(self, episodes, fingerprint: str, fetched_at: float) -> None:
+        """Replace the cached saved episodes with a complete listing."""
+        db = self.connection()
+        with db:
+            db.execute("DELETE FROM saved_episodes")
+            db.executemany(
+                "INSERT INTO saved_episodes "
+                "(position, spotify_id, name, show, duration_ms, description) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        position, episode["id"], episode["name"], episode["show"],
+                        episode["duration_ms"], episode["description"],
+                    )
+                    for position, episode in enumerate(episodes)
+                ],
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [("episodes_fingerprint", fingerprint), ("episodes_fetched_at", fetched_at)],
+            )
+
+    def migrate_json_cache(self) -> None:
+        """Import, then delete, the old per-playlist `.cache` files and liked_songs.json.
+
+        Once every file has been imported this is recorded, and later calls
+        return without looking for them.
+        """
+        db = self.connection()
+        if db.execute("SELECT 1 FROM meta WHERE key = 'json_cache_migrated'").fetchone():
+            return
+        failed = False
+        cache_dir = get_cache_directory()
+        for filename in os.listdir(cache_dir):
+            if not filename.endswith(".cache"):
+                continue
+            path = os.path.join(cache_dir, filename)
+            try:
+                tracks = read_track_list(path)
+                self.save_playlist(
+                    filename.removesuffix(".cache"), tracks, fetched_at=os.path.getmtime(path)
+                )
+                os.remove(path)
+            except Exception as e:
+                failed = True
+                print(f"Error migrating {path}: {e}")
+
+        liked_songs_file = os.path.join(get_config_directory(), "liked_songs.json")
+        if os.path.exists(liked_songs_file):
+            try:
+                with open(liked_songs_file, "r") as f:
+                    state = json.load(f)
+                if isinstance(state, dict):
+                    self.replace_liked_tracks(state["tracks"], state["reconciled_at"])
+                else:
+                    # The original format: a bare list of ids, never reconciled.
+                    self.replace_liked_tracks(
+                        [{"id": track_id, "added_at": ""} for track_id in state], 0
+                    )
+                os.remove(liked_songs_file)
+            except Exception as e:
+                failed = True
+                print(f"Error migrating {liked_songs_file}: {e}")
+
+        if not failed:
+            with db:
+                db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_cache_migrated', ?)",
+                    (time.time(),),
+                )
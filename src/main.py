@@ -1,3 +1,4 @@
+from startup_profile import profiler, DEFAULT_TRACE_PATH
 from textual.app import App, ComposeResult
 from textual.screen import Screen
 from textual.widget import Widget
@@ -11,22 +12,59 @@ from textual.widgets import (
     ListView,
     ListItem,
     Label,
-    DataTable,
     LoadingIndicator,
     Button,
 )
 from textual.reactive import reactive
-from spotify_main_class import Spotify_Playback_Data
+from spotify_main_class import Spotify_Playback_Data, SAVED_EPISODES_ID
+from track_table import Track_Table, Column
+from track_file import Mapped_Track_List
 import time
-from textual import work
+from textual import events, work
 import asyncio
+from contextlib import aclosing
 from config_helper import setup_keybindings, setup_settings
+from state_snapshot import load_state_snapshot, save_state_snapshot
+from poll_scheduler import Poll_Scheduler
+from startup_graph import Startup_Graph
+from prefetcher import Playlist_Prefetcher
+from control_debouncer import Control_Debouncer
+from config_helper import get_config_directory, get_default_control_settings, get_default_metrics_settings
+from metrics import metrics
+from textual.worker import WorkerState
+from pathlib import Path
+import argparse
 import json
 
-playback = Spotify_Playback_Data()
-settings = setup_settings()
-keybindings = setup_keybindings()
+profiler.record("imports", "import", 0)
+with profiler.span("setup_settings", "config"):
+    settings = setup_settings()
+# With a snapshot of the last session the UI is drawn from it straight away
+# and every part is refreshed in the background.
+with profiler.span("load_state_snapshot", "config"):
+    state_snapshot = load_state_snapshot() if settings.get("startup_snapshot", True) else None
+playback = Spotify_Playback_Data(
+    page_concurrency=settings.get("page_concurrency", 4),
+    playlist_cache_settings=settings.get("playlist_cache"),
+    state_snapshot=state_snapshot,
+    background_concurrency=settings.get("prefetch", {}).get("concurrency", 1),
+    rate_limit_settings=settings.get("rate_limit"),
+    io_concurrency=settings.get("io_concurrency", 4),
+)
+with profiler.span("setup_keybindings", "config"):
+    keybindings = setup_keybindings()
 volume_step = settings.get("volume_step", 5)
+control_settings = {**get_default_control_settings(), **(settings.get("controls") or {})}
+metrics_settings = {**get_default_metrics_settings(), **(settings.get("metrics") or {})}
+# Seconds to wait for startup to settle before a --profile-startup run ends
+# or recently opened playlists are prefetched.
+STARTUP_TIMEOUT = 30
+# Seconds between polls while a control's predicted state awaits confirmation.
+PREDICTION_POLL_INTERVAL = 0.5
+# Seconds between progress clock ticks; the time shown moves in whole seconds.
+PROGRESS_TICK = 0.25
+# Least seconds between state snapshots saved after polls.
+STATE_SNAPSHOT_INTERVAL = 30
 
 
 def cut_string_if_long(string: str, max_length: int) -> str:
@@ -48,6 +86,26 @@ def get_current_time_with_offset() -> int:
     return playback.progress_ms + offset
 
 
+def metrics_dump_path() -> Path:
+    path = Path(metrics_settings["dump_path"]).expanduser()
+    return path if path.is_absolute() else get_config_directory() / path
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def track_fields(row) -> dict:
+    """The playback attributes for a track or episode row, to predict it playing."""
+    return {
+        "track": row["name"],
+        "track_id": row["id"],
+        "artists": list(row.get("artists") or [row.get("show", "")]),
+        "album_name": row.get("album"),
+        "track_duration": row.get("duration_ms"),
+    }
+
+
 class Current_Time_In_Track(Widget):
     current_time = reactive(get_current_time_with_offset())
 
@@ -137,64 +195,122 @@ class Bottom_Bar(Widget):
             id="bottom_bar_collection",
         )
 
-    @work
-    async def update_progress(self, progress=None):
-        current_time_widget = self.query_one(Current_Time_In_Track)
-        progress_bar = self.query_one(ProgressBar)
+    def on_mount(self):
+        self.styles.border = ("hkey", "blue")
+        self.current_time_widget = self.query_one(Current_Time_In_Track)
+        self.progress_bar = self.query_one(ProgressBar)
+        # The one progress clock: a timer that runs only while playing.
+        self.clock = self.set_interval(PROGRESS_TICK, self.update_progress, pause=True)
+        self.sync()
+
+    @metrics.timed("ui_seconds", path="bottom_bar_sync")
+    def sync(self, track_changed=True):
+        """Show fresh playback data, restarting the clock from its progress and timestamp."""
+        if track_changed:
+            self.query_one(Track_Duration).track_duration = playback.track_duration
+            self.query_one("#artist_info").update(self.get_artist_info())
+        self.border_title = playback.playing_settings()
+        self.update_progress()
+        if playback.is_playing:
+            self.clock.resume()
+        else:
+            self.clock.pause()
+
+    @metrics.timed("ui_seconds", path="update_progress")
+    def update_progress(self):
+        """Move the time and bar to where playback is now, interpolated from the last update."""
+        current_time = get_current_time_with_offset()
+        if playback.track_duration is not None:
+            current_time = min(current_time, playback.track_duration)
+        # Whole seconds, so ticks within the same second change nothing.
+        current_time -= current_time % 1000
+        self.current_time_widget.current_time = current_time
+        self.progress_bar.update(progress=current_time, total=playback.track_duration or 1)
+
 
-        if playback.is_playing and progress is None:
-            current_time_widget.current_time += 1000
+class Metrics_Panel(Static):
+    """Runtime metrics (latencies, counters, gauges), refreshed every second while shown."""
+
+    def __init__(self, id=None):
+        super().__init__(markup=False, id=id)
+
+    def on_mount(self) -> None:
+        self.display = False
+        self.refresher = self.set_interval(1, self.show_metrics, pause=True)
+
+    def toggle(self) -> None:
+        self.display = not self.display
+        if self.display:
+            self.show_metrics()
+            self.refresher.resume()
         else:
-            current_time_widget.current_time = progress if progress is not None else 0
+            self.refresher.pause()
 
-        total = playback.track_duration if playback.track_duration is not None else 1
+    def show_metrics(self) -> None:
+        self.update(metrics.report())
 
-        if current_time_widget.current_time != progress_bar.progress:
-            progress_bar.update(
-                progress=current_time_widget.current_time,
-                total=total,
-            )
 
-    @work
-    async def song_change(self):
-        track_duration_widget = self.query_one(Track_Duration)
-        current_time_widget = self.query_one(Current_Time_In_Track)
-        artist_info_widget = self.query_one("#artist_info")
+class Details_Panel(Static):
+    """The full details of the highlighted episode, fetched when the panel is opened."""
 
-        track_duration_widget.track_duration = playback.track_duration
-        current_time_widget.current_time = get_current_time_with_offset()
-        self.update_progress()
-        artist_info_widget.update(self.get_artist_info())
+    def __init__(self, id=None):
+        super().__init__(markup=False, id=id)
 
-    @work
-    async def update_playback_settings(self):
-        self.border_title = playback.playing_settings()
-        if playback.is_playing:
-            self.update_progress(playback.progress_ms)
+    def on_mount(self) -> None:
+        self.display = False
 
-    def on_mount(self):
-        self.styles.border = ("hkey", "blue")
-        self.update_playback_settings()
-        self.set_interval(1, self.update_progress)
+    def show_episode(self, episode, details=None) -> None:
+        lines = [episode["name"], episode["show"], ""]
+        if details is None:
+            lines.append("Loading...")
+        else:
+            lines[2] = f"{details['release_date']}  {ms_to_time(details['duration_ms'])}"
+            lines += ["", details["description"]]
+        self.update("\n".join(lines))
+        self.display = True
 
 
 class Side_Bar(Widget):
     def compose(self):
+        libraries = state_snapshot.get("libraries", {}) if state_snapshot else {}
         with ScrollableContainer(id="sidebar_container"):
             yield Library_List(
-                library_data=playback.get_featured_playlists(limit=5),
+                load_library=self.featured_playlists,
+                cached_library=libraries.get("featured_playlists_list"),
                 id="featured_playlists_list",
             )
             yield Library_List(
-                library_data=playback.get_user_library(),
+                load_library=self.user_library,
+                cached_library=libraries.get("user_library_list"),
                 id="user_library_list",
             )
 
+    async def featured_playlists(self):
+        yield await self.app.startup.result("featured_playlists")
+
+    async def user_library(self):
+        async with aclosing(playback.iter_user_library()) as batches:
+            async for batch in batches:
+                self.app.startup.mark("first library page")
+                yield batch
+        self.app.startup.mark("full library")
+
+
+class Library_Item(ListItem):
+    """A sidebar entry, keyed by the id of the playlist or album it opens."""
+
+    def __init__(self, item: dict):
+        super().__init__(Label(f"{item['name']} ({item['type'].capitalize()})"))
+        self.item_id = item["id"]
+
 
 class Library_List(Widget):
 
-    def __init__(self, library_data, id=None):
-        self.library_data = library_data
+    def __init__(self, load_library, cached_library=None, id=None):
+        # `load_library()` yields the library in batches, in order.
+        self.load_library = load_library
+        # Shown until the load catches up with it, then replaced where it changed.
+        self.library_data = cached_library or []
         super().__init__(id=id)
 
     class PlaylistSelected(Message):
@@ -204,182 +320,379 @@ class Library_List(Widget):
             self.playlist_id = playlist_id
             super().__init__()
 
-    @work
-    async def on_list_view_selected(self, selected_item):
-        playlist_id = next(
-            (
-                item["id"]
-                for item in self.library_data
-                if item["name"] == selected_item.item.name
-            ),
-            None,
-        )
+    class PlaylistHighlighted(Message):
+        """Sent when a playlist is highlighted or hovered, before it is selected."""
 
-        if playlist_id is None:
-            self.notify("Error: Playlist ID not found")
-            return
+        def __init__(self, playlist_id: str) -> None:
+            self.playlist_id = playlist_id
+            super().__init__()
+
+    def on_list_view_selected(self, event: ListView.Selected) -> None:
+        self.post_message(self.PlaylistSelected(event.item.item_id))
 
-        self.post_message(self.PlaylistSelected(str(playlist_id)))
+    def on_list_view_highlighted(self, event: ListView.Highlighted) -> None:
+        # The list highlights its first item on mount; only the user's moves count.
+        if event.item is not None and event.list_view.has_focus:
+            self.post_message(self.PlaylistHighlighted(event.item.item_id))
+
+    def on_descendant_focus(self) -> None:
+        item = self.query_one(ListView).highlighted_child
+        if item is not None:
+            self.post_message(self.PlaylistHighlighted(item.item_id))
+
+    def on_enter(self, event: events.Enter) -> None:
+        for node in event.node.ancestors_with_self:
+            if isinstance(node, Library_Item):
+                self.post_message(self.PlaylistHighlighted(node.item_id))
+                return
 
     def compose(self):
-        items = [
-            ListItem(
-                Label(f"{item['name']} ({item['type'].capitalize()})"),
-                name=item["name"],
-            )
-            for item in self.library_data
-        ]
-        yield ListView(*items)
+        yield ListView(*[Library_Item(item) for item in self.library_data])
+
+    def on_mount(self) -> None:
+        self.set_library()
+
+    @work
+    async def set_library(self):
+        # A loading placeholder, unless there is a cached library to show.
+        self.loading = not self.library_data
+        library_data = []
+        try:
+            async with aclosing(self.load_library()) as batches:
+                async for batch in batches:
+                    library_data += batch
+                    self.loading = False
+                    await self.show_library(library_data, complete=False)
+        except Exception as e:
+            print(f"Error loading library: {e}")
+            return
+        finally:
+            self.loading = False
+        await self.show_library(library_data, complete=True)
+
+    async def show_library(self, library_data: list, complete: bool):
+        """Bring the list in line with `library_data`, the part of the library loaded so far.
+
+        Items already shown are kept as long as they match, and items beyond
+        a partial load stay until it completes, so re-listing a cached
+        library only touches what changed.
+        """
+        shown = self.library_data
+        same = 0
+        while same < min(len(shown), len(library_data)) and shown[same] == library_data[same]:
+            same += 1
+        if same == len(library_data) and (not complete or same == len(shown)):
+            return
+        list_view = self.query_one(ListView)
+        if same < len(shown):
+            await list_view.remove_items(range(same, len(shown)))
+        await list_view.extend([Library_Item(item) for item in library_data[same:]])
+        self.library_data = library_data[:]
 
 
 class Main_Page(Widget):
     def compose(self):
         with Container(id="main_page_container"):
-            yield Playlist_Track_View(playlist_id="liked_songs", id="playlist_tracks")
+            yield Playlist_Track_View(
+                playlist_id=(state_snapshot or {}).get("playlist_id", "liked_songs"),
+                show_stale=state_snapshot is not None,
+                id="playlist_tracks",
+            )
+
+
+def track_columns() -> list[Column]:
+    return [
+        Column("#", lambda i, track: str(i + 1), numbered=True),
+        Column("Title", lambda i, track: str(track["name"]), flexible=True),
+        Column("Artist", lambda i, track: ", ".join(track.get("artists", [])), flexible=True),
+        Column("Album", lambda i, track: track.get("album", ""), flexible=True),
+        Column(
+            "Duration",
+            lambda i, track: ms_to_time(track.get("duration_ms", 0)),
+            auto_width=True,
+        ),
+        Column(
+            "Liked",
+            lambda i, track: "♥" if track.get("is_liked", False) else "",
+            auto_width=True,
+        ),
+    ]
+
+
+def episode_columns() -> list[Column]:
+    return [
+        Column("#", lambda i, episode: str(i + 1), numbered=True),
+        Column("Title", lambda i, episode: episode["name"], flexible=True),
+        Column("Show", lambda i, episode: episode["show"], flexible=True),
+        Column(
+            "Duration",
+            lambda i, episode: ms_to_time(episode.get("duration_ms", 0)),
+            auto_width=True,
+        ),
+        Column("Description", lambda i, episode: episode.get("description", ""), flexible=True),
+    ]
 
 
 class Playlist_Track_View(Widget):
     can_focus = True
 
     track_weight, artist_weight, album_weight = 2, 1, 1
-    old_size = (0, 0)
-    adjusting_size = False
 
-    def __init__(self, playlist_id, max_title_length=40, id=None):
+    def __init__(self, playlist_id, max_title_length=40, show_stale=False, id=None):
         self.playlist_id = playlist_id
         self.max_title_length = max_title_length
+        # Draw the first playlist from any cached copy while it revalidates.
+        self.show_stale = show_stale
         self.tracks = []
+        # Row of each track id in self.tracks, built when first needed.
+        self.track_rows = None
         super().__init__(id=id)
 
     @work
     async def change_playlist(self, playlist_id):
         self.playlist_id = playlist_id
+        self.screen.query_one(Details_Panel).display = False
         self.set_tracks()
 
-    def on_data_table_row_selected(self, row):
-        selected_track = self.tracks[row.cursor_row]["id"]
-        playback.play_track(selected_track, self.playlist_id)
-
-    def adjust_columns(self):
-        current_size = self.query_one(DataTable).size[0]
-        if self.old_size == current_size or self.adjusting_size:
+    @work(exclusive=True, group="details")
+    async def show_details(self):
+        """Open the detail view for the highlighted episode, or close it if open."""
+        panel = self.screen.query_one(Details_Panel)
+        if panel.display:
+            panel.display = False
             return
-        self.old_size = current_size
-        self.post_display_hook()
+        if self.playlist_id != SAVED_EPISODES_ID or not self.tracks:
+            return
+        episode = self.tracks[self.query_one(Track_Table).cursor_row]
+        panel.show_episode(episode)
+        try:
+            details = await playback.get_episode_details(episode["id"])
+        except Exception as e:
+            print(f"Error fetching episode details: {e}")
+            panel.display = False
+            return
+        panel.show_episode(episode, details)
+
+    def on_track_table_row_selected(self, row):
+        selected_track = self.tracks[row.cursor_row]
+        self.app.control(
+            lambda: playback.play_track(selected_track["id"], self.playlist_id),
+            {**track_fields(selected_track), "is_playing": True, "progress_ms": 0, "timestamp": now_ms()},
+            checked=["track_id"],
+        )
+
+    def adjacent_track(self, offset: int):
+        """The row `offset` away from the playing track, if playback goes through this list in order."""
+        if playback.shuffle or playback.context_uri is None:
+            return None
+        if self.playlist_id == "liked_songs":
+            in_context = playback.context_uri.endswith(":collection")
+        else:
+            in_context = playback.context_uri == f"spotify:playlist:{self.playlist_id}"
+        if not in_context:
+            return None
+        if self.track_rows is None:
+            if isinstance(self.tracks, Mapped_Track_List):
+                self.track_rows = self.tracks.rows_by_id()
+            else:
+                self.track_rows = {}
+                for row, track in enumerate(self.tracks):
+                    self.track_rows.setdefault(track["id"], row)
+        index = self.track_rows.get(playback.track_id)
+        if index is not None and 0 <= index + offset < len(self.tracks):
+            return self.tracks[index + offset]
+        return None
+
+    def use_tracks(self, tracks) -> None:
+        """Make `tracks` the rows of this view, unmapping the track file of the ones they replace."""
+        if isinstance(self.tracks, Mapped_Track_List) and self.tracks is not tracks:
+            self.tracks.close()
+        self.tracks = tracks
+        self.track_rows = None
 
     def compose(self) -> ComposeResult:
-        yield DataTable()
+        yield Track_Table()
 
-    @work
+    @work(exclusive=True, group="set_tracks")
+    @metrics.timed("ui_seconds", path="set_tracks")
     async def set_tracks(self):
-        table = self.query_one(DataTable)
+        # exclusive: switching playlist cancels the previous stream, and
+        # aclosing() makes that cancel its in-flight page requests too.
+        table = self.query_one(Track_Table)
+        if self.show_stale:
+            self.show_stale = False
+            if await self.show_stale_tracks(table):
+                return
+
         table.loading = True
-        table.clear(columns=True)
-
-        if self.playlist_id == "saved_episodes":
-            columns = table.add_columns("#", "Title", "Show", "Duration", "Description")
-            self.tracks = playback.get_saved_episodes()
-
-            for i, episode in enumerate(self.tracks):
-                description = episode.get("description", "")
-                description = description[:50] + "..." if description else ""
-
-                table.add_row(
-                    str(i + 1),
-                    episode["name"],
-                    episode["show"],
-                    ms_to_time(episode.get("duration_ms", 0)),
-                    description,
-                )
+        table.clear()
+        self.use_tracks([])
+
+        if self.playlist_id == SAVED_EPISODES_ID:
+            table.set_columns(episode_columns())
+            batches = playback.iter_saved_episodes()
         else:
-            columns = table.add_columns(
-                "#", "Title", "Artist", "Album", "Duration", "Liked"
-            )
-            self.tracks = playback.get_playlist_tracks(self.playlist_id)
-
-            add_row = table.add_row
-            for i, track in enumerate(self.tracks):
-                track_name = str(track["name"])
-                artist_string = ", ".join(track.get("artists", []))
-                album_name = track.get("album", "")
-
-                add_row(
-                    str(i + 1),
-                    track_name,
-                    artist_string,
-                    album_name,
-                    ms_to_time(track.get("duration_ms", 0)),
-                    "♥" if track.get("is_liked", False) else "",
-                )
+            table.set_columns(track_columns())
+            # Follows a prefetch of the playlist if one is loading it.
+            batches = self.app.prefetcher.iter_playlist_tracks(self.playlist_id)
+        table.set_rows(self.tracks)
+
+        async with aclosing(batches):
+            async for batch in batches:
+                first_batch = not self.tracks
+                with metrics.timer("ui_seconds", path="set_tracks_rows"):
+                    if isinstance(batch, Mapped_Track_List):
+                        # A whole cached playlist, read from disk as rows are drawn.
+                        self.use_tracks(batch)
+                        table.replace_rows(self.tracks)
+                    else:
+                        self.tracks.extend(batch)
+                        self.track_rows = None
+                        table.refresh_rows()
+                if first_batch:
+                    # Show the first page as soon as it arrives.
+                    self.app.startup.mark("first playlist rows")
+                    table.loading = False
         table.loading = False
 
-        self.post_display_hook()
+    async def show_stale_tracks(self, table) -> bool:
+        """Show a cached copy of the playlist, then patch in the current one if it differs."""
+        stale_tracks = await playback.get_stale_playlist_tracks(self.playlist_id)
+        if not stale_tracks:
+            return False
+        episodes = self.playlist_id == SAVED_EPISODES_ID
+        table.set_columns(episode_columns() if episodes else track_columns())
+        self.use_tracks(stale_tracks)
+        table.set_rows(self.tracks)
+        self.app.startup.mark("cached playlist rows")
+
+        try:
+            if episodes:
+                tracks = await playback.get_saved_episodes()
+            else:
+                tracks = await playback.get_playlist_tracks(self.playlist_id)
+        except Exception as e:
+            print(f"Error refreshing playlist: {e}")
+            return True
+        if tracks != stale_tracks:
+            self.use_tracks(tracks)
+            table.replace_rows(self.tracks)
+        elif isinstance(tracks, Mapped_Track_List) and tracks is not stale_tracks:
+            tracks.close()
+        return True
 
     def on_mount(self) -> None:
-        table = self.query_one(DataTable)
-        table.cursor_type = "row"
+        table = self.query_one(Track_Table)
         table.styles.scrollbar_size_horizontal = 0
 
         self.set_tracks()
 
-    @work
-    async def post_display_hook(self) -> None:
-        self.adjusting_size = True
-        table = self.query_one(DataTable)
-        size = table.container_size
-
-        if not all(size):
-            self.call_later(self.post_display_hook)
-            return
-
-        taken_chars = -1
-        for c in table.columns.values():
-            c.auto_width = False
-            if str(c.label) == "#":
-                c.width = len(str(table.row_count))
-            elif str(c.label) in ["Duration", "Liked"]:
-                c.auto_width = True
-            taken_chars += c.width
-
-        for c in table.columns.values():
-            if str(c.label) in ["Title", "Artist", "Album"]:
-                c.width = int((size[0] - taken_chars) / (len(table.columns) - 3)) + 1
-        table.refresh()
-        self.adjusting_size = False
-
 
 class Main_Screen(Screen):
     CSS_PATH = "main_page.tcss"
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.poll_scheduler = Poll_Scheduler(settings.get("polling"))
+        metrics.add_collector("poll", lambda: {
+            **self.poll_scheduler.stats,
+            "polls_per_minute": self.poll_scheduler.polls_per_minute(),
+        })
+        self.poll_timer = None
+        self.snapshot_saved_at = 0
+
     def on_library_list_playlist_selected(
         self, message: Library_List.PlaylistSelected
     ) -> None:
+        self.app.prefetcher.opened(message.playlist_id)
         playlist_view = self.query_one("#playlist_tracks", Playlist_Track_View)
         playlist_view.change_playlist(message.playlist_id)
 
+    def on_library_list_playlist_highlighted(
+        self, message: Library_List.PlaylistHighlighted
+    ) -> None:
+        self.app.prefetcher.highlight(message.playlist_id)
+
     def compose(self) -> ComposeResult:
         yield Top_Bar(id="top_bar")
         yield Side_Bar(id="sidebar")
         yield Main_Page(id="main_page")
         yield Bottom_Bar(id="bottom_bar")
+        yield Metrics_Panel(id="metrics_panel")
+        yield Details_Panel(id="details_panel")
 
-    async def update_stats(self):
+    @metrics.timed("ui_seconds", path="update_stats")
+    async def update_stats(self, update=None):
         old_song = playback.track
+        was_stale = playback.state_is_stale
         try:
-            playback.update()
+            await (update or playback.update)()
         except Exception as e:
             print(f"Error updating playback data: {e}")
             return
         if playback.track is None:
             return
-        elif old_song != playback.track and playback.is_playing:
-            self.query_one(Bottom_Bar).song_change()
+        self.query_one(Bottom_Bar).sync(track_changed=old_song != playback.track or was_stale)
+        self.query_one(Top_Bar).update_controls()
+        # Kept current, so a session that ends without quitting (a crash,
+        # a closed terminal) still leaves the next cold start something to draw.
+        if time.time() - self.snapshot_saved_at >= STATE_SNAPSHOT_INTERVAL:
+            self.snapshot_saved_at = time.time()
+            await asyncio.get_running_loop().run_in_executor(
+                None, save_state_snapshot, self.state_snapshot()
+            )
 
-        self.query_one(Bottom_Bar).update_playback_settings()
+    def show_playback(self, track_changed: bool):
+        """Redraw the controls and progress from the playback state as it is, without polling."""
+        self.query_one(Bottom_Bar).sync(track_changed=track_changed)
         self.query_one(Top_Bar).update_controls()
 
+    def schedule_poll(self, delay=None):
+        """Arm a one-shot timer for the next poll, by default when the scheduler says."""
+        if self.poll_timer is not None:
+            self.poll_timer.stop()
+        if delay is None:
+            delay = self.poll_scheduler.next_delay(playback)
+        self.poll_timer = self.set_timer(delay, self.poll)
+
+    async def poll(self, immediate=False):
+        self.poll_scheduler.record_poll(immediate=immediate)
+        await self.update_stats()
+        self.schedule_poll(PREDICTION_POLL_INTERVAL if playback.predictions else None)
+
+    async def poll_now(self):
+        """Poll right away, e.g. after a local control action."""
+        if self.poll_timer is not None:
+            self.poll_timer.stop()
+            self.poll_timer = None
+        await self.poll(immediate=True)
+
+    @work
+    async def reconcile(self):
+        """Poll in the background for the state that confirms or rolls back a control."""
+        await self.poll_now()
+
     async def on_mount(self) -> None:
-        self.set_interval(2, self.update_stats)
+        self.call_after_refresh(self.app.startup.mark, "first paint")
+        self.first_poll()
+
+    @work
+    async def first_poll(self):
+        """Show the playback state read by the startup graph, then start polling."""
+        self.poll_scheduler.record_poll(immediate=True)
+        await self.update_stats(update=lambda: self.app.startup.result("playback"))
+        self.schedule_poll()
+
+    def state_snapshot(self) -> dict:
+        """What the next cold start should draw before any data arrives."""
+        return {
+            "playback": playback.playback_state(),
+            "libraries": {
+                library.id: library.library_data for library in self.query(Library_List)
+            },
+            "playlist_id": self.query_one(Playlist_Track_View).playlist_id,
+            "recent_playlists": list(self.app.prefetcher.recent),
+        }
 
 
 class MainApp(App):
@@ -389,54 +702,280 @@ class MainApp(App):
         ("<", "previous_track", "Previous Track"),
         (keybindings.get("volume_up", "+"), "volume_up", "Volume Up"),
         (keybindings.get("volume_down", "-"), "volume_down", "Volume Down"),
+        (keybindings.get("toggle_metrics", "f12"), "toggle_metrics", "Metrics"),
+        (keybindings.get("dump_metrics", "f11"), "dump_metrics", "Dump Metrics"),
+        (keybindings.get("show_details", "i"), "show_details", "Episode Details"),
     ]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.playback = playback
         self.volume_step = volume_step
-
-    async def action_play_pause(self):
+        self.startup = Startup_Graph()
+        self.prefetcher = Playlist_Prefetcher(
+            playback,
+            settings.get("prefetch"),
+            recent=(state_snapshot or {}).get("recent_playlists"),
+        )
+        self.volume_control = Control_Debouncer(self.send_volume, control_settings["debounce"])
+        self.skip_control = Control_Debouncer(self.send_skip, control_settings["debounce"])
+        self.control_queue = asyncio.Queue()
+        self.add_metrics_collectors()
+
+    def add_metrics_collectors(self):
+        # Read playback.api at collection time: tests swap the client after startup.
+        metrics.add_collector("api", lambda: playback.api.stats)
+        metrics.add_collector("executor", lambda: playback.api.executor_stats())
+        metrics.add_collector("scheduler", lambda: playback.api.scheduler.stats)
+        metrics.add_collector(
+            "playlist_cache",
+            lambda: {
+                **playback.cache_stats,
+                "memory": playback.playlist_cache.stats,
+                "memory_bytes": playback.playlist_cache.size,
+            },
+        )
+        metrics.add_collector(
+            "prefetch", lambda: {**self.prefetcher.stats, "hit_rate": self.prefetcher.hit_rate}
+        )
+        metrics.add_collector("predictions", lambda: playback.prediction_stats)
+        metrics.add_collector(
+            "controls",
+            lambda: {
+                "volume": self.volume_control.stats,
+                "skip": self.skip_control.stats,
+                "queued": self.control_queue.qsize(),
+            },
+        )
+        metrics.add_collector("workers", self.worker_counts)
+
+    def worker_counts(self) -> dict:
+        """Workers running now, in all and by name."""
+        running = [worker for worker in self.workers if worker.state == WorkerState.RUNNING]
+        by_name = {}
+        for worker in running:
+            by_name[worker.name] = by_name.get(worker.name, 0) + 1
+        return {"running": len(running), "running_by_name": by_name}
+
+    def action_toggle_metrics(self) -> None:
+        self.get_screen("main").query_one(Metrics_Panel).toggle()
+
+    def action_dump_metrics(self) -> None:
+        path = metrics_dump_path()
+        metrics.write(path)
+        self.notify(f"Metrics saved to {path}")
+
+    def action_show_details(self) -> None:
+        self.get_screen("main").query_one(Playlist_Track_View).show_details()
+
+    def predict(self, fields: dict, checked=None, expect=None):
+        """Draw the playback state a control should produce (see Spotify_Playback_Data.predict)."""
+        track_id = playback.track_id
+        prediction = playback.predict(fields, checked=checked, expect=expect)
+        self.get_screen("main").show_playback(track_changed=playback.track_id != track_id)
+        return prediction
+
+    async def send_control(self, send, predictions):
+        """Await `send()`; roll `predictions` back if it fails, or poll to confirm them."""
+        screen = self.get_screen("main")
+        try:
+            await send()
+        except Exception as e:
+            track_id = playback.track_id
+            for prediction in predictions:
+                playback.rollback(prediction)
+            screen.show_playback(track_changed=playback.track_id != track_id)
+            self.notify(f"Playback control failed: {e}", severity="error")
+            return
+        screen.reconcile()
+
+    def queue_control(self, send, predictions):
+        """Queue `send()` to be made after every control queued before it."""
+        self.control_queue.put_nowait((send, predictions))
+
+    @work(exclusive=True, group="controls")
+    async def send_controls(self):
+        """Make queued controls' requests one at a time, so they reach the server in order."""
+        while True:
+            send, predictions = await self.control_queue.get()
+            await self.send_control(send, predictions)
+            self.control_queue.task_done()
+
+    def control(self, send, fields: dict, checked=None, expect=None):
+        """Run a playback control optimistically.
+
+        The playback state the control should produce is drawn, and the
+        request made by `send()` is queued behind the controls before it;
+        nothing here waits on the API. A failed request is rolled back as
+        soon as it fails, and the poll that confirms or rolls back the rest
+        runs in the background.
+        """
+        predictions = [self.predict(fields, checked=checked, expect=expect)]
+        # Skips and volume changes still waiting to be sent go first.
+        self.skip_control.flush()
+        self.volume_control.flush()
+        self.queue_control(send, predictions)
+
+    def action_play_pause(self):
         if playback.is_playing:
-            playback.is_playing = False
-            self.query_one(Bottom_Bar).update_progress(
-                progress=playback.progress_ms
+            self.control(
+                playback.pause_playback,
+                {"is_playing": False, "progress_ms": get_current_time_with_offset(), "timestamp": now_ms()},
+                checked=["is_playing"],
             )
-            await playback.pause_playback()
         else:
-            playback.is_playing = True
-            await playback.start_playback()
-        self.query_one(Top_Bar).update_controls()
+            self.control(
+                playback.start_playback,
+                {"is_playing": True, "timestamp": now_ms()},
+                checked=["is_playing"],
+            )
+
+    def skip(self, step: int):
+        """Skip `step` tracks; a burst of skips is sent as one request once it ends.
+
+        While the open playlist is the one playing, each skip predicts the
+        adjacent row, and the burst becomes a single play of the last one.
+        Otherwise only a track change is predicted, and the burst is sent
+        as that many skips.
+        """
+        pending = self.skip_control.pending
+        offset, track = self.skip_control.target if pending else (0, None)
+        fields = {"progress_ms": 0, "timestamp": now_ms()}
+        # Once a skip in the burst goes past what the rows can predict, the rest can't either.
+        if not pending or track is not None:
+            track = self.get_screen("main").query_one(Playlist_Track_View).adjacent_track(step)
+        if track is not None:
+            # Sent as a play of that row, which starts playback if it was paused.
+            prediction = self.predict(
+                {**fields, **track_fields(track), "is_playing": True}, checked=["track_id"]
+            )
+        else:
+            track_id = playback.track_id
+            prediction = self.predict(fields, expect=lambda playback: playback.track_id != track_id)
+        self.skip_control.press((offset + step, track), prediction)
+
+    def send_skip(self, target, predictions):
+        offset, track = target
+        if track is not None:
+            playlist_id = self.get_screen("main").query_one(Playlist_Track_View).playlist_id
+            send = lambda: playback.play_track(track["id"], playlist_id)
+        else:
+            async def send():
+                for _ in range(abs(offset)):
+                    await (playback.next_track() if offset > 0 else playback.previous_track())
+        self.queue_control(send, predictions)
 
     async def action_next_track(self):
-        await playback.next_track()
-        playback.update()
-        self.query_one(Bottom_Bar).update_playback_settings()
-        self.query_one(Bottom_Bar).song_change()
-        self.query_one(Top_Bar).update_controls()
+        self.skip(1)
 
     async def action_previous_track(self):
-        await playback.previous_track()
-        playback.update()
-        self.query_one(Bottom_Bar).update_playback_settings()
-        self.query_one(Bottom_Bar).song_change()
-        self.query_one(Top_Bar).update_controls()
+        self.skip(-1)
+
+    def change_volume(self, step: int):
+        """Move the volume by `step` from the pending target; a burst is sent as one request."""
+        if self.volume_control.pending:
+            current_volume = self.volume_control.target
+        else:
+            current_volume = playback.device_volume_percent or 0
+        volume = max(0, min(current_volume + step, 100))
+        self.volume_control.press(volume, self.predict({"device_volume_percent": volume}))
+
+    def send_volume(self, volume: int, predictions):
+        self.queue_control(lambda: playback.set_volume(volume), predictions)
 
     async def action_volume_up(self):
-        current_volume = playback.device_volume_percent or 0
-        new_volume = min(current_volume + self.volume_step, 100)
-        await playback.set_volume(new_volume)
+        self.change_volume(self.volume_step)
 
     async def action_volume_down(self):
-        current_volume = playback.device_volume_percent or 0
-        new_volume = max(current_volume - self.volume_step, 0)
-        await playback.set_volume(new_volume)
+        self.change_volume(-self.volume_step)
 
     async def on_mount(self) -> None:
-        self.install_screen(Main_Screen(), "main")
-        await self.push_screen("main")
+        # Every load is independent, so they all run at once: none waits for
+        # the token check, since spotipy refreshes an expired token itself on
+        # whichever request meets it first. The user library streams into the
+        # sidebar a page at a time, so Side_Bar loads it itself.
+        self.startup.add("auth", playback.verify_user)
+        self.startup.add("playback", playback.update)
+        self.startup.add(
+            "featured_playlists", lambda: playback.get_featured_playlists(limit=5)
+        )
+        self.startup.start()
+        self.send_controls()
+        profiler.record("start app", "compose", self.startup.started_at - profiler.origin)
+
+        with profiler.span("compose and mount main screen", "compose"):
+            self.install_screen(Main_Screen(), "main")
+            await self.push_screen("main")
+        if profiler.enabled:
+            self.exit_after_startup()
+        else:
+            self.prefetch_recent_playlists()
+
+    async def wait_for_startup(self, timeout: float):
+        """Wait until every startup load is done and the rows and library are shown."""
+        for name in self.startup.loads:
+            try:
+                await self.startup.result(name)
+            except Exception:
+                pass
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline and not (
+            (
+                "first playlist rows" in self.startup.marks
+                or "cached playlist rows" in self.startup.marks
+            )
+            and "full library" in self.startup.marks
+        ):
+            await asyncio.sleep(0.05)
+
+    @work
+    async def exit_after_startup(self):
+        """When profiling startup, quit once startup is done."""
+        await self.wait_for_startup(STARTUP_TIMEOUT)
+        # One more frame, so the rows are painted before the app exits.
+        await asyncio.sleep(0.05)
+        self.exit()
+
+    @work
+    async def prefetch_recent_playlists(self):
+        """Once startup has settled, warm the playlists opened most recently."""
+        await self.wait_for_startup(STARTUP_TIMEOUT)
+        open_playlist_id = self.get_screen("main").query_one(Playlist_Track_View).playlist_id
+        await self.prefetcher.prefetch_recent(open_playlist_id)
+
+    async def action_quit(self) -> None:
+        if isinstance(self.screen, Main_Screen):
+            save_state_snapshot(self.screen.state_snapshot())
+        await super().action_quit()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--startup-timing",
+        action="store_true",
+        help="on exit, print when each startup request ran",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        nargs="?",
+        const=DEFAULT_TRACE_PATH,
+        metavar="TRACE_FILE",
+        help="quit once startup is done, print a timeline of its phases and "
+        f"save it as a Chrome trace (default {DEFAULT_TRACE_PATH})",
+    )
+    args = parser.parse_args()
+
     app = MainApp(ansi_color=True)
     app.run()
+    playback.close()
+    if metrics_settings["dump_at_exit"]:
+        metrics.write(metrics_dump_path())
+    if args.startup_timing:
+        print(app.startup.timing_report())
+    if args.profile_startup:
+        profiler.stop_timing_imports()
+        profiler.add_startup_graph(app.startup)
+        print(profiler.table())
+        profiler.write_chrome_trace(args.profile_startup)
+        print(f"Chrome trace saved to {args.profile_startup}")
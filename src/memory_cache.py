@@ -0,0 +1,105 @@
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Items released per step when freeing an evicted list, so the freeing thread
+# hands the GIL back to the UI between steps.
+RELEASE_CHUNK = 1000
+
+
+def _release(holder: list) -> None:
+    """Drop the cache's reference to an evicted value, freeing a large list a chunk at a time.
+
+    The value arrives inside `holder` so that nothing else (such as the
+    executor's work item) keeps it alive while it is being freed. If the UI
+    still shows the list, only the cache's references are dropped.
+    """
+    value = holder.pop()
+    if isinstance(value, list):
+        items = value[:]
+        del value
+        while items:
+            del items[-RELEASE_CHUNK:]
+
+
+class Memory_Cache:
+    """A least-recently-used cache bounded by the approximate bytes it holds.
+
+    `sizeof(value)` estimates each entry's size; once the total passes
+    `budget_bytes` the least recently used entries are evicted. Entries older
+    than `ttl` seconds count as misses, as do entries stored under a
+    different `version` than the one asked for. Evicted values are released
+    on a background thread, so freeing a large playlist never stalls the UI.
+    """
+
+    def __init__(self, budget_bytes: int, ttl: float, sizeof):
+        self.budget_bytes = budget_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.size = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+        self.releaser = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-release")
+
+    def __contains__(self, key) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key, default=None, version=None):
+        """Return the value stored under `key`, unless it is missing, expired or outdated.
+
+        With a `version`, an entry stored under any other version is dropped.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return default
+        value, size, stored_at, stored_version = entry
+        if time.monotonic() - stored_at > self.ttl:
+            self.stats["expirations"] += 1
+            self.stats["misses"] += 1
+            self._remove(key)
+            return default
+        if version is not None and version != stored_version:
+            self.stats["invalidations"] += 1
+            self.stats["misses"] += 1
+            self._remove(key)
+            return default
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return value
+
+    def put(self, key, value, version=None) -> None:
+        if key in self.entries:
+            self._remove(key)
+        size = self.sizeof(value)
+        if size > self.budget_bytes:
+            return
+        self.entries[key] = (value, size, time.monotonic(), version)
+        self.size += size
+        while self.size > self.budget_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, key) -> None:
+        if key in self.entries:
+            self.stats["invalidations"] += 1
+            self._remove(key)
+
+    def clear(self) -> None:
+        for key in list(self.entries):
+            self._remove(key)
+
+    def _remove(self, key) -> None:
+        value, size, _, _ = self.entries.pop(key)
+        self.size -= size
+        self.releaser.submit(_release, [value])
@@ -0,0 +1,221 @@
+import bisect
+import functools
+import inspect
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets; the last is +Inf.
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf,
+)
+QUANTILES = (0.5, 0.95, 0.99)
+PROMETHEUS_SUFFIXES = (".prom", ".txt")
+# Characters of a series name shown in the debug panel's table.
+REPORT_NAME_WIDTH = 58
+
+
+class Histogram:
+    """Counts of observations per latency bucket, plus their count, sum and maximum."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate of the `q` quantile, interpolated within its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = min(self.buckets[index], self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+
+class Metrics:
+    """Latency histograms and counters for API calls and UI hot paths.
+
+    Series are named Prometheus style and told apart by labels, e.g.
+    `observe("api_request_seconds", 0.2, method="current_playback")`.
+    Collectors add gauges read from elsewhere (scheduler, caches, workers)
+    each time a snapshot is taken. Safe to record from any thread.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.collectors = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float, /, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name: str, amount=1, /, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name: str, /, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, /, **labels):
+        """Decorator recording each call's duration, for plain and async functions alike."""
+
+        def decorator(function):
+            if inspect.iscoroutinefunction(function):
+
+                @functools.wraps(function)
+                async def timed_coroutine(*args, **kwargs):
+                    with self.timer(name, **labels):
+                        return await function(*args, **kwargs)
+
+                return timed_coroutine
+
+            @functools.wraps(function)
+            def timed_function(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return function(*args, **kwargs)
+
+            return timed_function
+
+        return decorator
+
+    def add_collector(self, name: str, collect):
+        """Report `collect()`, a (nested) dict of numbers, as gauges prefixed with `name`."""
+        self.collectors[name] = collect
+
+    def gauges(self) -> dict:
+        gauges = {}
+        for name, collect in list(self.collectors.items()):
+            try:
+                _flatten(name, collect(), gauges)
+            except Exception as e:
+                print(f"Error collecting {name} metrics: {e}")
+        return gauges
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = {
+                _series(name, labels): {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "max": histogram.max,
+                    **{f"p{round(q * 100)}": histogram.quantile(q) for q in QUANTILES},
+                }
+                for (name, labels), histogram in sorted(self.histograms.items())
+            }
+            counters = {
+                _series(name, labels): value
+                for (name, labels), value in sorted(self.counters.items())
+            }
+        return {
+            "uptime_seconds": time.time() - self.started_at,
+            "histograms": histograms,
+            "counters": counters,
+            "gauges": self.gauges(),
+        }
+
+    def prometheus(self) -> str:
+        """All series in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        for name in dict.fromkeys(name for (name, _), _ in histograms):
+            lines.append(f"# TYPE {name} histogram")
+            for (series_name, labels), histogram in histograms:
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else repr(bound)
+                    lines.append(f"{_series(name + '_bucket', labels + (('le', le),))} {cumulative}")
+                lines.append(f"{_series(name + '_sum', labels)} {histogram.sum}")
+                lines.append(f"{_series(name + '_count', labels)} {histogram.count}")
+        for name in dict.fromkeys(name for (name, _), _ in counters):
+            lines.append(f"# TYPE {name} counter")
+            lines += [
+                f"{_series(name, labels)} {value}"
+                for (series_name, labels), value in counters if series_name == name
+            ]
+        for name, value in self.gauges().items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> str:
+        """A short human-readable table, for the debug panel."""
+        snapshot = self.snapshot()
+        lines = [f"{'latency':<{REPORT_NAME_WIDTH}} {'n':>6} {'p50':>7} {'p95':>7} {'p99':>7}"]
+        for series, histogram in snapshot["histograms"].items():
+            lines.append(
+                f"{series[:REPORT_NAME_WIDTH]:<{REPORT_NAME_WIDTH}} {histogram['count']:>6} "
+                + " ".join(f"{histogram[p] * 1000:>5.0f}ms" for p in ("p50", "p95", "p99"))
+            )
+        lines.append("")
+        for series, value in [*snapshot["counters"].items(), *snapshot["gauges"].items()]:
+            lines.append(
+                f"{series[:REPORT_NAME_WIDTH + 6]:<{REPORT_NAME_WIDTH + 6}} {_format_number(value):>10}"
+            )
+        return "\n".join(lines)
+
+    def write(self, path) -> None:
+        """Dump every series to `path`: Prometheus text for .prom or .txt, otherwise JSON."""
+        try:
+            with open(path, "w") as f:
+                if str(path).endswith(PROMETHEUS_SUFFIXES):
+                    f.write(self.prometheus())
+                else:
+                    json.dump(self.snapshot(), f, indent=1)
+        except Exception as e:
+            print(f"Error writing metrics: {e}")
+
+
+def _series(name: str, labels) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def _flatten(prefix: str, values, gauges: dict):
+    if isinstance(values, dict):
+        for key, value in values.items():
+            _flatten(f"{prefix}_{key}", value, gauges)
+    elif isinstance(values, (int, float)) and not isinstance(values, bool):
+        gauges[prefix] = values
+
+
+def _format_number(value) -> str:
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+
+metrics = Metrics()
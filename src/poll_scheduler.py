@@ -0,0 +1,56 @@
+import time
+
+from config_helper import get_default_poll_settings
+
+
+class Poll_Scheduler:
+    """Decides how long to wait before the next playback poll.
+
+    The "adaptive" policy polls rarely while paused or when no device is
+    active, sleeps through the rest of the current track (bounded by
+    `max_interval` so changes made on other devices are still picked up) and
+    is told to poll immediately after local control actions. The "fixed"
+    policy always waits `interval` seconds.
+    """
+
+    def __init__(self, poll_settings=None):
+        poll_settings = {**get_default_poll_settings(), **(poll_settings or {})}
+        self.policy = poll_settings["policy"]
+        self.interval = poll_settings["interval"]
+        self.min_interval = poll_settings["min_interval"]
+        self.max_interval = poll_settings["max_interval"]
+        self.paused_interval = poll_settings["paused_interval"]
+        self.idle_interval = poll_settings["idle_interval"]
+        self.track_end_margin = poll_settings["track_end_margin"]
+
+        self.started_at = time.monotonic()
+        self.stats = {"polls": 0, "immediate_polls": 0}
+
+    def next_delay(self, playback, now=None) -> float:
+        """Seconds to wait before polling, based on the current playback state."""
+        if self.policy == "fixed":
+            return self.interval
+
+        if playback.device_id is None:
+            return self.idle_interval
+        if not playback.is_playing:
+            return self.paused_interval
+        if playback.track_duration is None or playback.progress_ms is None:
+            return self.min_interval
+
+        now = time.time() if now is None else now
+        progress = playback.progress_ms
+        if playback.timestamp is not None:
+            progress += max(0, int(now * 1000) - playback.timestamp)
+        remaining = (playback.track_duration - progress) / 1000
+        delay = remaining - self.track_end_margin
+        return max(self.min_interval, min(self.max_interval, delay))
+
+    def record_poll(self, immediate=False):
+        self.stats["polls"] += 1
+        if immediate:
+            self.stats["immediate_polls"] += 1
+
+    def polls_per_minute(self) -> float:
+        minutes = (time.monotonic() - self.started_at) / 60
+        return self.stats["polls"] / minutes if minutes > 0 else 0.0
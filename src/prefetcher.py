@@ -0,0 +1,217 @@
+import asyncio
+from contextlib import aclosing
+
+from config_helper import get_default_prefetch_settings
+from spotify_client import background_requests
+from track_file import Mapped_Track_List
+
+# Playlists that can't be prefetched through get_playlist_tracks.
+NOT_PREFETCHED = {"saved_episodes"}
+# Recently opened playlists remembered, however many are warmed at idle.
+RECENT_LIMIT = 20
+
+
+class Prefetched_Pages:
+    """The batches a running prefetch has loaded so far, for a load of the same playlist to follow."""
+
+    def __init__(self):
+        self.batches = []
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Event()
+
+    def add(self, batch):
+        self.batches.append(batch)
+        self._wake()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self):
+        """Yield every batch, those already loaded first, until the prefetch ends."""
+        position = 0
+        while True:
+            changed = self._changed
+            while position < len(self.batches):
+                yield self.batches[position]
+                position += 1
+            if self.done:
+                return
+            await changed.wait()
+
+
+class Playlist_Prefetcher:
+    """Warms the playlist caches ahead of the user opening a playlist.
+
+    A sidebar item that stays highlighted (or hovered) for `delay` seconds
+    is loaded through `get_playlist_tracks`, which leaves it in the memory
+    cache and library store; moving the highlight cancels it. After
+    startup the most recently opened playlists can be warmed the same way.
+    Prefetches set `background_requests`, so their requests run on the
+    client's background executor, and at most `concurrency` run at a time.
+    Opening a playlist whose prefetch is already loading lets it finish:
+    `iter_playlist_tracks` follows its pages rather than loading them again.
+
+    `stats` counts each opened playlist as a hit if a prefetch had finished
+    loading it, or a miss otherwise; `hit_rate` is hits over opens.
+    """
+
+    def __init__(self, playback, prefetch_settings=None, recent=None):
+        prefetch_settings = {**get_default_prefetch_settings(), **(prefetch_settings or {})}
+        self.playback = playback
+        self.enabled = prefetch_settings["enabled"]
+        self.delay = prefetch_settings["delay"]
+        self.concurrency = prefetch_settings["concurrency"]
+        self.recent_count = prefetch_settings["recent_playlists"]
+        # Most recently opened first.
+        self.recent = list(recent or [])
+        self.prefetched = set()
+        self.tasks = {}
+        # Pages of each prefetch that has started loading, until it ends.
+        self.pages = {}
+        self.highlighted = None
+        self.highlight_task = None
+        self._semaphore = None
+        self.stats = {
+            "started": 0,
+            "completed": 0,
+            "cancelled": 0,
+            "failed": 0,
+            "hits": 0,
+            "misses": 0,
+            "followed": 0,
+        }
+
+    @property
+    def hit_rate(self) -> float:
+        opened = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / opened if opened else 0.0
+
+    def highlight(self, playlist_id):
+        """Prefetch `playlist_id` if it is still highlighted after `delay`; None clears it."""
+        if playlist_id == self.highlighted:
+            return
+        self.highlighted = playlist_id
+        if self.highlight_task is not None:
+            self.highlight_task.cancel()
+            self.highlight_task = None
+        if self.enabled and self._wanted(playlist_id):
+            self.highlight_task = self._start(playlist_id, self.delay)
+
+    def opened(self, playlist_id):
+        """Record that the user opened `playlist_id`; its own load takes over from here."""
+        if playlist_id in self.prefetched:
+            self.prefetched.discard(playlist_id)
+            self.stats["hits"] += 1
+        else:
+            self.stats["misses"] += 1
+        task = self.tasks.get(playlist_id)
+        if playlist_id in self.pages:
+            # Already loading: moving the highlight on mustn't cancel it now.
+            if task is self.highlight_task:
+                self.highlight_task = None
+        elif task is not None:
+            task.cancel()
+        if playlist_id in self.recent:
+            self.recent.remove(playlist_id)
+        self.recent.insert(0, playlist_id)
+        del self.recent[RECENT_LIMIT:]
+
+    async def iter_playlist_tracks(self, playlist_id):
+        """Yield a playlist's tracks as `playback.iter_playlist_tracks` does.
+
+        If a prefetch of it is loading, its pages are yielded as they
+        arrive instead. Should it stop part way (or turn out to have found a
+        track file, which it closed), the playlist is loaded here, less the
+        rows already yielded.
+        """
+        followed_rows = 0
+        pages = self.pages.get(playlist_id)
+        if pages is not None:
+            self.stats["followed"] += 1
+            # Being followed, it mustn't be cancelled when the highlight moves on.
+            if self.tasks.get(playlist_id) is self.highlight_task:
+                self.highlight_task = None
+            async with aclosing(pages.follow()) as batches:
+                async for batch in batches:
+                    followed_rows += len(batch)
+                    yield batch
+            if pages.batches and pages.error is None:
+                return
+        async with aclosing(self.playback.iter_playlist_tracks(playlist_id)) as batches:
+            async for batch in batches:
+                if followed_rows:
+                    skipped = min(followed_rows, len(batch))
+                    followed_rows -= skipped
+                    rest = batch[skipped:]
+                    if isinstance(batch, Mapped_Track_List):
+                        batch.close()
+                    batch = rest
+                    if not batch:
+                        continue
+                yield batch
+
+    async def prefetch_recent(self, open_playlist_id=None):
+        """Warm the `recent_playlists` most recently opened playlists, except the open one."""
+        if not self.enabled:
+            return
+        for playlist_id in self.recent[: self.recent_count]:
+            if playlist_id != open_playlist_id and self._wanted(playlist_id):
+                self._start(playlist_id, 0)
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+    def _wanted(self, playlist_id) -> bool:
+        return (
+            playlist_id is not None
+            and playlist_id not in NOT_PREFETCHED
+            and playlist_id not in self.prefetched
+            and playlist_id not in self.tasks
+        )
+
+    def _start(self, playlist_id, delay) -> asyncio.Task:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        task = asyncio.ensure_future(self._prefetch(playlist_id, delay))
+        self.tasks[playlist_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(playlist_id, None))
+        return task
+
+    async def _prefetch(self, playlist_id, delay):
+        pages = None
+        try:
+            await asyncio.sleep(delay)
+            async with self._semaphore:
+                pages = self.pages[playlist_id] = Prefetched_Pages()
+                self.stats["started"] += 1
+                # Only this task's context (and the tasks it starts) is affected.
+                background_requests.set(True)
+                async with aclosing(self.playback.iter_playlist_tracks(playlist_id)) as batches:
+                    async for batch in batches:
+                        if isinstance(batch, Mapped_Track_List):
+                            # Already on disk and current; nothing to keep open.
+                            batch.close()
+                        else:
+                            pages.add(batch)
+        except asyncio.CancelledError as e:
+            if pages is not None:
+                self.stats["cancelled"] += 1
+                pages.finish(e)
+            raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"Error prefetching playlist {playlist_id}: {e}")
+            if pages is not None:
+                pages.finish(e)
+            return
+        finally:
+            if pages is not None and self.pages.get(playlist_id) is pages:
+                del self.pages[playlist_id]
+        pages.finish()
+        self.stats["completed"] += 1
+        self.prefetched.add(playlist_id)
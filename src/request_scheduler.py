@@ -0,0 +1,152 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+from spotipy.exceptions import SpotifyException
+
+from config_helper import get_default_rate_limit_settings
+
+# Request classes, most urgent first.
+CONTROL, VISIBLE, POLL, PREFETCH = range(4)
+PRIORITY_NAMES = ["control", "visible", "poll", "prefetch"]
+
+# Tokens each class must leave in the bucket, so a burst of background
+# requests always leaves room for the next control action.
+RESERVED_TOKENS = [0, 1, 2, 3]
+# Wait after a 429 that came without a usable Retry-After header.
+DEFAULT_RETRY_AFTER = 1.0
+# After a 429 the rate is halved (to no less than MIN_RATE_FRACTION of the
+# configured one) and every request that succeeds adds RATE_RECOVERY back.
+MIN_RATE_FRACTION = 1 / 16
+RATE_RECOVERY = 0.1
+
+
+def retry_after(error: SpotifyException) -> float:
+    """Seconds a 429 response asked us to wait."""
+    try:
+        return max(0.0, float((error.headers or {}).get("Retry-After")))
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+class Request_Scheduler:
+    """Admits Web API requests in priority order under a client-side rate limit.
+
+    A token bucket (`rate` tokens a second, holding at most `burst`) spaces
+    requests out, and waiting requests are admitted most urgent class first:
+    user controls, then data on screen, then polling, then prefetching.
+    Lower classes must leave RESERVED_TOKENS in the bucket. A 429 stops
+    the class that got it, and every less urgent one, until its Retry-After
+    has passed; it drains the bucket down to what that class had to leave
+    for the more urgent ones, and halves the rate, which then creeps back up
+    while requests succeed. So a prefetch that runs into the limit holds
+    back prefetching, not the user's controls. The request is queued again,
+    up to `max_attempts` tries in all.
+
+    `stats` has, per class, the requests waiting now (`queued`), the most
+    that ever waited at once (`max_queued`), requests `sent`, 429s received
+    (`throttled`) and the total seconds spent waiting for a turn (`waited`).
+    """
+
+    def __init__(self, rate_limit_settings=None):
+        rate_limit_settings = {**get_default_rate_limit_settings(), **(rate_limit_settings or {})}
+        self.max_rate = rate_limit_settings["rate"]
+        self.rate = self.max_rate
+        self.burst = rate_limit_settings["burst"]
+        self.max_attempts = rate_limit_settings["max_attempts"]
+        self.tokens = float(self.burst)
+        self.refilled_at = time.monotonic()
+        # Per class: when it may send again after a 429.
+        self.blocked_until = [0.0] * len(PRIORITY_NAMES)
+        self.stats = {
+            name: {"queued": 0, "max_queued": 0, "sent": 0, "throttled": 0, "waited": 0.0}
+            for name in PRIORITY_NAMES
+        }
+        self._queue = []
+        self._sequence = itertools.count()
+        self._loop = None
+        self._dispatcher = None
+        self._wakeup = None
+
+    async def run(self, priority: int, send):
+        """Await `send()`, a coroutine function making one request, when `priority` gets a turn."""
+        stats = self.stats[PRIORITY_NAMES[priority]]
+        for attempt in range(self.max_attempts):
+            await self._turn(priority)
+            stats["sent"] += 1
+            try:
+                result = await send()
+            except SpotifyException as e:
+                if e.http_status != 429:
+                    raise
+                stats["throttled"] += 1
+                self._throttled(priority, retry_after(e))
+                if attempt == self.max_attempts - 1:
+                    raise
+                continue
+            self.rate = min(self.max_rate, self.rate + RATE_RECOVERY)
+            return result
+
+    def _throttled(self, priority: int, wait: float):
+        until = time.monotonic() + wait
+        for blocked in range(priority, len(PRIORITY_NAMES)):
+            self.blocked_until[blocked] = max(self.blocked_until[blocked], until)
+        self.tokens = min(self.tokens, float(RESERVED_TOKENS[priority]))
+        self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+
+    async def _turn(self, priority: int):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # A new event loop (e.g. a new app run); nothing from the old one survives.
+            self._loop = loop
+            self._queue = []
+            self._dispatcher = None
+            self._wakeup = asyncio.Event()
+        stats = self.stats[PRIORITY_NAMES[priority]]
+        waiter = loop.create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), waiter))
+        stats["queued"] += 1
+        stats["max_queued"] = max(stats["max_queued"], stats["queued"])
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = loop.create_task(self._dispatch())
+        else:
+            self._wakeup.set()
+        queued_at = time.monotonic()
+        try:
+            await waiter
+        finally:
+            stats["queued"] -= 1
+            stats["waited"] += time.monotonic() - queued_at
+
+    async def _dispatch(self):
+        while self._queue:
+            priority, _, waiter = self._queue[0]
+            if waiter.done():
+                # Cancelled while waiting.
+                heapq.heappop(self._queue)
+                continue
+            delay = self._delay(priority)
+            if delay > 0:
+                # Sleep until then, or until a new request arrives that may be more urgent.
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._queue)
+            self.tokens -= 1
+            waiter.set_result(None)
+
+    def _delay(self, priority: int) -> float:
+        """Seconds until a request of class `priority` may be sent (0 if now)."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+        if now < self.blocked_until[priority]:
+            return self.blocked_until[priority] - now
+        needed = min(1 + RESERVED_TOKENS[priority], self.burst)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
@@ -0,0 +1,302 @@
+import asyncio
+import collections
+import contextvars
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import spotipy
+from requests.adapters import HTTPAdapter
+from spotipy.exceptions import SpotifyException
+from urllib3.util.retry import Retry
+
+from metrics import metrics
+from request_scheduler import CONTROL, POLL, PREFETCH, VISIBLE, Request_Scheduler
+
+# True in tasks whose requests are speculative (prefetching). It is inherited
+# by every task they start, and sends their requests to the background executor.
+background_requests = contextvars.ContextVar("background_requests", default=False)
+
+# Scheduler classes of the requests not made for data on screen.
+CONTROL_METHODS = {
+    "start_playback", "pause_playback", "next_track", "previous_track", "volume",
+    "seek_track", "shuffle", "repeat", "transfer_playback", "add_to_queue",
+}
+POLL_METHODS = {"current_playback"}
+
+# Reads that are safe to share: concurrent identical calls make one request.
+COALESCED_METHODS = {
+    "me", "current_user", "current_playback", "playlist", "playlist_tracks",
+    "playlist_items", "current_user_playlists", "current_user_saved_albums",
+    "current_user_saved_tracks", "current_user_saved_episodes", "featured_playlists",
+    "episode",
+}
+# Reads whose result doesn't change during a session: made once, then memoized.
+MEMOIZED_METHODS = {"me", "current_user"}
+# spotipy methods that request the same endpoint.
+METHOD_ALIASES = {"current_user": "me"}
+
+# Each worker thread sends one request at a time, so its session keeps one
+# connection alive per host (the API and, in tests, the local fake).
+SESSION_POOL_HOSTS = 2
+SESSION_POOL_SIZE = 1
+
+
+class Thread_Sessions(requests.Session):
+    """A spotipy client's session that gives each thread a session of its own.
+
+    A requests.Session isn't made to be shared between threads, and every
+    executor thread sends requests through the same spotipy client. Each
+    thread instead gets a session with the client's retries, whose
+    connection pool keeps that thread's connections alive. It is a
+    requests.Session so spotipy takes it as its `requests_session`.
+    """
+
+    def __init__(self, max_retries):
+        super().__init__()
+        self.max_retries = max_retries
+        self.sessions = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=SESSION_POOL_HOSTS,
+                pool_maxsize=SESSION_POOL_SIZE,
+                max_retries=self.max_retries,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+            with self._lock:
+                self.sessions.append(session)
+        return session
+
+    def request(self, *args, **kwargs):
+        return self.session().request(*args, **kwargs)
+
+    def idle_connections(self) -> int:
+        """Connections open and waiting in the pools, ready to be reused."""
+        with self._lock:
+            sessions = list(self.sessions)
+        idle = 0
+        for session in sessions:
+            for adapter in set(session.adapters.values()):
+                for key in adapter.poolmanager.pools.keys():
+                    pool = adapter.poolmanager.pools.get(key)
+                    if pool is not None and pool.pool is not None:
+                        idle += sum(
+                            1 for conn in list(pool.pool.queue)
+                            if getattr(conn, "sock", None) is not None
+                        )
+        return idle
+
+    def close(self):
+        with self._lock:
+            sessions, self.sessions = self.sessions, []
+        for session in sessions:
+            session.close()
+        super().close()
+
+
+# The Thread_Sessions of each spotipy client built by `spotipy_client`.
+client_sessions = weakref.WeakKeyDictionary()
+
+
+def spotipy_client(**kwargs) -> spotipy.Spotify:
+    """Build a spotipy client whose requests go through Thread_Sessions.
+
+    Takes spotipy.Spotify's arguments, and builds the sessions' retries from
+    them the way spotipy builds its own. 429 is never retried: spotipy would
+    sleep out Retry-After inside the worker thread, so it is left to the
+    scheduler, which waits without holding a thread and holds back every
+    other request meanwhile.
+    """
+    kwargs.setdefault("retries", spotipy.Spotify.max_retries)
+    kwargs.setdefault("status_retries", spotipy.Spotify.max_retries)
+    kwargs.setdefault("backoff_factor", 0.3)
+    kwargs["status_forcelist"] = tuple(
+        code for code in kwargs.get("status_forcelist") or spotipy.Spotify.default_retry_codes
+        if code != 429
+    )
+    sessions = Thread_Sessions(Retry(
+        total=kwargs["retries"],
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+        status=kwargs["status_retries"],
+        backoff_factor=kwargs["backoff_factor"],
+        status_forcelist=kwargs["status_forcelist"],
+    ))
+    sp = spotipy.Spotify(requests_session=sessions, **kwargs)
+    client_sessions[sp] = sessions
+    return sp
+
+
+class Spotify_Client:
+    """Async front end for a spotipy client.
+
+    spotipy is built on blocking `requests` calls, so every Web API request is
+    sent through `call`, which runs it on the client's own executor of
+    `io_concurrency` threads and leaves the event loop free to handle input
+    and rendering while the request is in flight.
+
+    Bulk pagination goes through `call_paged` instead, which uses a separate
+    executor sized to `page_concurrency` so a large playlist download cannot
+    starve playback controls of worker threads. Requests made while
+    `background_requests` is set go to a third, smaller executor, so
+    speculative work never holds a thread the user is waiting for. When `sp`
+    was built by `spotipy_client`, each thread has its own keep-alive
+    session (see Thread_Sessions). `close()` stops the executors and closes
+    every connection on exit.
+
+    Every request is first admitted by a Request_Scheduler, which keeps the
+    client under the rate limit and lets controls go ahead of data, data
+    ahead of polling and polling ahead of prefetching.
+
+    Identical reads made while one is already in flight don't make another
+    request: they await the same task and get the same result object (which
+    callers must not modify). The request is cancelled only once every
+    caller waiting for it has been. Session constants such as the current
+    user are fetched once. `stats` counts requests sent, calls that joined
+    one in flight (`coalesced`) and calls answered from memory (`memoized`);
+    `executor_stats()` reports each executor's queue and busy threads.
+    """
+
+    def __init__(
+        self,
+        sp,
+        page_concurrency: int = 4,
+        background_concurrency: int = 1,
+        rate_limit_settings=None,
+        io_concurrency: int = 4,
+    ):
+        self.sp = sp
+        self.scheduler = Request_Scheduler(rate_limit_settings)
+        self.stats = {"requests": 0, "coalesced": 0, "memoized": 0}
+        self._in_flight = {}
+        self._waiters = collections.Counter()
+        self._memo = {}
+        # Clients built by `spotipy_client` have a session per thread; any
+        # other spotipy client shares its own session between the threads.
+        self.sessions = client_sessions.get(sp)
+        self.page_concurrency = page_concurrency
+        self.io_executor = ThreadPoolExecutor(
+            max_workers=io_concurrency, thread_name_prefix="spotify-io"
+        )
+        self.page_executor = ThreadPoolExecutor(
+            max_workers=page_concurrency, thread_name_prefix="spotify-pages"
+        )
+        self.background_executor = ThreadPoolExecutor(
+            max_workers=background_concurrency, thread_name_prefix="spotify-background"
+        )
+        self.executors = {
+            "io": self.io_executor,
+            "pages": self.page_executor,
+            "background": self.background_executor,
+        }
+        self._busy = collections.Counter()
+        self._busy_lock = threading.Lock()
+
+    async def call(self, method: str, *args, **kwargs):
+        """Run `self.sp.<method>(*args, **kwargs)` off the event loop."""
+        return await self._run(self.io_executor, method, args, kwargs)
+
+    async def call_paged(self, method: str, *args, **kwargs):
+        """Like `call`, but on the executor reserved for pagination."""
+        return await self._run(self.page_executor, method, args, kwargs)
+
+    async def _run(self, executor, method, args, kwargs):
+        if method not in COALESCED_METHODS:
+            return await self._send(executor, method, args, kwargs)
+        key = (METHOD_ALIASES.get(method, method), args, repr(sorted(kwargs.items())))
+        if key in self._memo:
+            self.stats["memoized"] += 1
+            return self._memo[key]
+
+        task = self._in_flight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._send(executor, method, args, kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(
+                lambda _: self._in_flight.pop(key) if self._in_flight.get(key) is task else None
+            )
+        else:
+            self.stats["coalesced"] += 1
+        self._waiters[task] += 1
+        try:
+            result = await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                # The last caller gave up: nobody wants the result any more.
+                task.cancel()
+        if method in MEMOIZED_METHODS:
+            self._memo[key] = result
+        return result
+
+    async def _send(self, executor, method, args, kwargs):
+        if background_requests.get():
+            executor = self.background_executor
+        function = functools.partial(self._in_worker, executor, method, args, kwargs)
+        loop = asyncio.get_running_loop()
+        self.stats["requests"] += 1
+        # From the call to the result, waits for a turn and a thread included.
+        with metrics.timer("api_call_seconds", method=method):
+            return await self.scheduler.run(
+                self.priority(method), lambda: loop.run_in_executor(executor, function)
+            )
+
+    def _in_worker(self, executor, method, args, kwargs):
+        with self._busy_lock:
+            self._busy[executor] += 1
+        try:
+            with metrics.timer("api_request_seconds", method=method):
+                return getattr(self.sp, method)(*args, **kwargs)
+        except SpotifyException as e:
+            metrics.count("api_errors_total", method=method, status=e.http_status)
+            raise
+        finally:
+            with self._busy_lock:
+                self._busy[executor] -= 1
+
+    def executor_stats(self) -> dict:
+        """Per executor: its threads, requests queued for a thread and threads busy.
+
+        Each busy thread holds one connection, so `connections_in_use` is
+        their total; `connections_idle` are kept alive for the next request.
+        """
+        stats = {
+            name: {
+                "workers": executor._max_workers,
+                "queued": executor._work_queue.qsize(),
+                "busy": self._busy[executor],
+            }
+            for name, executor in self.executors.items()
+        }
+        stats["connections_in_use"] = sum(self._busy.values())
+        stats["connections_idle"] = self.sessions.idle_connections() if self.sessions else 0
+        return stats
+
+    def close(self):
+        """Drop queued requests, wait for those in flight, then close every connection."""
+        for executor in self.executors.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+        if self.sessions is not None:
+            self.sessions.close()
+
+    @staticmethod
+    def priority(method: str) -> int:
+        if background_requests.get():
+            return PREFETCH
+        if method in CONTROL_METHODS:
+            return CONTROL
+        if method in POLL_METHODS:
+            return POLL
+        return VISIBLE
@@ -1,6 +1,6 @@
-import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 from config_helper import read_config, save_config, get_config_directory
+from spotify_client import spotipy_client
 
 CONFIG_FILE = "spotify_creds.conf"
 
@@ -8,8 +8,14 @@ CONFIG_FILE = "spotify_creds.conf"
 scope = 'user-read-playback-state,user-modify-playback-state,user-read-private,user-library-read'
 
 
-def authenticate_user():
-    """Authenticate the user with SpotifyOAuth."""
+def authenticate_user(verify=True):
+    """Authenticate the user with SpotifyOAuth.
+
+    With `verify=False`, saved credentials and a saved token, the client is
+    returned without the `sp.me()` round trip; the token is then checked by
+    the first request. Without a saved token the check always runs, because
+    it is what starts the interactive OAuth flow.
+    """
     credentials = read_config(CONFIG_FILE)
     if credentials is None:
         print("User not authenticated.")
@@ -31,15 +37,20 @@ def authenticate_user():
         redirect_uri = credentials["redirect_uri"]
 
     try:
-        sp = spotipy.Spotify(
-            auth_manager=SpotifyOAuth(
-                scope=scope,
-                client_id=client_id,
-                client_secret=client_secret,
-                redirect_uri=redirect_uri,
-                cache_path=f"{get_config_directory()}/.cache-{client_id}",
-            )
+        auth_manager = SpotifyOAuth(
+            scope=scope,
+            client_id=client_id,
+            client_secret=client_secret,
+            redirect_uri=redirect_uri,
+            cache_path=f"{get_config_directory()}/.cache-{client_id}",
         )
+        sp = spotipy_client(auth_manager=auth_manager)
+        if (
+            not verify
+            and credentials is not None
+            and auth_manager.cache_handler.get_cached_token() is not None
+        ):
+            return sp
         if sp.me() is not None:
             if credentials is None:
                 save_config(
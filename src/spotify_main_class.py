@@ -1,26 +1,243 @@
 from spotify_functions import authenticate_user
-from config_helper import get_config_directory, get_cache_directory
-import os
-import json
+from spotify_client import Spotify_Client, background_requests
+from library_store import Library_Store
+from track import Track, approximate_size, episode_from_api
+from track_file import Mapped_Track_List
+from memory_cache import Memory_Cache
+from config_helper import get_default_playlist_cache_settings
+from startup_profile import profiler
+from spotipy.exceptions import SpotifyException
+from contextlib import aclosing
 import time
 import asyncio
+import contextvars
+import hashlib
+import sys
+
+# Largest page sizes the Web API accepts for each kind of listing.
+PLAYLIST_PAGE_LIMIT = 100
+SAVED_ITEMS_PAGE_LIMIT = 50
+PAGE_ATTEMPTS = 3
+
+# Seconds an in-memory liked-songs set is trusted without asking the API, and
+# between full re-reads that catch tracks unliked elsewhere.
+LIKED_SYNC_INTERVAL = 30
+LIKED_RECONCILE_INTERVAL = 24 * 60 * 60
+
+# Seconds a snapshot_id seen in the playlist listing is trusted before a
+# playlist open asks the API for it again, and rows read from the library
+# store per batch when serving a cached playlist.
+SNAPSHOT_TRUST_INTERVAL = 30
+CACHE_BATCH_SIZE = 500
+
+# Seconds a cached library whose first pages still match is trusted before
+# the whole library is listed again.
+LIBRARY_RECONCILE_INTERVAL = 24 * 60 * 60
+LIKED_SONGS_ITEM = {"name": "Liked Songs", "id": "liked_songs", "type": "playlist"}
+
+# The saved episodes are cached like a playlist under this id. Having no
+# snapshot_id, a cached copy whose first page still matches is trusted for
+# SAVED_EPISODES_RECONCILE_INTERVAL seconds before they are all listed again.
+SAVED_EPISODES_ID = "saved_episodes"
+SAVED_EPISODES_RECONCILE_INTERVAL = 24 * 60 * 60
+# Bytes of full episode descriptions kept for the detail view.
+EPISODE_DETAILS_BUDGET = 2**20
+
+# Seconds a control's predicted playback state is kept over playback updates
+# that disagree with it (the server may not have applied the control yet)
+# before the server's state wins and the prediction is rolled back.
+PREDICTION_GRACE = 2.0
+
+# Playback attributes saved in the state snapshot for the next cold start.
+PLAYBACK_STATE_FIELDS = [
+    "device_id", "device_name", "device_is_active", "device_is_private_session",
+    "device_is_restricted", "device_type", "device_supports_volume",
+    "device_volume_percent", "shuffle", "smart_shuffle", "repeat", "timestamp",
+    "progress_ms", "currently_playing_type", "is_playing", "external_url",
+    "context_href", "context_type", "context_uri", "track", "track_id",
+    "track_uri", "track_explicit", "track_popularity", "track_preview_url",
+    "track_number", "track_duration", "album_name", "album_id",
+    "album_release_date", "album_total_tracks", "artists",
+]
+
+
+def _library_fingerprint(playlists_page: dict, albums_page: dict) -> str:
+    """Identify a library listing by its totals and its first page of playlists and albums."""
+    digest = hashlib.sha1()
+    for playlist in playlists_page["items"]:
+        digest.update(
+            f"{playlist['id']}\x1f{playlist['snapshot_id']}\x1f{playlist['name']}\x1e".encode()
+        )
+    for album in albums_page["items"]:
+        digest.update(f"{album['album']['id']}\x1f{album['album']['name']}\x1e".encode())
+    return f"{playlists_page['total']}:{albums_page['total']}:{digest.hexdigest()}"
+
+
+def _episodes_fingerprint(episodes_page: dict) -> str:
+    """Identify the saved episodes by their total and first (newest) page of ids."""
+    digest = hashlib.sha1()
+    for item in episodes_page["items"]:
+        digest.update(f"{item['episode']['id']}\x1e".encode())
+    return f"{episodes_page['total']}:{digest.hexdigest()}"
+
+
+class Prediction:
+    """Playback attributes a control is expected to change, set before the server confirms them."""
+
+    def __init__(self, fields: dict, previous: dict, expect):
+        self.fields = fields
+        self.previous = previous
+        self.expect = expect
+        self.made_at = time.monotonic()
+
 
 class Spotify_Playback_Data:
-    def __init__(self):
-        sp = authenticate_user()
+    def __init__(
+        self,
+        sp=None,
+        page_concurrency=4,
+        playlist_cache_settings=None,
+        state_snapshot=None,
+        background_concurrency=1,
+        rate_limit_settings=None,
+        io_concurrency=4,
+        store=None,
+    ):
+        # No request is made here: the token is checked by verify_user and
+        # playback state is read by the first update, both off the UI thread.
+        if sp is None:
+            with profiler.span("authenticate_user (token load)", "auth"):
+                sp = self._authenticate(verify=False)
+        self.reset_playback_data()
+        # True until the first update, while the state shown is restored or empty.
+        self.state_is_stale = True
+        self.sp = sp
+        self.api = Spotify_Client(
+            sp,
+            page_concurrency=page_concurrency,
+            background_concurrency=background_concurrency,
+            rate_limit_settings=rate_limit_settings,
+            io_concurrency=io_concurrency,
+        )
+        if store is None:
+            with profiler.span("open library store", "config"):
+                store = Library_Store()
+                store.migrate_json_cache()
+        self.store = store
+        cache_settings = {
+            **get_default_playlist_cache_settings(),
+            **(playlist_cache_settings or {}),
+        }
+        self.playlist_cache = Memory_Cache(
+            budget_bytes=int(cache_settings["budget_mb"] * 2**20),
+            ttl=cache_settings["ttl"],
+            sizeof=approximate_size,
+        )
+        self.episode_details = Memory_Cache(
+            budget_bytes=EPISODE_DETAILS_BUDGET,
+            ttl=cache_settings["ttl"],
+            sizeof=lambda details: sys.getsizeof(details["description"]),
+        )
+        self._listed_snapshot_ids = {}
+        self.cache_stats = {"hits": 0, "misses": 0, "revalidations": 0}
+        self._liked_songs = None
+        self._liked_synced_at = 0
+        self._liked_sync = None
+        self.predictions = []
+        self.prediction_stats = {"predicted": 0, "confirmed": 0, "rolled_back": 0}
+        if state_snapshot is not None:
+            self.restore_playback_state(state_snapshot.get("playback", {}))
+
+    def _authenticate(self, verify=True):
+        sp = authenticate_user(verify=verify)
         attempts = 0
         while sp is None:
-            sp = authenticate_user()
+            sp = authenticate_user(verify=verify)
             attempts += 1
             if attempts > 3:
                 print("Failed to authenticate after 3 attempts.")
                 raise Exception("Failed to authenticate after 3 attempts  - exiting.")
-        self.reset_playback_data()
-        self.sp = sp
-        self.update()
-
-    def update(self):
-        playback_data = self.sp.current_playback()
+        return sp
+
+    async def verify_user(self):
+        """Check the token works (refreshing it if needed) and return the user."""
+        return await self.api.call("me")
+
+    async def update(self):
+        playback_data = await self.api.call("current_playback")
+        self.set_playback_data(playback_data)
+        self.state_is_stale = False
+        self._reconcile()
+
+    def predict(self, fields: dict, checked=None, expect=None) -> Prediction:
+        """Set the playback attributes a control is about to change, before sending it.
+
+        The prediction holds until a playback update confirms it: `expect`,
+        called with this object after the update, returns True (by default,
+        when the server agrees on every field in `checked`, or on all of
+        `fields`). Until then `fields` are laid back over each update; after
+        PREDICTION_GRACE seconds without confirmation the server wins.
+        """
+        if expect is None:
+            names = list(fields) if checked is None else list(checked)
+            expect = lambda playback: all(getattr(playback, name) == fields[name] for name in names)
+        prediction = Prediction(fields, {name: getattr(self, name) for name in fields}, expect)
+        self._set_fields(fields)
+        self.predictions.append(prediction)
+        self.prediction_stats["predicted"] += 1
+        return prediction
+
+    def rollback(self, prediction: Prediction):
+        """Undo a prediction whose control request failed."""
+        if prediction in self.predictions:
+            self.predictions.remove(prediction)
+            self._set_fields(prediction.previous)
+            for later in self.predictions:
+                self._set_fields(later.fields)
+            self.prediction_stats["rolled_back"] += 1
+
+    def _reconcile(self):
+        """Check pending predictions against the playback state just read from the server."""
+        now = time.monotonic()
+        pending = []
+        confirmed_fields = set()
+        # Newest first: a confirmed prediction also settles older ones it overwrote.
+        for prediction in reversed(self.predictions):
+            if prediction.fields.keys() <= confirmed_fields or prediction.expect(self):
+                self.prediction_stats["confirmed"] += 1
+                confirmed_fields |= prediction.fields.keys()
+            elif now - prediction.made_at > PREDICTION_GRACE:
+                self.prediction_stats["rolled_back"] += 1
+            else:
+                pending.append(prediction)
+        self.predictions = pending[::-1]
+        for prediction in self.predictions:
+            self._set_fields(prediction.fields)
+
+    def _set_fields(self, fields: dict):
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def close(self):
+        """Finish the requests in flight and close the API connections, on exit."""
+        self.api.close()
+
+    def playback_state(self) -> dict:
+        """The playback attributes, for the state snapshot."""
+        return {field: getattr(self, field) for field in PLAYBACK_STATE_FIELDS}
+
+    def restore_playback_state(self, state: dict):
+        """Show the last session's playback state until the first update replaces it.
+
+        Playback is shown paused, so the progress bar doesn't run on from a
+        position that may be hours old.
+        """
+        for field in PLAYBACK_STATE_FIELDS:
+            setattr(self, field, state.get(field))
+        self.is_playing = False
+        self.state_is_stale = True
+
+    def set_playback_data(self, playback_data):
         if playback_data is None:
             print("No playback data available.")
             self.reset_playback_data()
@@ -139,36 +356,97 @@ class Spotify_Playback_Data:
         else:
             return None
 
-    def get_user_library(self):
+    async def get_user_library(self):
         """Get all user-related playlists, albums, and other items"""
         library = []
-        library.append({"name": "Liked Songs", "id": "liked_songs", "type": "playlist"})
-        user_playlists = self.sp.current_user_playlists()
-        library.extend(
-            [
-                {"name": playlist["name"], "id": playlist["id"], "type": "playlist"}
-                for playlist in user_playlists["items"]
-            ]
-        )
+        async with aclosing(self.iter_user_library()) as batches:
+            async for batch in batches:
+                library.extend(batch)
+        return library
 
-        saved_albums = self.sp.current_user_saved_albums()
-        library.extend(
-            [
-                {
-                    "name": album["album"]["name"],
-                    "id": album["album"]["id"],
-                    "type": "album",
-                }
-                for album in saved_albums["items"]
-            ]
+    async def iter_user_library(self):
+        """Yield the whole library in batches: Liked Songs, each page of playlists, then albums.
+
+        The first page of playlists and of saved albums is always fetched.
+        If their totals and items match the fingerprint of the cached
+        library, the cached copy is yielded in one batch and nothing more is
+        requested. Otherwise the remaining pages are streamed as they arrive
+        and the new listing is cached. Once the cached copy is older than
+        LIBRARY_RECONCILE_INTERVAL the library is re-listed regardless, to
+        pick up changes below the first page.
+        """
+        loop = asyncio.get_running_loop()
+        first_playlists, first_albums = await asyncio.gather(
+            self._fetch_page(
+                "current_user_playlists", limit=SAVED_ITEMS_PAGE_LIMIT, offset=0
+            ),
+            self._fetch_page(
+                "current_user_saved_albums", limit=SAVED_ITEMS_PAGE_LIMIT, offset=0
+            ),
+        )
+        listed_at = time.time()
+        fingerprint = _library_fingerprint(first_playlists, first_albums)
+        for playlist in first_playlists["items"]:
+            self._listed_snapshot_ids[playlist["id"]] = (playlist["snapshot_id"], listed_at)
+
+        cached = await loop.run_in_executor(None, self.store.load_library)
+        if cached is not None:
+            items, snapshot_ids, cached_fingerprint, fetched_at = cached
+            if (
+                cached_fingerprint == fingerprint
+                and listed_at - fetched_at < LIBRARY_RECONCILE_INTERVAL
+            ):
+                for playlist_id, snapshot_id in snapshot_ids.items():
+                    self._listed_snapshot_ids.setdefault(playlist_id, (snapshot_id, fetched_at))
+                yield [LIKED_SONGS_ITEM, *items]
+                return
+
+        items = []
+        snapshot_ids = {}
+        # Liked Songs heads the first batch.
+        pending = [LIKED_SONGS_ITEM]
+        async with aclosing(
+            self._iter_pages(
+                "current_user_playlists",
+                limit=SAVED_ITEMS_PAGE_LIMIT,
+                first_page=first_playlists,
+            )
+        ) as pages:
+            async for playlists in pages:
+                for playlist in playlists:
+                    snapshot_ids[playlist["id"]] = playlist["snapshot_id"]
+                    self._listed_snapshot_ids.setdefault(
+                        playlist["id"], (playlist["snapshot_id"], listed_at)
+                    )
+                batch = [
+                    {"name": playlist["name"], "id": playlist["id"], "type": "playlist"}
+                    for playlist in playlists
+                ]
+                items += batch
+                yield pending + batch
+                pending = []
+        async with aclosing(
+            self._iter_pages(
+                "current_user_saved_albums",
+                limit=SAVED_ITEMS_PAGE_LIMIT,
+                first_page=first_albums,
+            )
+        ) as pages:
+            async for albums in pages:
+                batch = [
+                    {"name": album["album"]["name"], "id": album["album"]["id"], "type": "album"}
+                    for album in albums
+                ]
+                items += batch
+                yield batch
+        await loop.run_in_executor(
+            None, self.store.save_library, items, snapshot_ids, fingerprint, listed_at
         )
 
-        return library
-
-    def get_featured_playlists(self, limit=5):
+    async def get_featured_playlists(self, limit=5):
         """Get featured playlists"""
         try:
-            featured = self.sp.featured_playlists(limit=limit)
+            featured = await self.api.call("featured_playlists", limit=limit)
         except Exception as e:
             print(f"Error fetching featured playlists: {e}")
             return []
@@ -181,133 +459,535 @@ class Spotify_Playback_Data:
         """Play a playlist given its ID"""
         await self.start_playback(context_uri=f"spotify:playlist:{playlist_id}")
 
-    def get_playlist_tracks(self, playlist_id: str) -> list[dict]:
+    async def get_playlist_tracks(self, playlist_id: str) -> list[Track]:
         """Get tracks from a playlist with efficient caching"""
         playlist_items = []
-        offset = 0
-        limit = 100 if playlist_id != "liked_songs" else 20
-        fetch_function = (
-            self.sp.playlist_tracks
-            if playlist_id != "liked_songs"
-            else self.sp.current_user_saved_tracks
-        )
-
-        if hasattr(self, '_playlist_cache') and playlist_id in self._playlist_cache:
-            return self._playlist_cache[playlist_id]
-
-        if not hasattr(self, '_playlist_cache'):
-            self._playlist_cache = {}
+        async with aclosing(self.iter_playlist_tracks(playlist_id)) as batches:
+            async for batch in batches:
+                if isinstance(batch, Mapped_Track_List):
+                    # The whole playlist, left on disk rather than read in.
+                    return batch
+                playlist_items.extend(batch)
+        return playlist_items
 
-        directory = get_cache_directory()
-        playlist_cache = os.path.join(directory, f"{playlist_id}.cache")
-        cache_valid = False
+    async def get_stale_playlist_tracks(self, playlist_id: str):
+        """Any cached copy of a playlist, without checking it is still current.
 
+        Used to draw the last open playlist at startup while the real
+        (validated) load runs. Returns None if nothing is cached.
+        """
+        cached_items = self.playlist_cache.get(playlist_id)
+        if cached_items is not None:
+            return cached_items
         try:
-            if os.path.exists(playlist_cache):
-                cache_time = os.path.getmtime(playlist_cache)
-                if time.time() - cache_time < 300:
-                    with open(playlist_cache, "r") as cache_file:
-                        cached_items = json.load(cache_file)
-                        self._playlist_cache[playlist_id] = cached_items
-                        return cached_items
+            loop = asyncio.get_running_loop()
+            if playlist_id == SAVED_EPISODES_ID:
+                cached = await loop.run_in_executor(None, self.store.load_saved_episodes)
+                return cached[0] if cached is not None else None
+            tracks = await loop.run_in_executor(None, self.store.open_track_file, playlist_id)
+            if tracks is not None:
+                return tracks
+            return await loop.run_in_executor(None, self.store.load_playlist, playlist_id)
         except Exception as e:
             print(f"Error reading cache: {e}")
+            return None
 
-        liked_songs = self._get_liked_songs()
+    async def iter_playlist_tracks(self, playlist_id: str):
+        """Yield a playlist's tracks in order, one batch per API page.
+
+        A cached copy is used while its snapshot_id matches the playlist's
+        current one. It is yielded whole as a Mapped_Track_List, whose rows
+        are read from the playlist's track file as they are drawn, or if
+        that file is missing or outdated, read from the library store
+        CACHE_BATCH_SIZE rows at a time (and the track file rewritten).
+        With nothing cached there is nothing to validate, so the snapshot_id
+        (needed to file the download) is fetched alongside the first page.
+        Closing the generator early (e.g. when the user switches playlist)
+        cancels the pages still in flight and skips writing the cache.
+        """
+        has_copy = playlist_id in self.playlist_cache or await self._store_has_snapshot(
+            playlist_id, None
+        )
+        # Liked Songs is versioned by the liked set, which downloading it
+        # brings up to date anyway: only a cached copy needs syncing first.
+        snapshot_task = None
+        if has_copy or playlist_id != "liked_songs":
+            snapshot_task = asyncio.ensure_future(self._current_snapshot_id(playlist_id))
+        loop = asyncio.get_running_loop()
+        try:
+            if has_copy:
+                snapshot_id = await snapshot_task
 
-        while True:
-            if playlist_id == "liked_songs":
-                playlist = fetch_function(limit=limit, offset=offset)
-            else:
-                playlist = fetch_function(playlist_id, limit=limit, offset=offset)
-            items = playlist["items"]
-
-            for item in items:
-                track = item["track"]
-                track_id = track["id"]
-                playlist_items.append(
-                    {
-                        "name": track["name"],
-                        "artists": [artist["name"] for artist in track["artists"]],
-                        "album": track["album"]["name"],
-                        "duration_ms": track["duration_ms"],
-                        "is_liked": track_id in liked_songs,
-                        "id": track_id,
-                    }
+                cached_items = self.playlist_cache.get(
+                    playlist_id, version=await self._cache_version(snapshot_id)
                 )
+                if cached_items is not None:
+                    self.cache_stats["hits"] += 1
+                    yield cached_items
+                    return
+
+                if await self._store_has_snapshot(playlist_id, snapshot_id):
+                    self.cache_stats["hits"] += 1
+                    mapped_items = await loop.run_in_executor(
+                        None, self.store.open_track_file, playlist_id, snapshot_id
+                    )
+                    if mapped_items is not None:
+                        # Not put in the memory cache: the page cache holds it.
+                        yield mapped_items
+                        return
+                    cached_items = []
+                    while True:
+                        batch = await loop.run_in_executor(
+                            None,
+                            self.store.load_playlist_rows,
+                            playlist_id,
+                            len(cached_items),
+                            CACHE_BATCH_SIZE,
+                        )
+                        cached_items.extend(batch)
+                        if batch:
+                            yield batch
+                        if len(batch) < CACHE_BATCH_SIZE:
+                            break
+                    self.playlist_cache.put(
+                        playlist_id, cached_items, version=await self._cache_version(snapshot_id)
+                    )
+                    await loop.run_in_executor(
+                        None, self.store.write_track_file, playlist_id, cached_items, snapshot_id
+                    )
+                    return
+
+            self.cache_stats["misses"] += 1
+            playlist_items = []
+            async with aclosing(self._iter_downloaded_tracks(playlist_id)) as batches:
+                async for batch in batches:
+                    playlist_items.extend(batch)
+                    yield batch
+            if snapshot_task is not None:
+                snapshot_id = await snapshot_task
+            else:
+                snapshot_id = await loop.run_in_executor(None, self.store.liked_snapshot_id)
+        finally:
+            if snapshot_task is not None:
+                snapshot_task.cancel()
 
-            if len(items) < limit:
-                break
-            offset += limit
+        self.playlist_cache.put(
+            playlist_id, playlist_items, version=await self._cache_version(snapshot_id)
+        )
+        await loop.run_in_executor(
+            None, self.store.save_playlist, playlist_id, playlist_items, snapshot_id
+        )
 
-        with open(playlist_cache, "w") as cache_file:
-            json.dump(playlist_items, cache_file)
+    async def _iter_downloaded_tracks(self, playlist_id: str):
+        """Yield a playlist's tracks from the API, one batch per page.
 
-        return playlist_items
+        A complete download of Liked Songs is also a full read of the liked
+        set, so it replaces the stored one rather than leaving a sync to
+        read it all again.
+        """
+        liked_tracks = None
+        if playlist_id == "liked_songs":
+            pages = self._iter_pages(
+                "current_user_saved_tracks", limit=SAVED_ITEMS_PAGE_LIMIT
+            )
+            liked_task = None
+            liked_tracks = []
+        else:
+            pages = self._iter_pages(
+                "playlist_tracks", playlist_id, limit=PLAYLIST_PAGE_LIMIT
+            )
+            # Liked state is needed for every row, so sync it alongside the first page.
+            liked_task = asyncio.ensure_future(self._get_liked_songs())
 
-    def _get_liked_songs(self):
-        """Get and cache liked songs"""
-        config_dir = get_config_directory()
-        liked_songs_file = os.path.join(config_dir, "liked_songs.json")
+        try:
+            async with aclosing(pages):
+                async for items in pages:
+                    liked_songs = await liked_task if liked_task is not None else None
+                    if liked_tracks is not None:
+                        liked_tracks += [
+                            {"id": item["track"]["id"], "added_at": item["added_at"]}
+                            for item in items
+                        ]
+                    yield [
+                        Track(
+                            name=item["track"]["name"],
+                            artists=[
+                                artist["name"] for artist in item["track"]["artists"]
+                            ],
+                            album=item["track"]["album"]["name"],
+                            duration_ms=item["track"]["duration_ms"],
+                            is_liked=(
+                                liked_songs is None or item["track"]["id"] in liked_songs
+                            ),
+                            id=item["track"]["id"],
+                        )
+                        for item in items
+                    ]
+        finally:
+            if liked_task is not None:
+                liked_task.cancel()
+
+        if liked_tracks is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                None, self.store.replace_liked_tracks, liked_tracks, time.time()
+            )
+            self._liked_songs = {track["id"] for track in liked_tracks}
+            self._liked_synced_at = time.time()
 
-        if os.path.exists(liked_songs_file):
-            with open(liked_songs_file, "r") as f:
-                cached_liked_songs = json.load(f)
-            total_liked = self.sp.current_user_saved_tracks(limit=1)["total"]
-            if len(cached_liked_songs) == total_liked:
-                return set(cached_liked_songs)
+    async def _current_snapshot_id(self, playlist_id):
+        """The playlist's current snapshot_id, or None if it couldn't be found out.
 
-        liked_songs = []
-        offset = 0
-        limit = 20
+        A snapshot_id from a recent `current_user_playlists` listing is used
+        as is; otherwise one small metadata request fetches it. Liked Songs
+        has no snapshot_id, so its version comes from the incremental liked
+        songs sync instead.
+        """
+        if playlist_id == "liked_songs":
+            self.cache_stats["revalidations"] += 1
+            try:
+                await self._get_liked_songs()
+            except Exception as e:
+                print(f"Error syncing liked songs: {e}")
+                return None
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.store.liked_snapshot_id)
+
+        listed = self._listed_snapshot_ids.get(playlist_id)
+        if listed is not None and time.time() - listed[1] < SNAPSHOT_TRUST_INTERVAL:
+            return listed[0]
+
+        self.cache_stats["revalidations"] += 1
+        try:
+            playlist = await self.api.call("playlist", playlist_id, fields="snapshot_id")
+        except Exception as e:
+            print(f"Error fetching snapshot_id for {playlist_id}: {e}")
+            return None
+        self._listed_snapshot_ids[playlist_id] = (playlist["snapshot_id"], time.time())
+        return playlist["snapshot_id"]
 
-        while True:
-            results = self.sp.current_user_saved_tracks(limit=limit, offset=offset)
-            items = results["items"]
-            liked_songs.extend([track["track"]["id"] for track in items])
-            if len(items) < limit:
-                break
-            offset += limit
+    async def _cache_version(self, snapshot_id):
+        """The memory cache version of a playlist at `snapshot_id`.
 
-        with open(liked_songs_file, "w") as f:
-            json.dump(liked_songs, f)
+        Cached rows carry liked flags, so the version pairs the snapshot_id
+        with the liked set's version. None (any version) if the snapshot_id
+        is unknown.
+        """
+        if snapshot_id is None:
+            return None
+        loop = asyncio.get_running_loop()
+        liked_version = await loop.run_in_executor(None, self.store.liked_snapshot_id)
+        return (snapshot_id, liked_version)
 
-        return set(liked_songs)
+    async def _store_has_snapshot(self, playlist_id, snapshot_id):
+        """Whether the library store's copy of the playlist is at `snapshot_id`.
 
-    def get_saved_episodes(self):
+        With no snapshot_id to compare against (the API couldn't be asked)
+        any stored copy is better than none.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+            if snapshot_id is None:
+                fetched_at = await loop.run_in_executor(
+                    None, self.store.playlist_fetched_at, playlist_id
+                )
+                return fetched_at is not None
+            stored_snapshot_id = await loop.run_in_executor(
+                None, self.store.playlist_snapshot_id, playlist_id
+            )
+        except Exception as e:
+            print(f"Error reading cache: {e}")
+            return False
+        return stored_snapshot_id == snapshot_id
+
+    async def _fetch_all_pages(self, method, *args, limit):
+        """Fetch every item of a paginated endpoint, in order."""
+        items = []
+        async with aclosing(self._iter_pages(method, *args, limit=limit)) as pages:
+            async for page_items in pages:
+                items.extend(page_items)
+        return items
+
+    async def _iter_pages(self, method, *args, limit, first_page=None):
+        """Yield the items of each page of a paginated endpoint, in order.
+
+        The first page (fetched here unless the caller already has it) tells
+        us `total`; the remaining offsets are then requested concurrently on
+        the pagination executor, at most `page_concurrency` at a time, and
+        yielded as soon as every earlier page has been.
+        """
+        if first_page is None:
+            first_page = await self._fetch_page(method, *args, limit=limit, offset=0)
+        yield first_page["items"]
+
+        semaphore = asyncio.Semaphore(self.api.page_concurrency)
+
+        async def fetch(offset):
+            async with semaphore:
+                return await self._fetch_page(method, *args, limit=limit, offset=offset)
+
+        tasks = [
+            asyncio.ensure_future(fetch(offset))
+            for offset in range(limit, first_page["total"], limit)
+        ]
+        try:
+            for task in tasks:
+                yield (await task)["items"]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _fetch_page(self, method, *args, limit, offset):
+        """Fetch one page, retrying server errors and dropped connections with backoff."""
+        for attempt in range(PAGE_ATTEMPTS):
+            try:
+                return await self.api.call_paged(
+                    method, *args, limit=limit, offset=offset
+                )
+            except SpotifyException as e:
+                # 429s were already retried by the request scheduler.
+                if e.http_status < 500:
+                    raise
+                error = e
+            except Exception as e:
+                error = e
+            print(f"Error fetching {method} page at offset {offset}: {error}")
+            if attempt < PAGE_ATTEMPTS - 1:
+                await asyncio.sleep(0.5 * 2**attempt)
+        raise error
+
+    async def _get_liked_songs(self):
+        """Get the set of liked track ids, syncing the local copy incrementally.
+
+        The library store keeps every liked id with its `added_at`. A sync
+        reads newest-first pages only until it meets a track it already
+        knows, which in steady state is a single request. Unlikes don't
+        show up in those pages, but they leave the API's `total` short of
+        the ids known: when the pages read cover the whole library the
+        missing ids are dropped at once, and otherwise they are found by
+        `_find_unliked_ids`. A full re-read is done when that can't place
+        them, and once the copy has not been reconciled for
+        LIKED_RECONCILE_INTERVAL seconds.
+        """
+        if (
+            self._liked_songs is not None
+            and time.time() - self._liked_synced_at < LIKED_SYNC_INTERVAL
+        ):
+            return self._liked_songs
+        # Callers arriving while a sync runs share it rather than starting
+        # another, so it runs at foreground priority even if a prefetch started it.
+        if self._liked_sync is None or self._liked_sync.done():
+            context = contextvars.copy_context()
+            context.run(background_requests.set, False)
+            self._liked_sync = asyncio.get_running_loop().create_task(
+                self._sync_liked_songs(), context=context
+            )
+        return await asyncio.shield(self._liked_sync)
+
+    async def _sync_liked_songs(self):
+        loop = asyncio.get_running_loop()
+        known_ids = await loop.run_in_executor(None, self.store.load_liked_track_ids)
+        reconciled_at = await loop.run_in_executor(None, self.store.liked_reconciled_at)
+        reconcile_due = time.time() - reconciled_at > LIKED_RECONCILE_INTERVAL
+
+        if known_ids and not reconcile_due:
+            new_tracks = []
+            seen_ids = set()
+            offset = 0
+            while True:
+                page = await self._fetch_page(
+                    "current_user_saved_tracks",
+                    limit=SAVED_ITEMS_PAGE_LIMIT,
+                    offset=offset,
+                )
+                seen_ids |= {item["track"]["id"] for item in page["items"]}
+                reached_known = False
+                for item in page["items"]:
+                    if item["track"]["id"] in known_ids:
+                        reached_known = True
+                        break
+                    new_tracks.append(
+                        {"id": item["track"]["id"], "added_at": item["added_at"]}
+                    )
+                offset += SAVED_ITEMS_PAGE_LIMIT
+                if reached_known or offset >= page["total"]:
+                    break
+
+            if new_tracks:
+                await loop.run_in_executor(None, self.store.add_liked_tracks, new_tracks)
+                known_ids |= {track["id"] for track in new_tracks}
+            removed_ids = set()
+            if offset >= page["total"] and len(known_ids) != page["total"]:
+                # Every liked track was in the pages read, so whatever
+                # else is known has been unliked.
+                removed_ids = known_ids - seen_ids
+            elif len(known_ids) > page["total"]:
+                newest_first = await loop.run_in_executor(
+                    None, self.store.load_liked_track_order
+                )
+                removed_ids = await self._find_unliked_ids(newest_first, page["total"])
+                if removed_ids is None:
+                    removed_ids = set()
+                    reconcile_due = True
+            elif len(known_ids) < page["total"]:
+                # Likes the newest pages didn't show: only a full read finds them.
+                reconcile_due = True
+            if removed_ids:
+                await loop.run_in_executor(None, self.store.remove_liked_tracks, removed_ids)
+                known_ids -= removed_ids
+
+        if not known_ids or reconcile_due:
+            items = await self._fetch_all_pages(
+                "current_user_saved_tracks", limit=SAVED_ITEMS_PAGE_LIMIT
+            )
+            tracks = [
+                {"id": item["track"]["id"], "added_at": item["added_at"]}
+                for item in items
+            ]
+            await loop.run_in_executor(
+                None, self.store.replace_liked_tracks, tracks, time.time()
+            )
+            known_ids = {track["id"] for track in tracks}
+
+        self._liked_songs = known_ids
+        self._liked_synced_at = time.time()
+        return self._liked_songs
+
+    async def _find_unliked_ids(self, newest_first: list, total: int):
+        """The ids in `newest_first` (the stored order) that the API's `total` no longer lists.
+
+        Up to an unliked track the API's listing lines up with the stored
+        order, and past it is shifted by one. One-item probes bisect the
+        offsets down to the stretches holding such shifts, which are read
+        whole: a handful of requests for an unlike, however large the
+        library. Returns None if the listing doesn't line up with the
+        stored order, so the caller re-reads it all.
+        """
+        positions = {track_id: position for position, track_id in enumerate(newest_first)}
+        unliked_ids = set()
+
+        async def search(start, end, shift_before, shift_after):
+            # Offsets [start, end) are stored positions
+            # [start + shift_before, end + shift_after).
+            if shift_before == shift_after:
+                return
+            stored = newest_first[start + shift_before:end + shift_after]
+            if end - start <= SAVED_ITEMS_PAGE_LIMIT:
+                listed = set()
+                if end > start:
+                    page = await self._fetch_page(
+                        "current_user_saved_tracks", limit=end - start, offset=start
+                    )
+                    listed = {item["track"]["id"] for item in page["items"]}
+                if not listed <= set(stored) or len(listed) != end - start:
+                    raise ValueError("liked songs listing doesn't match the stored order")
+                unliked_ids.update(set(stored) - listed)
+                return
+            middle = (start + end) // 2
+            page = await self._fetch_page("current_user_saved_tracks", limit=1, offset=middle)
+            position = None
+            if page["items"]:
+                position = positions.get(page["items"][0]["track"]["id"])
+            if position is None or not shift_before <= position - middle <= shift_after:
+                raise ValueError("liked songs listing doesn't match the stored order")
+            await search(start, middle, shift_before, position - middle)
+            await search(middle, end, position - middle, shift_after)
+
+        try:
+            await search(0, total, 0, len(newest_first) - total)
+        except ValueError as e:
+            print(f"Error finding unliked songs: {e}")
+            return None
+        return unliked_ids
+
+    async def get_saved_episodes(self):
         """Get user's saved episodes"""
         episodes = []
-        offset = 0
-        limit = 20
-
-        while True:
-            results = self.sp.current_user_saved_episodes(limit=limit, offset=offset)
-            items = results["items"]
-            for item in items:
-                episode = item["episode"]
-                episodes.append({
-                    "name": episode["name"],
-                    "id": episode["id"],
-                    "duration_ms": episode["duration_ms"],
-                    "show": episode["show"]["name"],
-                    "description": episode["description"],
-                    "type": "episode"
-                })
-            if len(items) < limit:
-                break
-            offset += limit
-
+        async with aclosing(self.iter_saved_episodes()) as batches:
+            async for batch in batches:
+                episodes.extend(batch)
         return episodes
 
+    async def iter_saved_episodes(self):
+        """Yield the saved episodes in order, one batch per API page.
+
+        The first page (newest first) is always fetched. If its total and
+        ids match the cached copy's, the cached copy (from memory, or else
+        the library store) is yielded in one batch and nothing more is
+        requested. Otherwise the remaining pages stream in as they arrive
+        and the new listing is cached. Episodes are reduced to what the
+        table shows as they arrive; `get_episode_details` has the rest.
+        """
+        loop = asyncio.get_running_loop()
+        first_page = await self._fetch_page(
+            "current_user_saved_episodes", limit=SAVED_ITEMS_PAGE_LIMIT, offset=0
+        )
+        listed_at = time.time()
+        fingerprint = _episodes_fingerprint(first_page)
+
+        cached_items = self.playlist_cache.get(SAVED_EPISODES_ID, version=fingerprint)
+        if cached_items is not None:
+            self.cache_stats["hits"] += 1
+            yield cached_items
+            return
+        try:
+            cached = await loop.run_in_executor(None, self.store.load_saved_episodes)
+        except Exception as e:
+            print(f"Error reading cache: {e}")
+            cached = None
+        if cached is not None:
+            cached_items, cached_fingerprint, fetched_at = cached
+            if (
+                cached_fingerprint == fingerprint
+                and listed_at - fetched_at < SAVED_EPISODES_RECONCILE_INTERVAL
+            ):
+                self.cache_stats["hits"] += 1
+                self.playlist_cache.put(SAVED_EPISODES_ID, cached_items, version=fingerprint)
+                yield cached_items
+                return
+
+        self.cache_stats["misses"] += 1
+        episodes = []
+        async with aclosing(
+            self._iter_pages(
+                "current_user_saved_episodes",
+                limit=SAVED_ITEMS_PAGE_LIMIT,
+                first_page=first_page,
+            )
+        ) as pages:
+            async for items in pages:
+                batch = [episode_from_api(item["episode"]) for item in items]
+                episodes += batch
+                yield batch
+        self.playlist_cache.put(SAVED_EPISODES_ID, episodes, version=fingerprint)
+        await loop.run_in_executor(
+            None, self.store.save_saved_episodes, episodes, fingerprint, listed_at
+        )
+
+    async def get_episode_details(self, episode_id: str) -> dict:
+        """An episode's name, show, release date and full description, fetched once."""
+        details = self.episode_details.get(episode_id)
+        if details is None:
+            episode = await self.api.call("episode", episode_id)
+            details = {
+                "name": episode["name"],
+                "show": episode["show"]["name"],
+                "release_date": episode.get("release_date", ""),
+                "duration_ms": episode["duration_ms"],
+                "description": episode.get("description", ""),
+            }
+            self.episode_details.put(episode_id, details)
+        return details
+
     async def play_track(self, uri, playlist_id=None):
         """Play a song or episode given its URI, optionally within a playlist context"""
         if playlist_id == "liked_songs":
-            user_id = self.sp.current_user()["id"]
+            user_id = (await self.api.call("current_user"))["id"]
             await self.start_playback(
                 context_uri=f"spotify:user:{user_id}:collection",
                 offset={"uri": f"spotify:track:{uri}"}
             )
-        elif playlist_id == "saved_episodes":
+        elif playlist_id == SAVED_EPISODES_ID:
             await self.start_playback(uris=[f"spotify:episode:{uri}"])
         elif playlist_id:
             await self.start_playback(
@@ -319,26 +999,21 @@ class Spotify_Playback_Data:
 
     async def start_playback(self, **kwargs):
         """Asynchronously start playback."""
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, self.sp.start_playback, **kwargs)
+        await self.api.call("start_playback", **kwargs)
 
     async def pause_playback(self, **kwargs):
         """Asynchronously pause playback."""
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, self.sp.pause_playback, **kwargs)
+        await self.api.call("pause_playback", **kwargs)
 
     async def next_track(self, **kwargs):
         """Asynchronously skip to the next track."""
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, self.sp.next_track, **kwargs)
+        await self.api.call("next_track", **kwargs)
 
     async def previous_track(self, **kwargs):
         """Asynchronously go back to the previous track."""
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, self.sp.previous_track, **kwargs)
+        await self.api.call("previous_track", **kwargs)
 
     async def set_volume(self, volume_percent: int):
         """Asynchronously set the device volume, ensuring it's between 0 and 100."""
         volume_percent = max(0, min(100, volume_percent))
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, self.sp.volume, volume_percent)
+        await self.api.call("volume", volume_percent)
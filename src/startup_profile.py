@@ -0,0 +1,186 @@
+import builtins
+import json
+import platform
+import sys
+import time
+from contextlib import contextmanager
+from importlib import metadata
+
+PROFILE_FLAG = "--profile-startup"
+DEFAULT_TRACE_PATH = "startup_profile.json"
+# Imports shorter than this are left out of the table (they stay in the trace).
+TABLE_IMPORT_THRESHOLD = 0.001
+
+
+class Startup_Profiler:
+    """Records a timeline of startup phases: import, config, auth, compose and first data.
+
+    main.py imports this module before anything else, so the clock starts
+    with the process and, when profiling, every first import of a package is
+    timed by wrapping `__import__`. Spans and marks are kept in seconds since
+    that start. When disabled every method is a no-op, so the hooks can stay
+    in the startup path.
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.marks = []
+        self._import_depth = 0
+        self._original_import = None
+        if enabled:
+            self.start_timing_imports()
+
+    def _now(self) -> float:
+        return time.perf_counter() - self.origin
+
+    def record(self, name: str, category: str, start: float, end: float = None, depth=0):
+        """Record a span from `start` to `end` (default now), in seconds since startup."""
+        if self.enabled:
+            self.spans.append((name, category, start, self._now() if end is None else end, depth))
+
+    @contextmanager
+    def span(self, name: str, category: str):
+        if not self.enabled:
+            yield
+            return
+        start = self._now()
+        try:
+            yield
+        finally:
+            self.record(name, category, start)
+
+    def mark(self, name: str, category: str, at: float = None):
+        if self.enabled:
+            self.marks.append((name, category, self._now() if at is None else at))
+
+    def start_timing_imports(self):
+        """Time the first import of each top-level package, nested ones one level deeper."""
+        original_import = builtins.__import__
+        self._original_import = original_import
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            package = name.partition(".")[0]
+            if level or package in sys.modules:
+                return original_import(name, globals, locals, fromlist, level)
+            start = self._now()
+            self._import_depth += 1
+            try:
+                return original_import(name, globals, locals, fromlist, level)
+            finally:
+                self._import_depth -= 1
+                self.record(f"import {package}", "import", start, depth=self._import_depth)
+
+        builtins.__import__ = timed_import
+
+    def stop_timing_imports(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def add_startup_graph(self, graph):
+        """Merge the startup graph's load timings and marks into the timeline."""
+        if not self.enabled:
+            return
+        offset = graph.started_at - self.origin
+        for name, (start, end) in graph.timings.items():
+            category = "auth" if name == "auth" else "first data"
+            self.record(f"load {name}", category, start + offset, end + offset)
+        for name, at in graph.marks.items():
+            self.mark(name, "compose" if name == "first paint" else "first data", at + offset)
+
+    def phase_totals(self) -> dict:
+        """Wall time covered by each category, overlapping spans counted once."""
+        totals = {}
+        for category in dict.fromkeys(span[1] for span in self.spans):
+            intervals = sorted(
+                (start, end) for _, span_category, start, end, _ in self.spans
+                if span_category == category
+            )
+            covered, reached = 0.0, float("-inf")
+            for start, end in intervals:
+                if end > reached:
+                    covered += end - max(start, reached)
+                    reached = end
+            totals[category] = covered
+        return totals
+
+    def table(self) -> str:
+        """A human-readable timeline, in ms since the process started."""
+        lines = [f"{'phase':<12} {'step':<36} {'start':>8} {'end':>8} {'took':>8}"]
+        rows = [
+            span for span in self.spans
+            if span[1] != "import"
+            or (span[4] <= 1 and span[3] - span[2] >= TABLE_IMPORT_THRESHOLD)
+        ]
+        for name, category, start, end, depth in sorted(rows, key=lambda span: span[2]):
+            step = "  " * depth + name
+            lines.append(
+                f"{category:<12} {step:<36} {start * 1000:>8.0f} {end * 1000:>8.0f} "
+                f"{(end - start) * 1000:>8.0f}"
+            )
+        for name, category, at in sorted(self.marks, key=lambda mark: mark[2]):
+            lines.append(f"{category:<12} {name:<36} {'':>8} {at * 1000:>8.0f}")
+        lines.append("")
+        for category, total in self.phase_totals().items():
+            lines.append(f"{category:<12} {total * 1000:>8.0f}ms")
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> dict:
+        """The timeline in Chrome trace event format (chrome://tracing, Perfetto)."""
+        try:
+            version = metadata.version("spotify-textualize")
+        except metadata.PackageNotFoundError:
+            version = "unknown"
+        events = [
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round(start * 1e6),
+                "dur": round((end - start) * 1e6),
+                "pid": 1,
+                "tid": 1,
+            }
+            for name, category, start, end, _ in self.spans
+        ]
+        events += [
+            {
+                "name": name,
+                "cat": category,
+                "ph": "i",
+                "s": "g",
+                "ts": round(at * 1e6),
+                "pid": 1,
+                "tid": 1,
+            }
+            for name, category, at in self.marks
+        ]
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "version": version,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "phases_ms": {
+                    category: round(total * 1000, 1)
+                    for category, total in self.phase_totals().items()
+                },
+            },
+        }
+
+    def write_chrome_trace(self, path: str) -> None:
+        try:
+            with open(path, "w") as f:
+                json.dump(self.chrome_trace(), f, indent=1)
+        except Exception as e:
+            print(f"Error writing startup profile: {e}")
+
+
+# Decided from the raw arguments: the flag has to take effect before
+# main.py's own imports run, long before argparse sees it.
+profiler = Startup_Profiler(
+    enabled=any(arg.partition("=")[0] == PROFILE_FLAG for arg in sys.argv[1:])
+)
@@ -0,0 +1,38 @@
+import json
+import os
+import time
+
+from config_helper import get_cache_directory
+
+STATE_VERSION = 1
+
+
+def state_snapshot_path() -> str:
+    return os.path.join(get_cache_directory(), "last_state.json")
+
+
+def load_state_snapshot():
+    """Return the state saved when the last session closed, or None if there isn't a usable one."""
+    try:
+        with open(state_snapshot_path(), "r") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error reading state snapshot: {e}")
+        return None
+    if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+        return None
+    return state
+
+
+def save_state_snapshot(state: dict) -> None:
+    """Save `state` (playback, sidebar libraries, open playlist) for the next cold start."""
+    path = state_snapshot_path()
+    temporary_path = f"{path}.tmp"
+    try:
+        with open(temporary_path, "w") as f:
+            json.dump({**state, "version": STATE_VERSION, "saved_at": time.time()}, f)
+        os.replace(temporary_path, path)
+    except Exception as e:
+        print(f"Error saving state snapshot: {e}")
@@ -1,9 +1,16 @@
 import pytest
 from unittest.mock import patch, AsyncMock
 from textual.app import App
+from textual.widgets import ListItem
 from main import MainApp, Main_Screen
 from spotify_main_class import Spotify_Playback_Data
+from spotify_client import Spotify_Client
+from fake_spotify_api import Fake_Spotify_API, make_track, make_episode
+from poll_scheduler import Poll_Scheduler
+from types import SimpleNamespace
 import asyncio
+import time
+import os
 
 @pytest.mark.asyncio
 async def test_play_pause():
@@ -15,6 +22,9 @@ async def test_play_pause():
     with patch.object(playback.sp, 'start_playback', new_callable=AsyncMock) as mock_start, \
          patch.object(playback.sp, 'pause_playback', new_callable=AsyncMock) as mock_pause:
         async with app.run_test() as pilot:
+            # Playback state is loaded after mount; start from "paused" once it has been.
+            await app.startup.result("playback")
+            playback.is_playing = False
             assert not playback.is_playing
 
             await pilot.press("space")
@@ -81,7 +91,7 @@ async def test_select_track(mock_play_track):
     mock_play_track.return_value = None
     app = MainApp()
     async with app.run_test() as pilot:
-        await pilot.click("#playlist_tracks DataTable")
+        await pilot.click("#playlist_tracks Track_Table")
         await pilot.press("enter")
         mock_play_track.assert_awaited_once()
 
@@ -117,7 +127,7 @@ async def test_empty_playlist(mock_get_tracks):
     async with app.run_test() as pilot:
         await pilot.click("#featured_playlists_list ListView ListItem")
         assert len(app.playback.get_playlist_tracks(app.playback.track_id)) == 0
-        empty_message_panel = app.query_one("#playlist_tracks DataTable").render()
+        empty_message_panel = app.query_one("#playlist_tracks Track_Table").render()
         empty_message = empty_message_panel.renderable.renderable if hasattr(empty_message_panel.renderable, 'renderable') else ""
         assert "No tracks available" in empty_message
 
@@ -131,3 +141,1113 @@ async def test_error_handling():
                 screen: Main_Screen = app.query_one(Main_Screen)
                 await screen.on_mount()
                 mock_print.assert_called_with("Error updating playback data: Playback data unavailable")
+
+@pytest.mark.asyncio
+async def test_keypress_latency_with_slow_api():
+    """Key presses are handled as fast with 750ms API latency as with none."""
+
+    async def press_latencies(pilot, count=3):
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            await pilot.press("tab")
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    with Fake_Spotify_API() as api:
+        app = MainApp()
+        app.playback.api = Spotify_Client(api.client())
+        async with app.run_test() as pilot:
+            await pilot.pause()
+            baseline = await press_latencies(pilot)
+
+            api.latency = 0.75
+            poll = asyncio.create_task(app.screen.update_stats())
+            slow = await press_latencies(pilot, count=2)
+            poll_in_flight = not poll.done()
+            await poll
+
+            assert poll_in_flight
+            assert max(slow) < max(baseline) + 0.1
+
+
+def test_adaptive_polling_reduces_requests():
+    """An hour of continuous playback polls an order of magnitude less than a fixed 2s timer."""
+
+    def simulate_hour(scheduler):
+        playback = SimpleNamespace(
+            device_id="device", is_playing=True, track_duration=240000,
+            progress_ms=0, timestamp=0,
+        )
+        now = 0.0
+        while now < 3600:
+            playback.progress_ms = int(now * 1000) % playback.track_duration
+            playback.timestamp = int(now * 1000)
+            scheduler.record_poll()
+            now += scheduler.next_delay(playback, now=now)
+        return scheduler.stats["polls"]
+
+    fixed = simulate_hour(Poll_Scheduler({"policy": "fixed"}))
+    adaptive = simulate_hour(Poll_Scheduler())
+    assert fixed >= 10 * adaptive
+
+
+@pytest.mark.asyncio
+async def test_liked_songs_sync_is_incremental(tmp_path, monkeypatch):
+    """After the first full download, a new like costs a single request and an unlike a few."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    with Fake_Spotify_API(liked_count=500) as api:
+        playback = Spotify_Playback_Data(sp=api.client())
+        assert len(await playback._get_liked_songs()) == 500
+
+        api.liked.insert(0, make_track(0, "new"))
+        playback._liked_synced_at = 0
+        before = api.request_count("me/tracks")
+        liked = await playback._get_liked_songs()
+
+        assert "new000000" in liked and len(liked) == 501
+        assert api.request_count("me/tracks") - before == 1
+
+        # An unlike deep in the library leaves `total` one short, and is
+        # found by bisecting rather than by re-reading all ten pages.
+        unliked = api.liked.pop(250)["id"]
+        playback._liked_synced_at = 0
+        before = api.request_count("me/tracks")
+        liked = await playback._get_liked_songs()
+        assert unliked not in liked and len(liked) == 500
+        assert api.request_count("me/tracks") - before <= 7
+        assert unliked not in playback.store.load_liked_track_ids()
+
+        import spotify_main_class
+        monkeypatch.setattr(spotify_main_class, "LIKED_RECONCILE_INTERVAL", -1)
+        playback._liked_synced_at = 0
+        before = api.request_count("me/tracks")
+        liked = await playback._get_liked_songs()
+        assert len(liked) == 500 and api.request_count("me/tracks") - before == 10
+
+    # When the pages read hold the whole library, an unlike is dropped at once.
+    monkeypatch.setattr(spotify_main_class, "LIKED_RECONCILE_INTERVAL", 24 * 60 * 60)
+    with Fake_Spotify_API(liked_count=20) as api:
+        playback.api = Spotify_Client(api.client())
+        playback._liked_synced_at = 0
+        playback.store.replace_liked_tracks(
+            [{"id": track["id"], "added_at": "2024-01-01T00:00:00Z"} for track in api.liked],
+            time.time(),
+        )
+        unliked = api.liked.pop(5)["id"]
+        liked = await playback._get_liked_songs()
+        assert api.request_count("me/tracks") == 1
+        assert unliked not in liked and len(liked) == 19
+        assert unliked not in playback.store.load_liked_track_ids()
+
+    # Opening Liked Songs with nothing stored downloads it once, and that
+    # download is the liked set's first sync.
+    monkeypatch.setenv("HOME", str(tmp_path / "fresh"))
+    with Fake_Spotify_API(liked_count=120) as api:
+        playback = Spotify_Playback_Data(sp=api.client())
+        assert len(await playback.get_playlist_tracks("liked_songs")) == 120
+        assert api.request_count("me/tracks") == 3
+        assert len(await playback._get_liked_songs()) == 120
+        assert len(await playback.get_playlist_tracks("liked_songs")) == 120
+        assert api.request_count("me/tracks") == 3
+
+
+@pytest.mark.asyncio
+async def test_concurrent_pages_reassemble_in_order_and_retry_alone(tmp_path, monkeypatch):
+    """Pages finishing out of order are yielded in order; a failed page is retried by itself."""
+    from collections import Counter
+
+    monkeypatch.setenv("HOME", str(tmp_path))
+    with Fake_Spotify_API(playlist_size=500) as api:
+        requested, answered = [], []
+        route = api.route
+
+        def uneven_route(method, path, query, body=None):
+            if path != "playlists/fakeplaylist01/items":
+                return route(method, path, query, body)
+            offset = int(query.get("offset", 0))
+            requested.append(offset)
+            if offset == 100:
+                # The second page comes back after all the later ones.
+                time.sleep(0.4)
+            if offset == 200 and requested.count(200) == 1:
+                return 503, {"error": {"status": 503, "message": "Service unavailable"}}
+            answered.append(offset)
+            return route(method, path, query, body)
+
+        monkeypatch.setattr(api, "route", uneven_route)
+        playback = Spotify_Playback_Data(sp=api.client(), page_concurrency=4)
+        call_paged = playback.api.call_paged
+        dropped = []
+
+        async def dropping_call_paged(method, *args, limit, offset):
+            if method == "playlist_tracks" and offset == 300 and not dropped:
+                dropped.append(offset)
+                raise ConnectionError("Connection reset by peer")
+            return await call_paged(method, *args, limit=limit, offset=offset)
+
+        monkeypatch.setattr(playback.api, "call_paged", dropping_call_paged)
+        tracks = await playback.get_playlist_tracks("fakeplaylist01")
+
+        assert [track["id"] for track in tracks] == [f"track{i:06d}" for i in range(500)]
+        assert answered.index(100) > answered.index(400)
+        # Only the failed pages were asked for again; the listing never restarted.
+        assert Counter(requested) == {0: 1, 100: 1, 200: 2, 300: 1, 400: 1}
+        assert dropped == [300]
+
+
+def test_library_store_migrates_json_cache(tmp_path, monkeypatch):
+    """Old per-playlist JSON caches are imported once and shared tracks stored once."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    from config_helper import get_cache_directory
+    from library_store import Library_Store
+    import json
+
+    tracks = [
+        {"name": f"Track {i}", "artists": ["Artist", f"Guest {i}"], "album": "Album",
+         "duration_ms": 1000 * i, "is_liked": False, "id": f"track{i:06d}"}
+        for i in range(10)
+    ]
+    cache_dir = get_cache_directory()
+    (cache_dir / "first.cache").write_text(json.dumps(tracks))
+    (cache_dir / "second.cache").write_text(json.dumps(tracks[5:]))
+
+    store = Library_Store()
+    store.migrate_json_cache()
+
+    assert not list(cache_dir.glob("*.cache"))
+    assert store.load_playlist("first") == tracks
+    assert store.load_playlist("second") == tracks[5:]
+    assert store.load_playlist_rows("first", 8, 5) == tracks[8:]
+    track_count = store.connection().execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+    assert track_count == 10
+
+    # Once done, the migration isn't run again.
+    (cache_dir / "third.cache").write_text(json.dumps(tracks))
+    Library_Store().migrate_json_cache()
+    assert (cache_dir / "third.cache").exists()
+    assert store.load_playlist("third") is None
+
+    # A version 1 store, with artist credits in track_artists, is upgraded.
+    db = store.connection()
+    with db:
+        db.execute(
+            "CREATE TABLE track_artists (track_id INTEGER, position INTEGER, artist_id INTEGER, "
+            "PRIMARY KEY (track_id, position)) WITHOUT ROWID"
+        )
+        for track_id, artist_ids in db.execute("SELECT id, artist_ids FROM tracks").fetchall():
+            db.executemany(
+                "INSERT INTO track_artists VALUES (?, ?, ?)",
+                [(track_id, position, int(artist_id))
+                 for position, artist_id in enumerate(artist_ids.split(","))],
+            )
+        db.execute("UPDATE tracks SET artist_ids = ''")
+        db.execute("UPDATE meta SET value = 1 WHERE key = 'schema_version'")
+    upgraded = Library_Store()
+    assert upgraded.load_playlist("first") == tracks
+    assert not upgraded.connection().execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'track_artists'"
+    ).fetchone()
+
+
+@pytest.mark.asyncio
+async def test_playlist_cache_validates_snapshot_id(tmp_path, monkeypatch):
+    """A cached playlist is re-downloaded only when its snapshot_id changes."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    pages = r"playlists/fakeplaylist01/(tracks|items)"
+    with Fake_Spotify_API() as api:
+        playback = Spotify_Playback_Data(sp=api.client())
+        await playback.get_user_library()
+        assert len(await playback.get_playlist_tracks("fakeplaylist01")) == 250
+        assert playback.cache_stats == {"hits": 0, "misses": 1, "revalidations": 0}
+
+        # A restart: nothing in memory, the snapshot_id has to be asked for.
+        playback = Spotify_Playback_Data(sp=api.client())
+        downloads = api.request_count(pages)
+        assert len(await playback.get_playlist_tracks("fakeplaylist01")) == 250
+        assert api.request_count(pages) == downloads
+        assert playback.cache_stats == {"hits": 1, "misses": 0, "revalidations": 1}
+
+        api.playlists["fakeplaylist01"] = [make_track(i, "edited") for i in range(10)]
+        api.snapshot_ids["fakeplaylist01"] = "snap-2"
+        await playback.get_user_library()
+        tracks = await playback.get_playlist_tracks("fakeplaylist01")
+        assert [track["id"] for track in tracks] == [f"edited{i:06d}" for i in range(10)]
+        assert playback.cache_stats["misses"] == 1
+
+        # A like outdates the copy in memory, whose rows carry liked flags.
+        assert not tracks[3]["is_liked"]
+        playback.store.add_liked_tracks([{"id": "edited000003", "added_at": "2030-01-01T00:00:00Z"}])
+        assert (await playback.get_playlist_tracks("fakeplaylist01"))[3]["is_liked"]
+
+
+@pytest.mark.asyncio
+async def test_cached_playlist_opens_from_mapped_track_file(tmp_path, monkeypatch):
+    """A cached playlist is opened from its track file, which must match the playlist and likes."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    from track_file import Mapped_Track_List, read_track_list
+
+    with Fake_Spotify_API() as api:
+        api.playlists["fakeplaylist01"][3]["name"] = "Trøck ✓"
+        playback = Spotify_Playback_Data(sp=api.client())
+        downloaded = await playback.get_playlist_tracks("fakeplaylist01")
+
+        playback = Spotify_Playback_Data(sp=api.client())
+        tracks = await playback.get_playlist_tracks("fakeplaylist01")
+        assert isinstance(tracks, Mapped_Track_List)
+        assert len(tracks) == 250 and tracks == downloaded
+        assert tracks[3]["name"] == "Trøck ✓" and tracks[-1] == downloaded[-1]
+        assert tracks[10:12] == downloaded[10:12]
+        assert tracks[0]["artists"] is tracks[50]["artists"]
+        assert await playback.get_stale_playlist_tracks("fakeplaylist01") == tracks
+
+        # Liking a track outdates every track file: the store is read and the file rewritten.
+        store = playback.store
+        store.add_liked_tracks([{"id": "track000100", "added_at": "2025-01-01T00:00:00Z"}])
+        assert store.open_track_file("fakeplaylist01") is None
+        assert store.load_playlist("fakeplaylist01")[100]["is_liked"]
+        assert store.open_track_file("fakeplaylist01") is None
+        assert list(await playback.get_playlist_tracks("fakeplaylist01")) == store.load_playlist("fakeplaylist01")
+        assert store.open_track_file("fakeplaylist01")[100]["is_liked"]
+
+        # A list still mapping the file goes on reading the rows it opened
+        # when the file is rewritten, from memory once it lets go of the map.
+        with store.open_track_file("fakeplaylist01") as mapped:
+            assert mapped.rows_by_id()[downloaded[120]["id"]] == 120
+            rows = list(mapped)
+            store.write_track_file("fakeplaylist01", rows[:10])
+            assert mapped._map.closed == (os.name == "nt")
+            assert list(mapped) == rows and mapped[120] == rows[120]
+            mapped.detach()
+            assert mapped._map.closed
+            assert list(mapped) == rows and mapped[120] == rows[120]
+        assert len(store.open_track_file("fakeplaylist01")) == 10
+        store.write_track_file("fakeplaylist01", rows)
+
+        path = store.track_file_path("fakeplaylist01")
+        assert read_track_list(path) == store.load_playlist("fakeplaylist01")
+        with open(path, "r+b") as f:
+            f.truncate(1000)
+        assert store.open_track_file("fakeplaylist01") is None
+
+
+def test_track_records_use_less_memory():
+    """100k Track records take well under half the memory of the per-track dicts."""
+    import tracemalloc
+    from track import Track
+
+    def api_fields(count):
+        # Fresh strings per track, as decoded from each API page.
+        for i in range(count):
+            yield dict(
+                name=f"Track {i}",
+                artists=[f"Artist {i % 500}", f"Featured {i % 37}"],
+                album=f"Album {i % 2000}",
+                duration_ms=180000 + i,
+                is_liked=i % 3 == 0,
+                id=f"track{i:06d}",
+            )
+
+    def traced_size(build):
+        tracemalloc.start()
+        tracks = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert len(tracks) == 100000
+        return size
+
+    dict_size = traced_size(lambda: list(api_fields(100000)))
+    record_size = traced_size(lambda: [Track(**fields) for fields in api_fields(100000)])
+    assert record_size < dict_size / 2, (
+        f"per track: dict {dict_size / 100000:.0f}B, Track {record_size / 100000:.0f}B"
+    )
+
+
+def test_memory_cache_evicts_least_recently_used():
+    """The playlist memory cache stays within its byte budget and reports what it did."""
+    from memory_cache import Memory_Cache
+
+    cache = Memory_Cache(budget_bytes=300, ttl=60, sizeof=len)
+    cache.put("a", [0] * 100, version="snap-1")
+    cache.put("b", [0] * 100)
+    cache.put("c", [0] * 100)
+    assert cache.get("a") is not None
+    cache.put("d", [0] * 100)
+
+    assert "b" not in cache and len(cache) == 3 and cache.size == 300
+    assert cache.get("a", version="snap-2") is None
+    assert "a" not in cache
+
+    cache.ttl = -1
+    assert cache.get("c") is None
+    assert cache.stats == {
+        "hits": 1, "misses": 2, "evictions": 1, "expirations": 1, "invalidations": 1,
+    }
+    cache.releaser.shutdown(wait=True)
+
+
+@pytest.mark.asyncio
+async def test_user_library_lists_every_page_and_is_revalidated(tmp_path, monkeypatch):
+    """The whole library streams in page by page; a restart re-reads only the first pages."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    with Fake_Spotify_API(extra_playlist_count=120, album_count=70) as api:
+        playback = Spotify_Playback_Data(sp=api.client())
+        batches = [batch async for batch in playback.iter_user_library()]
+        library = [item for batch in batches for item in batch]
+        assert len(batches) == 5
+        assert len(library) == 1 + 122 + 70
+        assert library[0]["id"] == "liked_songs" and library[-1]["id"] == "fakealbum0069"
+        assert api.request_count("me/playlists") == 3 and api.request_count("me/albums") == 2
+
+        # A restart with nothing changed costs one page of each listing.
+        playback = Spotify_Playback_Data(sp=api.client())
+        assert await playback.get_user_library() == library
+        assert api.request_count("me/playlists") == 4 and api.request_count("me/albums") == 3
+
+        api.snapshot_ids["fakeplaylist01"] = "snap-2"
+        assert await playback.get_user_library() == library
+        assert api.request_count("me/playlists") == 7
+
+
+@pytest.mark.asyncio
+async def test_saved_episodes_are_streamed_cached_and_trimmed(tmp_path, monkeypatch):
+    """Episodes stream a page at a time, keep only a preview, and a restart re-reads one page."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    with Fake_Spotify_API(episode_count=120) as api:
+        api.episodes[0]["name"] = "Episode\n  0"
+        playback = Spotify_Playback_Data(sp=api.client())
+        batches = [batch async for batch in playback.iter_saved_episodes()]
+        episodes = [episode for batch in batches for episode in batch]
+        assert [len(batch) for batch in batches] == [50, 50, 20]
+        assert api.request_count("me/episodes") == 3
+        assert episodes[0]["name"] == "Episode 0"
+        assert episodes[1]["description"] == "Episode 1 description. Episode 1 description. Epis..."
+        assert episodes[1]["show"] is episodes[6]["show"]
+
+        # A restart with nothing changed costs the first page.
+        playback = Spotify_Playback_Data(sp=api.client())
+        assert await playback.get_saved_episodes() == episodes
+        assert api.request_count("me/episodes") == 4
+        assert playback.cache_stats["hits"] == 1
+        assert await playback.get_stale_playlist_tracks("saved_episodes") == episodes
+
+        api.episodes.insert(0, make_episode(120))
+        assert len(await playback.get_saved_episodes()) == 121
+        assert api.request_count("me/episodes") == 7
+
+        # The full description is fetched for the detail view, once.
+        details = await playback.get_episode_details("episode000001")
+        assert details["description"] == api.episodes[2]["description"]
+        await playback.get_episode_details("episode000001")
+        assert api.request_count(r"episodes/episode000001") == 1
+
+
+@pytest.mark.asyncio
+async def test_episode_details_panel():
+    """The episode table shows previews; the detail view fetches the full description."""
+    from main import Details_Panel, Playlist_Track_View, keybindings
+
+    with Fake_Spotify_API() as api:
+        app = MainApp()
+        app.playback.api = Spotify_Client(api.client())
+        async with app.run_test() as pilot:
+            await app.startup.result("playback")
+            view = app.screen.query_one(Playlist_Track_View)
+            view.change_playlist("saved_episodes")
+            for _ in range(100):
+                if len(view.tracks) == 30:
+                    break
+                await pilot.pause(0.05)
+            assert len(view.tracks[0]["description"]) <= 53
+
+            panel = app.screen.query_one(Details_Panel)
+            await pilot.press(keybindings.get("show_details", "i"))
+            for _ in range(100):
+                if "Loading..." not in str(panel.renderable):
+                    break
+                await pilot.pause(0.05)
+            assert panel.display
+            assert api.episodes[0]["description"] in str(panel.renderable)
+            await pilot.press(keybindings.get("show_details", "i"))
+            await pilot.pause()
+            assert not panel.display
+
+
+@pytest.mark.asyncio
+async def test_switching_playlist_mid_load_cancels_it(tmp_path, monkeypatch):
+    """Opening another playlist while one streams in closes the first load; only the second is shown."""
+    from contextlib import aclosing
+    from library_store import Library_Store
+    from main import Playlist_Track_View
+    from track_table import Track_Table
+
+    with Fake_Spotify_API(latency=0.3) as api:
+        api.playlists["playlistA"] = [make_track(i, "a") for i in range(1000)]
+        api.playlists["playlistB"] = [make_track(i, "b") for i in range(30)]
+        api.snapshot_ids.update(playlistA="snap-1", playlistB="snap-1")
+        app = MainApp()
+        playback = app.playback
+        playback.api = Spotify_Client(api.client())
+        monkeypatch.setattr(playback, "store", Library_Store(str(tmp_path / "library.sqlite3")))
+
+        loads = {}
+        iter_playlist_tracks = playback.iter_playlist_tracks
+
+        async def watched_iter_playlist_tracks(playlist_id):
+            loads[playlist_id] = "streaming"
+            try:
+                async with aclosing(iter_playlist_tracks(playlist_id)) as batches:
+                    async for batch in batches:
+                        yield batch
+                loads[playlist_id] = "finished"
+            finally:
+                if loads[playlist_id] == "streaming":
+                    loads[playlist_id] = "closed"
+
+        monkeypatch.setattr(playback, "iter_playlist_tracks", watched_iter_playlist_tracks)
+        async with app.run_test() as pilot:
+            await app.startup.result("playback")
+            view = app.screen.query_one(Playlist_Track_View)
+            view.change_playlist("playlistA")
+            while not view.tracks or view.tracks[0]["id"] != "a000000":
+                await asyncio.sleep(0.02)
+            assert len(view.tracks) < 1000
+            view.change_playlist("playlistB")
+            while loads.get("playlistB") != "finished":
+                await asyncio.sleep(0.02)
+            await pilot.pause()
+
+            assert loads["playlistA"] == "closed"
+            table = view.query_one(Track_Table)
+            assert [track["id"] for track in table.rows] == [f"b{i:06d}" for i in range(30)]
+            # Nothing more of A is asked for once it has been closed.
+            requested = api.request_count("playlists/playlistA/")
+            await asyncio.sleep(0.5)
+            assert api.request_count("playlists/playlistA/") == requested < 10
+            assert [track["id"] for track in table.rows] == [f"b{i:06d}" for i in range(30)]
+
+
+@pytest.mark.asyncio
+async def test_library_selection_resolves_by_id():
+    """Playlists with the same name open by their own id."""
+    from main import Library_List
+
+    selected = []
+
+    async def library():
+        yield [{"name": "Mix", "id": "first", "type": "playlist"}]
+        yield [{"name": "Mix", "id": "second", "type": "playlist"}]
+
+    class Library_App(App):
+        def compose(self):
+            yield Library_List(load_library=library)
+
+        def on_library_list_playlist_selected(self, message):
+            selected.append(message.playlist_id)
+
+    app = Library_App()
+    async with app.run_test() as pilot:
+        await pilot.pause()
+        assert [item.item_id for item in app.query(ListItem)] == ["first", "second"]
+        list_view = app.query_one("ListView")
+        list_view.focus()
+        list_view.index = 1
+        await pilot.press("enter")
+        await pilot.pause()
+        assert selected == ["second"]
+
+
+@pytest.mark.asyncio
+async def test_prefetch_on_highlight(tmp_path, monkeypatch):
+    """A playlist left highlighted is loaded in the background; one passed over is not."""
+    import threading
+    from prefetcher import Playlist_Prefetcher
+
+    monkeypatch.setenv("HOME", str(tmp_path))
+    pages = r"playlists/\w+/(tracks|items)"
+    with Fake_Spotify_API() as api:
+        playback = Spotify_Playback_Data(sp=api.client())
+        await playback.get_user_library()
+        threads = set()
+        playlist_tracks = playback.sp.playlist_tracks
+
+        def record_thread(*args, **kwargs):
+            threads.add(threading.current_thread().name)
+            return playlist_tracks(*args, **kwargs)
+
+        playback.sp.playlist_tracks = record_thread
+        prefetcher = Playlist_Prefetcher(playback, {"delay": 0.05})
+        prefetcher.highlight("fakeplaylist02")
+        prefetcher.highlight("fakeplaylist01")
+        await prefetcher.highlight_task
+        assert api.request_count("playlists/fakeplaylist02") == 0
+        assert threads and all(name.startswith("spotify-background") for name in threads)
+
+        downloads = api.request_count(pages)
+        prefetcher.opened("fakeplaylist01")
+        assert len(await playback.get_playlist_tracks("fakeplaylist01")) == 250
+        assert api.request_count(pages) == downloads
+
+        prefetcher.opened("fakeplaylist02")
+        assert prefetcher.hit_rate == 0.5
+        assert prefetcher.recent == ["fakeplaylist02", "fakeplaylist01"]
+
+        # Opening a playlist while its prefetch loads follows that prefetch,
+        # even once the highlight moves on, rather than downloading it again.
+        api.playlists["fakeplaylist03"] = [make_track(i, "third") for i in range(250)]
+        api.latency = 0.05
+        prefetcher.highlight("fakeplaylist03")
+        while not prefetcher.pages.get("fakeplaylist03", SimpleNamespace(batches=None)).batches:
+            await asyncio.sleep(0.01)
+        prefetcher.opened("fakeplaylist03")
+        prefetcher.highlight("fakeplaylist02")
+        tracks = []
+        async for batch in prefetcher.iter_playlist_tracks("fakeplaylist03"):
+            tracks.extend(batch)
+        assert [track["id"] for track in tracks] == [
+            track["id"] for track in api.playlists["fakeplaylist03"]
+        ]
+        assert api.request_count(r"playlists/fakeplaylist03/items") == 3
+        assert prefetcher.stats["followed"] == 1 and "fakeplaylist03" in prefetcher.prefetched
+
+        # Should the prefetch be stopped part way, the rest is loaded without it.
+        api.playlists["fakeplaylist04"] = [make_track(i, "fourth") for i in range(250)]
+        prefetcher.highlight("fakeplaylist04")
+        while not prefetcher.pages.get("fakeplaylist04", SimpleNamespace(batches=None)).batches:
+            await asyncio.sleep(0.01)
+        tracks = []
+        async for batch in prefetcher.iter_playlist_tracks("fakeplaylist04"):
+            if not tracks:
+                prefetcher.tasks["fakeplaylist04"].cancel()
+            tracks.extend(batch)
+        assert [track["id"] for track in tracks] == [
+            track["id"] for track in api.playlists["fakeplaylist04"]
+        ]
+
+
+@pytest.mark.asyncio
+async def test_controls_stay_fast_while_background_sync_is_rate_limited(tmp_path, monkeypatch):
+    """Controls go ahead of a prefetch that keeps hitting 429s, which still completes."""
+    from spotify_client import background_requests
+
+    monkeypatch.setenv("HOME", str(tmp_path))
+    with Fake_Spotify_API(latency=0.01, playlist_size=5000, rate_limit=20) as api:
+        playback = Spotify_Playback_Data(
+            sp=api.client(), rate_limit_settings={"rate": 30, "burst": 10}
+        )
+
+        async def background_sync():
+            background_requests.set(True)
+            return await playback.get_playlist_tracks("fakeplaylist01")
+
+        sync = asyncio.ensure_future(background_sync())
+        latencies = []
+        for _ in range(6):
+            await asyncio.sleep(0.3)
+            start = time.perf_counter()
+            await playback.pause_playback()
+            latencies.append(time.perf_counter() - start)
+        assert len(await sync) == 5000
+
+    stats = playback.api.scheduler.stats
+    assert api.throttled > 0 and stats["prefetch"]["throttled"] > 0
+    assert stats["prefetch"]["max_queued"] > 1
+    # A control that meets a full server window waits out its Retry-After
+    # (under a second here), twice if the one background request already in
+    # flight takes the freed slot; otherwise it goes straight to the front.
+    assert max(latencies) < 2.0, latencies
+
+    # A 429 met by a prefetch holds back prefetching, not controls.
+    from request_scheduler import CONTROL, PREFETCH, Request_Scheduler
+    from spotipy.exceptions import SpotifyException
+
+    scheduler = Request_Scheduler({"rate": 30, "burst": 10})
+    sends = []
+
+    async def send(name):
+        sends.append(name)
+        if sends.count(name) == 1 and name == "prefetch":
+            raise SpotifyException(429, -1, "rate limited", headers={"Retry-After": "30"})
+        return name
+
+    prefetch = asyncio.ensure_future(scheduler.run(PREFETCH, lambda: send("prefetch")))
+    while not scheduler.stats["prefetch"]["throttled"]:
+        await asyncio.sleep(0)
+    assert await asyncio.wait_for(scheduler.run(CONTROL, lambda: send("control")), 5) == "control"
+    assert sends == ["prefetch", "control"] and not prefetch.done()
+    prefetch.cancel()
+
+
+@pytest.mark.asyncio
+async def test_identical_reads_share_one_request(tmp_path, monkeypatch):
+    """Concurrent identical reads make one request, and the user is fetched once."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    with Fake_Spotify_API(latency=0.05) as api:
+        playback = Spotify_Playback_Data(sp=api.client())
+        await asyncio.gather(playback.update(), playback.update(), playback.update())
+        assert api.request_count("me/player$") == 1
+        assert playback.api.stats["coalesced"] == 2
+
+        # A caller giving up doesn't cancel the request for the others.
+        first = asyncio.ensure_future(playback.update())
+        second = asyncio.ensure_future(playback.update())
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await second
+        assert api.request_count("me/player$") == 2
+
+        await playback.verify_user()
+        await playback.play_track("track000001", "liked_songs")
+        await playback.play_track("track000002", "liked_songs")
+        assert api.request_count("^me$") == 1
+        assert playback.api.stats["memoized"] == 2
+
+
+@pytest.mark.asyncio
+async def test_requests_reuse_each_threads_connection(tmp_path, monkeypatch):
+    """Requests run on the client's own threads, each keeping one connection alive."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    with Fake_Spotify_API(latency=0.02) as api:
+        playback = Spotify_Playback_Data(sp=api.client(), io_concurrency=2)
+        for _ in range(3):
+            await asyncio.gather(*(playback.set_volume(volume) for volume in range(4)))
+        stats = playback.api.executor_stats()
+        assert api.request_count("me/player/volume") == 12
+        assert len(api.connections) == 2
+        assert stats["io"] == {"workers": 2, "queued": 0, "busy": 0}
+        assert (stats["connections_in_use"], stats["connections_idle"]) == (0, 2)
+
+        playback.close()
+        assert playback.api.executor_stats()["connections_idle"] == 0
+        with pytest.raises(RuntimeError):
+            await playback.set_volume(10)
+
+
+async def input_to_render(pilot, key, rendered):
+    """Seconds from pressing `key` until `rendered()` holds."""
+    start = time.perf_counter()
+    press = asyncio.create_task(pilot.press(key))
+    while not rendered():
+        await asyncio.sleep(0.005)
+    latency = time.perf_counter() - start
+    await press
+    return latency
+
+
+@pytest.mark.asyncio
+async def test_controls_render_before_the_server_answers(monkeypatch):
+    """Controls draw their predicted state at once; one the server never applies is rolled back."""
+    import spotify_main_class
+    from main import Playlist_Track_View, Bottom_Bar, keybindings
+
+    with Fake_Spotify_API(latency=0.3) as api:
+        app = MainApp()
+        playback = app.playback
+        playback.api = Spotify_Client(api.client())
+        # The playback object is shared with earlier tests, whose mocked controls were never confirmed.
+        playback.predictions.clear()
+        rolled_back = playback.prediction_stats["rolled_back"]
+        async with app.run_test() as pilot:
+            await app.startup.result("playback")
+            await pilot.pause()
+            view = app.screen.query_one(Playlist_Track_View)
+            view.change_playlist("fakeplaylist01")
+            while len(view.tracks) < 250:
+                await asyncio.sleep(0.05)
+            button = app.screen.query_one("#play_pause_button")
+            now_playing = app.screen.query_one("#now_playing")
+            bottom_bar = app.screen.query_one(Bottom_Bar)
+
+            latencies = [
+                await input_to_render(pilot, ">", lambda: "Track 1 -" in str(now_playing.renderable)),
+                await input_to_render(pilot, "space", lambda: str(button.label) == "\u25ba"),
+                await input_to_render(
+                    pilot, keybindings.get("volume_up", "+"),
+                    lambda: "Volume: 55%" in (bottom_bar.border_title or ""),
+                ),
+            ]
+            assert max(latencies) < 0.1
+            while playback.predictions:
+                await asyncio.sleep(0.05)
+            assert (api.is_playing, api.track_index, api.volume) == (False, 1, 55)
+            assert playback.prediction_stats["rolled_back"] == rolled_back
+
+            # A device that accepts "play" but never starts: the prediction is undone.
+            monkeypatch.setattr(spotify_main_class, "PREDICTION_GRACE", 0.3)
+            route = api.route
+            monkeypatch.setattr(
+                api, "route",
+                lambda method, path, *args: (204, None) if method == "PUT" else route(method, path, *args),
+            )
+            assert await input_to_render(pilot, "space", lambda: str(button.label) == "\u23f8") < 0.1
+            deadline = time.perf_counter() + 5
+            while str(button.label) != "\u25ba" and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+            assert str(button.label) == "\u25ba"
+            assert playback.prediction_stats["rolled_back"] == rolled_back + 1
+
+
+@pytest.mark.asyncio
+async def test_repeated_controls_are_coalesced():
+    """A burst of volume or skip presses is sent as a single request for its end result."""
+    from main import Playlist_Track_View, keybindings
+
+    with Fake_Spotify_API(latency=0.1) as api:
+        app = MainApp()
+        playback = app.playback
+        playback.api = Spotify_Client(api.client())
+        playback.predictions.clear()
+        async with app.run_test() as pilot:
+            await app.startup.result("playback")
+            await pilot.pause()
+            view = app.screen.query_one(Playlist_Track_View)
+            view.change_playlist("fakeplaylist01")
+            while len(view.tracks) < 250:
+                await asyncio.sleep(0.05)
+
+            # Long enough that a loaded machine can't split a burst of presses.
+            app.volume_control.delay = app.skip_control.delay = 1
+            await pilot.press(*[keybindings.get("volume_up", "+")] * 6)
+            volume = min(100, 50 + 6 * app.volume_step)
+            assert playback.device_volume_percent == volume
+            await pilot.press(">", ">", ">", "<")
+            assert playback.track_id == view.tracks[2]["id"]
+
+            while playback.predictions or app.volume_control.pending or app.skip_control.pending:
+                await asyncio.sleep(0.05)
+            assert (api.volume, api.track_index) == (volume, 2)
+            assert api.request_count("me/player/volume") == 1
+            assert api.request_count("me/player/(play|next|previous)") == 1
+            assert app.skip_control.stats == {"presses": 4, "requests": 1}
+
+            # With a slow request in flight, later controls are drawn at once
+            # and sent after it, in the order they were given.
+            api.latency = 0.5
+            first_control = len(api.requests)
+            button = app.screen.query_one("#play_pause_button")
+            now_playing = app.screen.query_one("#now_playing")
+            latencies = [
+                await input_to_render(pilot, "space", lambda: str(button.label) == "\u25ba"),
+                await input_to_render(pilot, "space", lambda: str(button.label) == "\u23f8"),
+                await input_to_render(
+                    pilot, keybindings.get("volume_down", "-"),
+                    lambda: playback.device_volume_percent == volume - app.volume_step,
+                ),
+                await input_to_render(pilot, "space", lambda: str(button.label) == "\u25ba"),
+            ]
+            # Waiting on any earlier send would take at least its 0.5s.
+            assert max(latencies) < 0.25
+            await app.control_queue.join()
+            sent = [path for method, path in api.requests[first_control:] if method == "PUT"]
+            assert [path.split("?")[0].rsplit("/", 1)[-1] for path in sent] == [
+                "pause", "play", "volume", "pause",
+            ]
+            assert (api.is_playing, api.volume) == (False, volume - app.volume_step)
+
+
+@pytest.mark.asyncio
+async def test_metrics_panel_and_dump(tmp_path, monkeypatch):
+    """API calls and UI hot paths are timed, shown in the debug panel and dumped on demand."""
+    import json
+    import main
+    from main import Metrics_Panel, keybindings
+    from metrics import Histogram, metrics
+
+    histogram = Histogram()
+    for ms in range(1, 101):
+        histogram.observe(ms / 1000)
+    assert 0.045 <= histogram.quantile(0.5) <= 0.055
+    assert 0.09 <= histogram.quantile(0.95) <= 0.1
+
+    with Fake_Spotify_API(latency=0.01) as api:
+        app = MainApp()
+        app.playback.api = Spotify_Client(api.client())
+        async with app.run_test() as pilot:
+            await app.startup.result("playback")
+            await app.screen.poll_now()
+            panel = app.screen.query_one(Metrics_Panel)
+            assert not panel.display
+            await pilot.press(keybindings.get("toggle_metrics", "f12"))
+            assert panel.display
+            assert 'api_call_seconds{method="current_playback"}' in str(panel.renderable)
+            assert 'ui_seconds{path="update_stats"}' in str(panel.renderable)
+
+            for name in ("metrics.prom", "metrics.json"):
+                monkeypatch.setitem(main.metrics_settings, "dump_path", str(tmp_path / name))
+                await pilot.press(keybindings.get("dump_metrics", "f11"))
+            prometheus = (tmp_path / "metrics.prom").read_text()
+            assert "# TYPE api_request_seconds histogram" in prometheus
+            assert 'api_request_seconds_bucket{method="current_playback",le="+Inf"}' in prometheus
+            # Each tick of the progress clock is counted.
+            assert 'ui_seconds_count{path="update_progress"}' in prometheus
+            snapshot = json.loads((tmp_path / "metrics.json").read_text())
+            assert snapshot["histograms"]['ui_seconds{path="update_stats"}']["count"] >= 1
+            assert "playlist_cache_memory_hits" in snapshot["gauges"]
+
+
+@pytest.mark.asyncio
+async def test_progress_clock_soak(monkeypatch):
+    """Hours of playback (ticks and polls on a simulated clock) start no workers and hold memory flat."""
+    import gc
+    import sys
+    import main
+    from main import Bottom_Bar, Current_Time_In_Track
+
+    with Fake_Spotify_API() as api:
+        app = MainApp()
+        playback = app.playback
+        playback.api = Spotify_Client(api.client())
+        playback.predictions.clear()
+        async with app.run_test() as pilot:
+            await app.startup.result("playback")
+            await pilot.pause()
+            screen = app.screen
+            bottom_bar = screen.query_one(Bottom_Bar)
+            screen.poll_timer.stop()
+            bottom_bar.clock.pause()
+
+            clock = SimpleNamespace(now=time.time())
+            monkeypatch.setattr(
+                main, "time", SimpleNamespace(time=lambda: clock.now, perf_counter=time.perf_counter)
+            )
+            track_length = 180
+
+            async def poll():
+                # The playback state a poll every 2s returns, a new track every 3 minutes.
+                elapsed = int(clock.now - start)
+                api.track_index = elapsed // track_length % 250
+                api.progress_ms = elapsed % track_length * 1000
+                state = api.playback_state()
+                state["timestamp"] = int(clock.now * 1000)
+                playback.set_playback_data(state)
+
+            async def play(seconds):
+                # A tick a second is enough to exercise the clock (it runs every PROGRESS_TICK).
+                for tick in range(seconds):
+                    clock.now += 1
+                    if tick % 2 == 0:
+                        await screen.update_stats(update=poll)
+                    else:
+                        bottom_bar.update_progress()
+                    if tick % 200 == 0:
+                        await pilot.pause()
+
+            start = clock.now
+            await play(10 * 60)
+            workers = set(app.workers)
+            gc.collect()
+            objects, blocks = len(gc.get_objects()), sys.getallocatedblocks()
+            await play(2 * 60 * 60)
+            gc.collect()
+            assert set(app.workers) <= workers
+            # Roughly 90k objects and 375k blocks are live; two hours add a few hundred and a few thousand.
+            assert len(gc.get_objects()) - objects < 1000
+            assert sys.getallocatedblocks() - blocks < 10000
+            # The time shown has kept up with playback, to the whole second it shows.
+            position = (clock.now - start) % track_length * 1000
+            assert abs(screen.query_one(Current_Time_In_Track).current_time - position) <= 1000
+
+
+@pytest.mark.asyncio
+async def test_resize_storm_lays_out_columns_once():
+    """A burst of resizes lays a big table out once; returning to a width reuses its layout."""
+    from main import track_columns
+    from track_table import Track_Table
+
+    class Table_App(App):
+        def compose(self):
+            yield Track_Table()
+
+    tracks = [
+        {"name": f"Track {i}", "artists": [f"Artist {i}"], "album": f"Album {i}", "duration_ms": 180000, "id": f"t{i}"}
+        for i in range(20000)
+    ]
+    app = Table_App()
+    async with app.run_test(size=(100, 30)) as pilot:
+        table = app.query_one(Track_Table)
+        table.set_columns(track_columns())
+        table.set_rows(tracks)
+        await pilot.pause()
+        assert table.columns[0].width == len("20000")
+        # The flexible columns fill the width, bar the remainder of sharing it three ways.
+        assert 0 <= table.container_size.width - table._total_width() < 3
+        computed = table.layout_stats["computed"]
+
+        for width in [*range(101, 140), *range(140, 120, -1)]:
+            await pilot.resize_terminal(width, 30)
+        await pilot.pause(table.layout_debounce * 2)
+        assert table.layout_stats["layouts"] - computed <= 2
+        assert 0 <= table.container_size.width - table._total_width() < 3
+
+        computed = table.layout_stats["computed"]
+        applied = table.layout_stats["applied"]
+        await pilot.resize_terminal(100, 30)
+        await pilot.pause(table.layout_debounce * 2)
+        await pilot.resize_terminal(121, 30)
+        await pilot.pause(table.layout_debounce * 2)
+        # Both widths were laid out before: nothing is recomputed, only re-applied.
+        assert table.layout_stats["computed"] == computed
+        assert table.layout_stats["applied"] == applied + 2
+        # Laying out again at the same width changes nothing and repaints nothing.
+        assert not table.layout_columns()
+        assert table.layout_stats["applied"] == applied + 2
+
+
+@pytest.mark.asyncio
+async def test_cold_start_from_state_snapshot(tmp_path, monkeypatch):
+    """Playback is restored without a request, and each poll's snapshot is drawn within 300ms of the next mount."""
+    monkeypatch.setenv("HOME", str(tmp_path))
+    from main import Library_List
+
+    with Fake_Spotify_API() as api:
+        live = Spotify_Playback_Data(sp=api.client())
+        await live.update()
+        snapshot = {"playback": live.playback_state()}
+
+        before = len(api.requests)
+        restored = Spotify_Playback_Data(sp=api.client(), state_snapshot=snapshot)
+        assert len(api.requests) == before
+        assert restored.track == live.track and restored.state_is_stale
+        await restored.update()
+        assert not restored.state_is_stale
+
+    released = asyncio.Event()
+
+    async def slow_library():
+        await released.wait()
+        yield [{"name": "Fresh", "id": "fresh", "type": "playlist"}]
+
+    class Library_App(App):
+        def compose(self):
+            yield Library_List(
+                load_library=slow_library,
+                cached_library=[{"name": "Cached", "id": "cached", "type": "playlist"}],
+            )
+
+    app = Library_App()
+    async with app.run_test() as pilot:
+        await pilot.pause()
+        assert [item.item_id for item in app.query(ListItem)] == ["cached"]
+        released.set()
+        await pilot.pause()
+        await pilot.pause()
+        assert [item.item_id for item in app.query(ListItem)] == ["fresh"]
+
+    # Each successful poll leaves a snapshot, which the next start draws within 300ms of mounting.
+    import main
+    from main import Playlist_Track_View
+    from state_snapshot import load_state_snapshot
+
+    monkeypatch.setattr(main, "STATE_SNAPSHOT_INTERVAL", 0)
+    with Fake_Spotify_API() as api:
+        app = MainApp()
+        app.playback.api = Spotify_Client(api.client())
+        async with app.run_test() as pilot:
+            await app.startup.result("playback")
+            view = app.screen.query_one(Playlist_Track_View)
+            while len(view.tracks) < 100 or "fakeplaylist01" not in str(
+                app.screen.state_snapshot()["libraries"]
+            ):
+                await asyncio.sleep(0.05)
+            await app.screen.poll_now()
+        snapshot = load_state_snapshot()
+        assert snapshot["playlist_id"] == "liked_songs"
+        assert snapshot["playback"]["track_id"] == app.playback.track_id
+
+        api.latency = 0.5
+        monkeypatch.setattr(main, "state_snapshot", snapshot)
+        app = MainApp()
+        async with app.run_test() as pilot:
+            while "first paint" not in app.startup.marks:
+                await asyncio.sleep(0.01)
+            # The last session's rows are in place within 300ms of mounting,
+            # in time for the first frame (whose own cost is Textual's).
+            marks = app.startup.marks
+            assert marks["cached playlist rows"] < 0.3
+            assert marks["cached playlist rows"] <= marks["first paint"]
+            assert len(app.screen.query(ListItem)) > 0
+            assert len(app.screen.query_one(Playlist_Track_View).tracks) == 100
+
+    # The data loads don't wait for the token check: all start at once.
+    with Fake_Spotify_API(latency=0.3) as api:
+        app = MainApp()
+        app.playback.api = Spotify_Client(api.client())
+        async with app.run_test() as pilot:
+            await app.startup.result("playback")
+            await app.startup.result("featured_playlists")
+            timings = app.startup.timings
+            assert timings["playback"][0] < timings["auth"][1]
+            assert timings["featured_playlists"][0] < timings["auth"][1]
+
+
+@pytest.mark.asyncio
+async def test_startup_graph_runs_independent_loads_concurrently():
+    """Startup takes about as long as its slowest chain, not the sum of its loads."""
+    from startup_graph import Startup_Graph
+
+    order = []
+
+    def load(name, seconds):
+        async def run():
+            order.append(name)
+            await asyncio.sleep(seconds)
+            return name
+        return run
+
+    graph = Startup_Graph()
+    graph.add("auth", load("auth", 0.1))
+    for name in ("playback", "featured", "library"):
+        graph.add(name, load(name, 0.2), after=["auth"])
+    start = time.perf_counter()
+    graph.start()
+    assert await graph.result("library") == "library"
+    await asyncio.gather(*(graph.result(name) for name in ("playback", "featured")))
+    elapsed = time.perf_counter() - start
+
+    assert order[0] == "auth"
+    assert elapsed < 0.45
+    assert "took" in graph.timing_report()
+
+@pytest.mark.asyncio
+async def test_startup_profile_records_phases_and_chrome_trace(tmp_path, monkeypatch):
+    """--profile-startup times imports and each phase, and saves a Chrome trace."""
+    import builtins
+    import json
+    from startup_graph import Startup_Graph
+    from startup_profile import Startup_Profiler
+
+    (tmp_path / "profiled_module.py").write_text("import time\ntime.sleep(0.01)\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    original_import = builtins.__import__
+    profiler = Startup_Profiler(enabled=True)
+    try:
+        import profiled_module
+    finally:
+        profiler.stop_timing_imports()
+    assert builtins.__import__ is original_import
+
+    with profiler.span("setup_settings", "config"):
+        time.sleep(0.01)
+    graph = Startup_Graph()
+
+    async def load():
+        await asyncio.sleep(0.01)
+    graph.add("auth", load)
+    graph.start()
+    await graph.result("auth")
+    graph.mark("first paint")
+    profiler.add_startup_graph(graph)
+
+    names = [span[0] for span in profiler.spans]
+    assert "import profiled_module" in names and "setup_settings" in names and "load auth" in names
+    assert profiler.phase_totals()["config"] >= 0.01
+    assert "first paint" in profiler.table()
+
+    trace_path = tmp_path / "trace.json"
+    profiler.write_chrome_trace(str(trace_path))
+    trace = json.loads(trace_path.read_text())
+    events = {event["name"]: event for event in trace["traceEvents"]}
+    assert events["setup_settings"]["ph"] == "X" and events["setup_settings"]["dur"] >= 10000
+    assert events["first paint"]["ph"] == "i"
+    assert set(trace["otherData"]["phases_ms"]) == {"import", "config", "auth"}
+    assert trace["otherData"]["phases_ms"]["import"] >= 10
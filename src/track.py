@@ -0,0 +1,149 @@
+import sys
+
+# One shared tuple per distinct artist line-up, across every playlist loaded.
+_artist_tuples: dict[tuple, tuple] = {}
+# Tracks measured when estimating the size of a whole list.
+SIZE_SAMPLE = 100
+# Characters of an episode's description kept for its table row.
+DESCRIPTION_PREVIEW_LENGTH = 50
+
+
+def intern_artists(artists) -> tuple:
+    """Return the shared tuple of interned artist names equal to `artists`."""
+    if type(artists) is tuple:
+        shared = _artist_tuples.get(artists)
+        if shared is not None:
+            return shared
+    artists = tuple(sys.intern(artist) for artist in artists)
+    return _artist_tuples.setdefault(artists, artists)
+
+
+def one_line(text) -> str:
+    """`text` with runs of whitespace, newlines included, collapsed to single spaces."""
+    return " ".join((text or "").split())
+
+
+def description_preview(text) -> str:
+    """The start of a description, on one line, as the episode table shows it."""
+    text = one_line(text)
+    if len(text) > DESCRIPTION_PREVIEW_LENGTH:
+        return text[:DESCRIPTION_PREVIEW_LENGTH].rstrip() + "..."
+    return text
+
+
+class Record:
+    """Dict-style access to a slotted record, for code written against the old dicts."""
+
+    __slots__ = ()
+    # Fields each record holds a copy of, as opposed to shared interned names.
+    sized_fields = ()
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in self.__slots__:
+            return default
+        return getattr(self, key)
+
+    def to_dict(self) -> dict:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __eq__(self, other):
+        if isinstance(other, type(self)):
+            return all(getattr(self, key) == getattr(other, key) for key in self.__slots__)
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name!r}, id={self.id!r})"
+
+
+class Track(Record):
+    """A playlist track, stored compactly.
+
+    Tracks replace the per-track dicts playlists used to be loaded as: the
+    fields live in slots, album names are interned and artist line-ups are
+    shared tuples, so the same artist or album costs nothing extra however
+    many tracks and playlists mention it. `track["name"]` and
+    `track.get("album", "")` keep working for code written against the dicts.
+    """
+
+    __slots__ = ("name", "artists", "album", "duration_ms", "is_liked", "id")
+    sized_fields = ("name", "id", "duration_ms")
+
+    def __init__(self, name, artists, album, duration_ms, is_liked, id):
+        self.name = name
+        self.artists = intern_artists(artists)
+        self.album = sys.intern(album)
+        self.duration_ms = duration_ms
+        self.is_liked = is_liked
+        self.id = id
+
+    @classmethod
+    def from_shared(cls, name, artists, album, duration_ms, is_liked, id):
+        """A Track whose `artists` is already a shared line-up and `album` already interned.
+
+        Skips the lookups `__init__` does, for bulk loads that share them
+        themselves.
+        """
+        track = cls.__new__(cls)
+        track.name = name
+        track.artists = artists
+        track.album = album
+        track.duration_ms = duration_ms
+        track.is_liked = is_liked
+        track.id = id
+        return track
+
+    def to_dict(self) -> dict:
+        track = super().to_dict()
+        track["artists"] = list(self.artists)
+        return track
+
+
+class Episode(Record):
+    """A saved podcast episode, holding only what its table row shows.
+
+    Show names are interned, and the description is the short preview the
+    table displays; the full text is fetched on demand for the detail view.
+    """
+
+    __slots__ = ("name", "show", "duration_ms", "description", "id")
+    sized_fields = ("name", "id", "duration_ms", "description")
+
+    def __init__(self, name, show, duration_ms, description, id):
+        self.name = name
+        self.show = sys.intern(show)
+        self.duration_ms = duration_ms
+        self.description = description
+        self.id = id
+
+
+def episode_from_api(episode: dict) -> Episode:
+    """An Episode from a Web API episode object, its display fields normalized and cut short."""
+    return Episode(
+        name=one_line(episode["name"]),
+        show=one_line(episode["show"]["name"]),
+        duration_ms=episode["duration_ms"],
+        description=description_preview(episode.get("description")),
+        id=episode["id"],
+    )
+
+
+def approximate_size(records) -> int:
+    """Approximate bytes held by a list of tracks or episodes, not counting shared names."""
+    sample = records[:SIZE_SAMPLE]
+    if not sample:
+        return sys.getsizeof(records)
+    sample_size = sum(
+        sys.getsizeof(record)
+        + sum(sys.getsizeof(getattr(record, field)) for field in record.sized_fields)
+        for record in sample
+    )
+    return sys.getsizeof(records) + sample_size * len(records) // len(sample)
@@ -0,0 +1,324 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import weakref
+from collections.abc import Sequence
+
+from track import Track, intern_artists
+
+# A track file holds one playlist's rows for loading through mmap, so
+# opening a cached playlist reads only the rows that are drawn.
+#
+# All integers are little-endian and unsigned. After the header come:
+#   string offsets   (string_count + 1) u32, into the string data
+#   lineup offsets   (lineup_count + 1) u32, into the lineup entries
+#   lineup entries   u32 string indexes, each lineup's artists in credit order
+#   records          track_count fixed-width RECORDs
+#   string data      UTF-8, every distinct string once
+MAGIC = b"STTL"
+FORMAT_VERSION = 1
+# magic, format version, record size, track count, string count, lineup
+# count, and the string indexes of the snapshot_id and liked-set version.
+HEADER = struct.Struct("<4sHHIIIII")
+# name, id, album and artist lineup indexes, duration_ms, flags.
+RECORD = struct.Struct("<IIIIIB3x")
+INDEX = struct.Struct("<I")
+# String index standing for None (local files have no id).
+NO_STRING = 0xFFFFFFFF
+FLAG_LIKED = 1
+
+# Every open Mapped_Track_List, so a rewrite can let go of the file first.
+_open_lists = weakref.WeakValueDictionary()
+
+
+def write_track_file(path, tracks, version: tuple) -> None:
+    """Write `tracks` to `path`, tagged with `version`, a (snapshot_id, liked version) pair."""
+    strings = {}
+    lineups = {}
+    lineup_entries = []
+    lineup_offsets = [0]
+
+    def string_index(value) -> int:
+        if value is None:
+            return NO_STRING
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    records = bytearray()
+    for track in tracks:
+        artists = tuple(track["artists"])
+        lineup = lineups.get(artists)
+        if lineup is None:
+            lineup = lineups[artists] = len(lineups)
+            lineup_entries += [string_index(artist) for artist in artists]
+            lineup_offsets.append(len(lineup_entries))
+        records += RECORD.pack(
+            string_index(track["name"]),
+            string_index(track["id"]),
+            string_index(track["album"]),
+            lineup,
+            track["duration_ms"],
+            FLAG_LIKED if track["is_liked"] else 0,
+        )
+    snapshot_id, liked_version = (string_index(value) for value in version)
+
+    encoded = [value.encode() for value in strings]
+    string_offsets = [0]
+    for value in encoded:
+        string_offsets.append(string_offsets[-1] + len(value))
+
+    # Written aside and moved into place, so a reader never maps half a file.
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(
+            HEADER.pack(
+                MAGIC, FORMAT_VERSION, RECORD.size, len(records) // RECORD.size,
+                len(strings), len(lineups), snapshot_id, liked_version,
+            )
+        )
+        f.write(struct.pack(f"<{len(string_offsets)}I", *string_offsets))
+        f.write(struct.pack(f"<{len(lineup_offsets)}I", *lineup_offsets))
+        f.write(struct.pack(f"<{len(lineup_entries)}I", *lineup_entries))
+        f.write(records)
+        f.write(b"".join(encoded))
+    # A mapped file can't be replaced on Windows: lists still mapping the
+    # old one read it into memory and let go of it. Elsewhere they go on
+    # mapping the old file, which stays until they close it.
+    if os.name == "nt":
+        for tracks in list(_open_lists.values()):
+            if tracks.path == os.fspath(path):
+                tracks.detach()
+    os.replace(temporary_path, path)
+
+
+class Mapped_Track_List(Sequence):
+    """The tracks of a track file, read from the mapped file as they are indexed.
+
+    Nothing but the header is read up front: each `tracks[i]` decodes one
+    record and its strings into a Track. Artist line-ups are decoded once
+    each. Raises ValueError for a file that isn't a track file of this
+    format version. `close()` (or leaving a `with` block) unmaps the file;
+    if the file is rewritten on Windows while it is open, the list reads
+    every row into memory first and goes on working from there. The
+    rewrite may come from another thread, so the map is only read under
+    the list's lock.
+    """
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        self._rows = None
+        self._rows_by_id = None
+        self._lock = threading.RLock()
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_header()
+        except ValueError:
+            self.close()
+            raise
+        except struct.error as e:
+            self.close()
+            raise ValueError(f"{self.path} is truncated") from e
+        _open_lists[id(self)] = self
+
+    def _read_header(self):
+        if len(self._map) < HEADER.size:
+            raise ValueError(f"{self.path} is too short to be a track file")
+        (
+            magic, version, record_size, self._count, self._string_count,
+            self._lineup_count, snapshot_id, liked_version,
+        ) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a track file")
+        if version != FORMAT_VERSION or record_size != RECORD.size:
+            raise ValueError(f"{self.path} is track file version {version}, not {FORMAT_VERSION}")
+        self._string_offsets = HEADER.size
+        self._lineup_offsets = self._string_offsets + INDEX.size * (self._string_count + 1)
+        self._lineup_entries = self._lineup_offsets + INDEX.size * (self._lineup_count + 1)
+        self._records = self._lineup_entries + INDEX.size * self._index(
+            self._lineup_offsets, self._lineup_count
+        )
+        self._strings = self._records + RECORD.size * self._count
+        if len(self._map) != self._strings + self._index(self._string_offsets, self._string_count):
+            raise ValueError(f"{self.path} is truncated")
+        self._lineups = {}
+        self.version = (self._string(snapshot_id), self._string(liked_version))
+
+    def _index(self, table: int, position: int) -> int:
+        return INDEX.unpack_from(self._map, table + INDEX.size * position)[0]
+
+    def _string(self, index: int):
+        if index == NO_STRING:
+            return None
+        start = self._strings + self._index(self._string_offsets, index)
+        end = self._strings + self._index(self._string_offsets, index + 1)
+        return self._map[start:end].decode()
+
+    def _lineup(self, index: int) -> tuple:
+        lineup = self._lineups.get(index)
+        if lineup is None:
+            start = self._index(self._lineup_offsets, index)
+            end = self._index(self._lineup_offsets, index + 1)
+            lineup = self._lineups[index] = tuple(
+                self._string(self._index(self._lineup_entries, position))
+                for position in range(start, end)
+            )
+        return lineup
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        with self._lock:
+            return self._item(index)
+
+    def _item(self, index):
+        if self._rows is not None:
+            return self._rows[index]
+        if isinstance(index, slice):
+            return [self._item(i) for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("track index out of range")
+        name, track_id, album, lineup, duration_ms, flags = RECORD.unpack_from(
+            self._map, self._records + RECORD.size * index
+        )
+        return Track(
+            name=self._string(name),
+            artists=self._lineup(lineup),
+            album=self._string(album),
+            duration_ms=duration_ms,
+            is_liked=bool(flags & FLAG_LIKED),
+            id=self._string(track_id),
+        )
+
+    def __iter__(self):
+        # Reading every row: copy the tables out of the map once rather than
+        # reading it row by row, so no row is read from a map being closed.
+        with self._lock:
+            rows = self._rows
+            if rows is None:
+                offsets = struct.unpack_from(
+                    f"<{self._string_count + 1}I", self._map, self._string_offsets
+                )
+                lineup_offsets = struct.unpack_from(
+                    f"<{self._lineup_count + 1}I", self._map, self._lineup_offsets
+                )
+                lineup_entries = struct.unpack_from(
+                    f"<{lineup_offsets[-1]}I", self._map, self._lineup_entries
+                )
+                records = self._map[self._records:self._strings]
+                data = self._map[self._strings:]
+        if rows is not None:
+            yield from rows
+            return
+
+        # Each distinct string is decoded once, however many rows use it.
+        strings = {
+            index: data[start:end].decode()
+            for index, (start, end) in enumerate(zip(offsets, offsets[1:]))
+        }
+        strings[NO_STRING] = None
+        albums = {}
+        lineups = {}
+
+        def album_of(index):
+            album = albums.get(index)
+            if album is None:
+                album = albums[index] = sys.intern(strings[index])
+            return album
+
+        def lineup_of(index):
+            lineup = lineups.get(index)
+            if lineup is None:
+                lineup = lineups[index] = intern_artists(
+                    strings[entry]
+                    for entry in lineup_entries[lineup_offsets[index]:lineup_offsets[index + 1]]
+                )
+            return lineup
+
+        track = Track.from_shared
+        for name, track_id, album, lineup, duration_ms, flags in RECORD.iter_unpack(records):
+            yield track(
+                strings[name],
+                lineups.get(lineup) or lineup_of(lineup),
+                albums.get(album) or album_of(album),
+                duration_ms,
+                bool(flags & FLAG_LIKED),
+                strings[track_id],
+            )
+
+    def rows_by_id(self) -> dict:
+        """The row of each track id (its first, if repeated), read from the id fields alone."""
+        with self._lock:
+            if self._rows_by_id is None:
+                if self._rows is not None:
+                    ids = [track["id"] for track in self._rows]
+                else:
+                    ids = [
+                        self._string(record[1])
+                        for record in RECORD.iter_unpack(self._map[self._records:self._strings])
+                    ]
+                self._rows_by_id = {}
+                for row, track_id in enumerate(ids):
+                    self._rows_by_id.setdefault(track_id, row)
+            return self._rows_by_id
+
+    def __eq__(self, other):
+        if isinstance(other, Mapped_Track_List) and (self.path, self.version) == (
+            other.path, other.version
+        ):
+            return True
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Mapped_Track_List({self.path!r}, {self._count} tracks)"
+
+    def detach(self) -> None:
+        """Read every row into memory and unmap the file."""
+        with self._lock:
+            if not self._map.closed:
+                self._rows = list(self)
+                self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            _open_lists.pop(id(self), None)
+            self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_track_list(path):
+    """The tracks cached at `path`, mapped from a track file or read from an old JSON `.cache` file."""
+    with open(path, "rb") as f:
+        is_track_file = f.read(len(MAGIC)) == MAGIC
+    if is_track_file:
+        return Mapped_Track_List(path)
+    with open(path, "r") as f:
+        tracks = json.load(f)
+    return [
+        Track(
+            name=track["name"],
+            artists=track.get("artists", []),
+            album=track.get("album", ""),
+            duration_ms=track.get("duration_ms", 0),
+            is_liked=track.get("is_liked", False),
+            id=track.get("id"),
+        )
+        for track in tracks
+    ]
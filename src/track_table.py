@@ -0,0 +1,351 @@
+from typing import Callable, Sequence
+
+from rich.cells import cell_len, set_cell_size
+from rich.segment import Segment
+from rich.style import Style
+from textual import events
+from textual.binding import Binding
+from textual.geometry import Size
+from textual.message import Message
+from textual.reactive import reactive
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+
+from metrics import metrics
+
+# Rows formatted beyond each edge of the visible window, so short scrolls
+# don't have to format anything.
+OVERSCAN = 20
+# Rows sampled when sizing an auto-width column.
+AUTO_WIDTH_SAMPLE = 100
+# Seconds a resize has to settle before the columns are laid out again, and
+# the most layouts remembered per set of rows.
+LAYOUT_DEBOUNCE = 0.1
+LAYOUT_CACHE_SIZE = 64
+
+
+class Column:
+    """A track table column: a header label and a function that formats one cell.
+
+    Its width is the label's, unless it is `auto_width` (fitted to a sample
+    of rows), `numbered` (as wide as the largest row number) or `flexible`
+    (an equal share of the width the other columns leave).
+    """
+
+    def __init__(
+        self,
+        label: str,
+        format_cell: Callable[[int, object], str],
+        auto_width: bool = False,
+        flexible: bool = False,
+        numbered: bool = False,
+    ):
+        self.label = label
+        self.format_cell = format_cell
+        self.auto_width = auto_width
+        self.flexible = flexible
+        self.numbered = numbered
+        self.width = cell_len(label)
+
+
+class Track_Table(ScrollView, can_focus=True):
+    """A virtualized, row-cursor table over an in-memory sequence of rows.
+
+    Unlike DataTable, rows are never copied into the widget: `rows` is the
+    caller's own sequence (it may keep growing while pages stream in), and
+    cells are formatted only when their row is inside the visible window plus
+    OVERSCAN rows either side.
+
+    Column widths are laid out for the table's width and row count, and
+    cached per (width, row count, columns) until the rows or columns are
+    replaced. Resizes are debounced by `layout_debounce`, and the table is
+    only repainted when a layout actually changes a width.
+    """
+
+    BINDINGS = [
+        Binding("enter", "select_cursor", "Select", show=False),
+        Binding("up", "cursor_up", "Cursor up", show=False),
+        Binding("down", "cursor_down", "Cursor down", show=False),
+        Binding("pageup", "page_up", "Page up", show=False),
+        Binding("pagedown", "page_down", "Page down", show=False),
+        Binding("home", "scroll_top", "Top", show=False),
+        Binding("end", "scroll_bottom", "Bottom", show=False),
+    ]
+
+    COMPONENT_CLASSES = {
+        "track-table--header",
+        "track-table--cursor",
+    }
+
+    DEFAULT_CSS = """
+    Track_Table {
+        background: $surface;
+        color: $text;
+        overflow-x: hidden;
+    }
+    Track_Table > .track-table--header {
+        text-style: bold;
+        background: $primary;
+        color: $text;
+    }
+    Track_Table > .track-table--cursor {
+        background: $secondary;
+        color: $text;
+    }
+    """
+
+    cursor_row = reactive(0, repaint=False, always_update=True)
+    cell_padding = 1
+    layout_debounce = LAYOUT_DEBOUNCE
+
+    class RowHighlighted(Message):
+        """Sent when the cursor moves to a new row."""
+
+        def __init__(self, table: "Track_Table", cursor_row: int) -> None:
+            self.table = table
+            self.cursor_row = cursor_row
+            super().__init__()
+
+        @property
+        def control(self) -> "Track_Table":
+            return self.table
+
+    class RowSelected(Message):
+        """Sent when a row is selected with enter or a click."""
+
+        def __init__(self, table: "Track_Table", cursor_row: int) -> None:
+            self.table = table
+            self.cursor_row = cursor_row
+            super().__init__()
+
+        @property
+        def control(self) -> "Track_Table":
+            return self.table
+
+    def __init__(self, id=None):
+        super().__init__(id=id)
+        self.columns: list[Column] = []
+        self.rows: Sequence = []
+        self._formatted_rows: dict[int, tuple[str, ...]] = {}
+        self._layout_cache: dict[tuple, tuple[int, ...]] = {}
+        self._layout_timer = None
+        self._laid_out_width = None
+        self.layout_stats = {"resizes": 0, "layouts": 0, "computed": 0, "applied": 0}
+
+    @property
+    def row_count(self) -> int:
+        return len(self.rows)
+
+    def set_columns(self, columns: list[Column]) -> None:
+        self.columns = columns
+        self._formatted_rows.clear()
+        self._layout_cache.clear()
+        self.refresh_rows()
+
+    def set_rows(self, rows: Sequence) -> None:
+        """Show `rows`, which stay owned (and may be extended) by the caller."""
+        self.rows = rows
+        self._formatted_rows.clear()
+        self._layout_cache.clear()
+        self.cursor_row = 0
+        self.scroll_to(y=0, animate=False)
+        self.refresh_rows()
+
+    def replace_rows(self, rows: Sequence) -> None:
+        """Swap in an updated version of the rows, keeping the cursor and scroll position."""
+        self.rows = rows
+        self._formatted_rows.clear()
+        self._layout_cache.clear()
+        self.refresh_rows()
+        if self.cursor_row >= self.row_count:
+            self.move_cursor(self.row_count - 1)
+
+    def clear(self) -> None:
+        self.columns = []
+        self.set_rows([])
+
+    def refresh_rows(self) -> None:
+        """Re-read `rows` after rows were appended."""
+        self.layout_columns()
+        self.virtual_size = Size(self._total_width(), self.row_count + 1)
+        self.refresh()
+
+    def on_resize(self, event: events.Resize) -> None:
+        self.layout_stats["resizes"] += 1
+        if self._laid_out_width is None:
+            # The first real size: lay out now, so the first paint is right.
+            self.layout_columns()
+            return
+        if self._layout_timer is not None:
+            self._layout_timer.stop()
+        self._layout_timer = self.set_timer(self.layout_debounce, self.layout_columns)
+
+    @metrics.timed("ui_seconds", path="column_layout")
+    def layout_columns(self) -> bool:
+        """Fit the columns to the table's width; returns True if any width changed."""
+        width = self.container_size.width
+        if not width or not self.columns:
+            return False
+        self._laid_out_width = width
+        self.layout_stats["layouts"] += 1
+        widths = self.column_widths(width)
+        if widths == tuple(column.width for column in self.columns):
+            return False
+        for column, column_width in zip(self.columns, widths):
+            column.width = column_width
+        self.layout_stats["applied"] += 1
+        self.virtual_size = Size(self._total_width(), self.row_count + 1)
+        self.refresh()
+        return True
+
+    def column_widths(self, width: int) -> tuple[int, ...]:
+        """The column widths for `width`, computed once per width, row count and columns."""
+        key = (width, self.row_count, tuple(column.label for column in self.columns))
+        widths = self._layout_cache.get(key)
+        if widths is None:
+            if len(self._layout_cache) >= LAYOUT_CACHE_SIZE:
+                self._layout_cache.clear()
+            widths = self._layout_cache[key] = self.compute_column_widths(width)
+        return widths
+
+    def compute_column_widths(self, width: int) -> tuple[int, ...]:
+        self.layout_stats["computed"] += 1
+        widths = []
+        for column in self.columns:
+            if column.numbered:
+                widths.append(max(cell_len(column.label), len(str(self.row_count))))
+            elif column.auto_width:
+                widths.append(self.auto_column_width(column))
+            else:
+                widths.append(cell_len(column.label))
+        flexible = [column.flexible for column in self.columns]
+        if any(flexible):
+            taken = sum(
+                column_width for column_width, is_flexible in zip(widths, flexible)
+                if not is_flexible
+            ) + 2 * self.cell_padding * len(self.columns)
+            share = max(1, (width - taken) // flexible.count(True))
+            widths = [share if is_flexible else w for w, is_flexible in zip(widths, flexible)]
+        return tuple(widths)
+
+    def auto_column_width(self, column: Column) -> int:
+        sample = range(min(self.row_count, AUTO_WIDTH_SAMPLE))
+        return max(
+            [cell_len(column.label)]
+            + [cell_len(column.format_cell(i, self.rows[i])) for i in sample]
+        )
+
+    def _total_width(self) -> int:
+        return sum(column.width + 2 * self.cell_padding for column in self.columns)
+
+    def _visible_rows(self) -> range:
+        """Row indices currently on screen (the header takes the first line)."""
+        top = int(self.scroll_y)
+        height = max(0, self.scrollable_content_region.height - 1)
+        return range(top, min(self.row_count, top + height))
+
+    def _format_row(self, index: int) -> tuple[str, ...]:
+        cells = self._formatted_rows.get(index)
+        if cells is None:
+            row = self.rows[index]
+            cells = tuple(column.format_cell(index, row) for column in self.columns)
+            self._formatted_rows[index] = cells
+        return cells
+
+    def _prune_formatted_rows(self) -> None:
+        visible = self._visible_rows()
+        keep = range(visible.start - OVERSCAN, visible.stop + OVERSCAN)
+        if len(self._formatted_rows) > len(keep):
+            self._formatted_rows = {
+                index: cells
+                for index, cells in self._formatted_rows.items()
+                if index in keep
+            }
+        for index in keep:
+            if 0 <= index < self.row_count:
+                self._format_row(index)
+
+    def render_lines(self, crop):
+        self._prune_formatted_rows()
+        return super().render_lines(crop)
+
+    def _render_cells(self, cells, style: Style, row_index: int) -> Strip:
+        padding = " " * self.cell_padding
+        meta = Style.from_meta({"row": row_index})
+        segments = [
+            Segment(
+                f"{padding}{set_cell_size(cell, column.width)}{padding}",
+                style + meta,
+            )
+            for column, cell in zip(self.columns, cells)
+        ]
+        width = self.container_size.width
+        return Strip(segments).extend_cell_length(width, style).crop(0, width)
+
+    def render_line(self, y: int) -> Strip:
+        base_style = self.rich_style
+        if y == 0:
+            header_style = base_style + self.get_component_rich_style(
+                "track-table--header"
+            )
+            return self._render_cells(
+                [column.label for column in self.columns], header_style, -1
+            )
+
+        row_index = y - 1 + int(self.scroll_y)
+        if row_index >= self.row_count:
+            return Strip.blank(self.scrollable_content_region.width, base_style)
+
+        style = base_style
+        if row_index == self.cursor_row:
+            style = base_style + self.get_component_rich_style("track-table--cursor")
+        return self._render_cells(self._format_row(row_index), style, row_index)
+
+    def watch_cursor_row(self, old_row: int, new_row: int) -> None:
+        self.refresh_line(old_row + 1)
+        self.refresh_line(new_row + 1)
+        self._scroll_cursor_into_view()
+        if 0 <= new_row < self.row_count:
+            self.post_message(self.RowHighlighted(self, new_row))
+
+    def move_cursor(self, row: int) -> None:
+        if self.row_count:
+            self.cursor_row = max(0, min(row, self.row_count - 1))
+
+    def _scroll_cursor_into_view(self) -> None:
+        visible_height = max(1, self.scrollable_content_region.height - 1)
+        top = int(self.scroll_y)
+        if self.cursor_row < top:
+            self.scroll_to(y=self.cursor_row, animate=False)
+        elif self.cursor_row >= top + visible_height:
+            self.scroll_to(y=self.cursor_row - visible_height + 1, animate=False)
+
+    def on_click(self, event: events.Click) -> None:
+        row_index = event.style.meta.get("row")
+        if row_index is None or row_index < 0 or row_index >= self.row_count:
+            return
+        self.cursor_row = row_index
+        self.post_message(self.RowSelected(self, row_index))
+        event.stop()
+
+    def action_select_cursor(self) -> None:
+        if self.row_count:
+            self.post_message(self.RowSelected(self, self.cursor_row))
+
+    def action_cursor_up(self) -> None:
+        self.move_cursor(self.cursor_row - 1)
+
+    def action_cursor_down(self) -> None:
+        self.move_cursor(self.cursor_row + 1)
+
+    def action_page_up(self) -> None:
+        self.move_cursor(self.cursor_row - (self.scrollable_content_region.height - 1))
+
+    def action_page_down(self) -> None:
+        self.move_cursor(self.cursor_row + (self.scrollable_content_region.height - 1))
+
+    def action_scroll_top(self) -> None:
+        self.move_cursor(0)
+
+    def action_scroll_bottom(self) -> None:
+        self.move_cursor(self.row_count - 1)